@@ -7,20 +7,21 @@ everything required to parse command line arguments and run commands is containe
 """
 
 import argparse
+import datetime
 import os
 import pprint
 import sys
-import json
 import random
+import time
 
 from termcolor import colored
 
-from .surface import Surface, SurfaceUserThread, SeekUsersThread
-from .frame import Frame
-from .user import User
-from .utilities import command_header, send_frame_users
+from .surface import Surface, SurfaceUserThread, SeekUsersThread, Host, HostSeekThread
+from .user import User, SQLiteStorage, migrate_to_sqlite, PUBLIC_KEY_POLICIES
+from .utilities import command_header
 from .utilities.logging import surface_logger
-from .message import Message
+from .message import Message, print_progress
+from .frame import GossipPolicy, PulseSummary
 
 
 def init_user(args: argparse.Namespace) -> bool:
@@ -43,7 +44,7 @@ def init_user(args: argparse.Namespace) -> bool:
     if user.exists:
         print(colored("this user already exists: {}".format(args.username), "red"))
     else:
-        user.init_directory_structure()
+        user.init_directory_structure(storage=args.storage)
         user.init_rsa()
         print(colored("created user: {}".format(args.username), "green"))
 
@@ -127,25 +128,62 @@ def request_public_key(args: argparse.Namespace) -> bool:
         usually True
     """
 
+    # if we already have it we can skip asking them safely. otherwise they now have a
+    # public_key_request.... they will answer it when they want, and we'll get a
+    # public_key_response
     user = User(args.username)
-    public_key_text = user.get_contact_public_key(args.user2)
-
-    # check to see if we don't already have it... if we do we can skip
-    # asking them safely
-    if public_key_text is None:
-        frame = Frame(
-            action="request_public_key",
-            payload=dict(
-                user2=args.username,
-                public_key=user.public_key_text
-            )
-        )
+    response = user.request_public_key(args.user2)
+    pprint.pprint(response, indent=4)
+
+    return True
+
+
+def print_public_key_results(title: str, results: dict) -> None:
+    """ print what happened with each contact, and how many of them it worked for. """
+
+    for username, result in sorted(results.items()):
+        if result.get('skipped') is True:
+            print(colored("{:<32} already have it".format(username), "cyan"))
+        elif result.get('success') is True:
+            print(colored("{:<32} ok".format(username), "green"))
+        else:
+            print(colored("{:<32} {}".format(username, result.get('error')), "red"))
+
+    succeeded = len([r for r in results.values() if r.get('success') is True])
+    print(colored("{}: {} of {} ok".format(title, succeeded, len(results)), "green"))
+
+
+def exchange_public_keys(args: argparse.Namespace) -> bool:
+    """
+    exchange public keys with many contacts in one go.
+
+    asks everyone in args.user2 (or, with args.all, everyone in the ipcache we don't have a
+    public key for) for their public key, then processes the requests and responses that are
+    waiting, all of them concurrently.
+
+    Parameters
+    ----------
+    args : argparse.Namespace
+        the arguments
 
-        response = send_frame_users(frame, user, args.user2)
-        pprint.pprint(response, indent=4)
+    Returns
+    -------
+    bool
+        usually True
+    """
+
+    user = User(args.username)
+
+    users = list(args.user2 or [])
+    if args.all is True:
+        users = users + [u for u in user.ipcache.keys() if user.get_contact_public_key(u) is None]
+
+    st = time.time()
+    print_public_key_results("requested", user.request_public_keys(users, workers=args.workers))
+    print_public_key_results("responses", user.process_public_key_responses(args.accept, workers=args.workers))
+    print_public_key_results("requests", user.process_public_key_requests(args.accept, workers=args.workers))
+    print(colored("done in {:.2f}s".format(time.time() - st), "green"))
 
-        # after that, they have a public_key_request.... they will answer
-        # it when they want, and we'll get a public_key_response
     return True
 
 
@@ -164,16 +202,14 @@ def surface_user(args: argparse.Namespace) -> bool:
         usually True
     """
 
-    surface = Surface(args.username, args.port)
+    surface = Surface(args.username, args.port, accept_public_keys=args.accept_public_keys)
     surface.start()
 
-    user = User(args.username)
-    path = os.path.join(user.path, "current_ip_port.json")
-    with open(path, "w+") as f:
-        f.write(json.dumps(dict(
-            ip=surface.serversocket.getsockname()[0],
-            port=surface.port)
-        ))
+    user = surface.user
+    user.set_current_ip_port(surface.serversocket.getsockname()[0], surface.port)
+    if args.seek_fanout is not None:
+        user.seek_gossip = GossipPolicy(fanout=args.seek_fanout)
+    user.seek_dht = args.dht
 
     print(colored("surfaced on {}:{}".format(surface.serversocket.getsockname()[0], surface.port), "green"))
     surface_logger.info("{} surfaced on {}:{}".format(
@@ -195,6 +231,66 @@ def surface_user(args: argparse.Namespace) -> bool:
     return True
 
 
+def host_users(args: argparse.Namespace) -> bool:
+    """
+    expose one surface for many users at once (ie: args.username, and args.users or everyone in ~/pckr/).
+
+    Parameters
+    ----------
+    args : argparse.Namespace
+        the arguments
+
+    Returns
+    -------
+    bool
+        usually True
+    """
+
+    usernames = [args.username] + (args.users or [])
+    if args.all is True:
+        root = os.path.dirname(User(args.username).path)
+        usernames = usernames + sorted(
+            u for u in os.listdir(root) if User(u).exists
+        )
+
+    users = []
+    for username in dict.fromkeys(usernames):
+        user = User(username)
+        if user.exists is False:
+            print(colored("user {} does not exist, skipping them".format(username), "yellow"))
+            continue
+        users.append(user)
+
+    host = Host(
+        [user.username for user in users],
+        args.port,
+        ports=args.ports,
+        accept_public_keys=args.accept_public_keys
+    )
+    host.start()
+    for user in host.users.values():
+        if args.seek_fanout is not None:
+            user.seek_gossip = GossipPolicy(fanout=args.seek_fanout)
+        user.seek_dht = args.dht
+    host.surface()
+
+    for listener in host.listeners:
+        print(colored("listening on {}:{}".format(listener.serversocket.getsockname()[0], listener.port), "green"))
+    print(colored("hosting {} users".format(len(host.users)), "green"))
+    surface_logger.info("hosting {} on {}".format(
+        ", ".join(user.username for user in host.users.values()),
+        ", ".join(str(listener.port) for listener in host.listeners))
+    )
+
+    seek_users_thread = HostSeekThread(list(host.users.values()))
+    seek_users_thread.start()
+
+    seek_users_thread.join()
+    host.join()
+
+    return True
+
+
 def add_ipcache(args: argparse.Namespace)-> bool:
     """
     add args.user2 to your ipcache at args.ip and args.port.
@@ -217,6 +313,35 @@ def add_ipcache(args: argparse.Namespace)-> bool:
     return True
 
 
+def migrate_storage(args: argparse.Namespace) -> bool:
+    """
+    move args.username's records from the directory layout into a sqlite database.
+
+    the files are left where they are. stop the user's surface before running this.
+
+    Parameters
+    ----------
+    args : argparse.Namespace
+        the arguments
+
+    Returns
+    -------
+    bool
+        usually True
+    """
+
+    user = User(args.username)
+    if type(user.storage) == SQLiteStorage:
+        print(colored("{} is already on sqlite".format(args.username), "red"))
+        return False
+
+    counts = migrate_to_sqlite(user.path)
+    pprint.pprint(counts)
+    print(colored("migrated {} to sqlite".format(args.username), "green"))
+
+    return True
+
+
 def remove_ipcache(args: argparse.Namespace)-> bool:
     """
     remove args.user2 from your ipcache.
@@ -243,6 +368,9 @@ def seek_user(args: argparse.Namespace)-> bool:
     """
     seek args.user2 by sending out seek_user frames to your network.
 
+    with args.fanout they are gossiped instead of flooded, see GossipPolicy. with args.dht
+    user2 is looked up in the dht first, and sent one frame straight to them if they're found.
+
     Parameters
     ----------
     args : argparse.Namespace
@@ -254,8 +382,17 @@ def seek_user(args: argparse.Namespace)-> bool:
         usually True
     """
 
+    gossip = None
+    if args.fanout is not None:
+        gossip = GossipPolicy(
+            fanout=args.fanout,
+            ttl=args.ttl,
+            probability=args.probability,
+            select=args.select
+        )
+
     user = User(args.username)
-    user.seek_user(args.user2)
+    user.seek_user(args.user2, gossip=gossip, dht=args.dht)
 
     return True
 
@@ -285,6 +422,15 @@ def send_message(args: argparse.Namespace) -> bool:
     """
     send a message from username to user2.
 
+    --user2 can be given more than once, the file is then only encrypted once
+    and streamed to all of them at the same time. with --swarm each chunk only
+    goes to one of them, and they fetch the rest from each other.
+
+    --filename can also be a directory. everything under it is packed into one
+    stream, so the whole directory costs one key and one term.
+
+    progress is printed as it goes, and the summary is stored in sent_messages.
+
     Parameters
     ----------
     args : argparse.Namespace
@@ -300,7 +446,9 @@ def send_message(args: argparse.Namespace) -> bool:
         User(args.username),
         args.filename,
         args.mime_type,
-        args.user2
+        args.user2,
+        swarm=args.swarm,
+        on_progress=print_progress
     ).send()
 
 
@@ -320,9 +468,7 @@ def process_public_key_responses(args: argparse.Namespace) -> bool:
     """
 
     user = User(args.username)
-    for response in user.public_key_responses:
-        if user.process_public_key_response(response):
-            user.remove_public_key_response(response)
+    print_public_key_results("responses", user.process_public_key_responses(args.accept, workers=args.workers))
 
     return True
 
@@ -342,9 +488,7 @@ def process_public_key_requests(args: argparse.Namespace) -> bool:
         usually True
     """
     user = User(args.username)
-    for request in user.public_key_requests:
-        if user.process_public_key_request(request):
-            user.remove_public_key_request(request)
+    print_public_key_results("requests", user.process_public_key_requests(args.accept, workers=args.workers))
 
     return True
 
@@ -353,6 +497,9 @@ def pulse_network(args: argparse.Namespace) -> bool:
     """
     pulse the network (send out a tracer frame).
 
+    with args.measure, the pulse goes args.max_hops hops and comes back with how big the
+    network is, how far away everyone is, and how quick the links are.
+
     Parameters
     ----------
     args : argparse.Namespace
@@ -367,15 +514,43 @@ def pulse_network(args: argparse.Namespace) -> bool:
     user = User(args.username)
     assert user.exists
 
-    user.pulse_network()
+    if args.measure is False and args.max_hops is None:
+        user.pulse_network()
+        return True
+
+    summary = user.pulse_network(max_hops=args.max_hops or PulseSummary.max_hops)
+    print_pulse_summary(summary.estimate())
 
     return True
 
 
+def print_pulse_summary(estimate: dict) -> None:
+    """ print what a measuring pulse found. """
+
+    print(colored("users reached: ~{}".format(estimate['users']), "green"))
+    for h, n in enumerate(estimate['hops']):
+        print(colored("{:>4} hops: ~{:<8} within: ~{}".format(h, n, estimate['within'][h]), "cyan"))
+    print(colored("eccentricity: {} hops, so the diameter is {} to {} hops".format(
+        estimate['eccentricity'], estimate['diameter'][0], estimate['diameter'][1]
+    ), "green"))
+    print(colored("{:.0f}% are within {} hops".format(
+        100 * PulseSummary.effective_fraction, estimate['effective_hops']
+    ), "green"))
+    if estimate['truncated']:
+        print(colored("users were reached at max_hops, there may be more past them", "yellow"))
+    if estimate['links'] > 0:
+        print(colored("rtts for ~{} links: median <= {}s, 90th percentile <= {}s".format(
+            estimate['links'], estimate['rtt']['median'], estimate['rtt']['p90']
+        ), "green"))
+    print(colored("frames: {}".format(estimate['frames']), "green"))
+
+
 def check_net_topo(args: argparse.Namespace) -> bool:
     """
     check the topology of the user's network.
 
+    args.capacity is how many users the first layer of the digest the check carries is sized for.
+
     Parameters
     ----------
     args : argparse.Namespace
@@ -388,7 +563,7 @@ def check_net_topo(args: argparse.Namespace) -> bool:
     """
 
     user = User(args.username)
-    user.check_net_topo()
+    user.check_net_topo(capacity=args.capacity)
 
     return True
 
@@ -439,7 +614,10 @@ def ipcache(args: argparse.Namespace) -> bool:
 
 def messages(args: argparse.Namespace) -> bool:
     """
-    print out the user messages.
+    print out the user messages, newest first, a page at a time.
+
+    they come from the message index, and can be narrowed down with --sender,
+    --filename (any part of it) and --days (how far back to go).
 
     Parameters
     ----------
@@ -453,8 +631,49 @@ def messages(args: argparse.Namespace) -> bool:
     """
 
     user = User(args.username)
-    for message in user.messages:
-        print(message)
+
+    filters = dict(sender=args.sender, filename=args.filename)
+    if args.days is not None:
+        filters.update(since=time.time() - args.days * 24 * 60 * 60)
+
+    total = user.count_messages(**filters)
+    offset = (args.page - 1) * args.per_page
+    page = user.list_messages(offset=offset, limit=args.per_page, **filters)
+
+    for message in page:
+        print("{} {} {} from {}, {} bytes in {} chunks: {}".format(
+            datetime.datetime.fromtimestamp(message['completed_at']).strftime("%Y-%m-%d %H:%M:%S"),
+            message['message_id'],
+            message['filename'],
+            message['sender'] or '?',
+            message['size'],
+            message['chunks'] if message['chunks'] is not None else '?',
+            message['path']
+        ))
+
+    print(colored("{}-{} of {}".format(min(offset + 1, total), min(offset + len(page), total), total), "green"))
+
+    return True
+
+
+def rebuild_message_index(args: argparse.Namespace) -> bool:
+    """
+    recreate the message index from what is on disk under messages/.
+
+    Parameters
+    ----------
+    args : argparse.Namespace
+        the arguments
+
+    Returns
+    -------
+    bool
+        usually True
+    """
+
+    user = User(args.username)
+    count = user.rebuild_message_index()
+    print(colored("indexed {} messages".format(count), "green"))
 
     return True
 
@@ -494,21 +713,25 @@ def massage_args(argparser: argparse.ArgumentParser) -> argparse.Namespace:
 COMMANDS = [
     'init_user',
     'surface_user',
+    'host_users',
     'seek_user',
     'ping_user',
     'send_message',
     'challenge_user_pk',
     'challenge_user_has_pk',
     'request_public_key',
+    'exchange_public_keys',
     'process_public_key_requests',
     'process_public_key_responses',
     'add_ipcache',
     'remove_ipcache',
+    'migrate_storage',
     'pulse_network',
     'check_net_topo',
     'public_keys',
     'ipcache',
     'messages',
+    'rebuild_message_index',
     'current_ip'
 ]
 
@@ -517,21 +740,25 @@ COMMANDS = [
 COMMAND_ALIASES = dict(
     iu='init_user',
     surface='surface_user',
+    host='host_users',
     seek='seek_user',
     pu='ping_user',
     sm='send_message',
     cupk='challenge_user_pk',
     cuhpk='challenge_user_has_pk',
     rpk='request_public_key',
+    xpk='exchange_public_keys',
     ppk_req='process_public_key_requests',
     ppk_resp='process_public_key_responses',
     aip='add_ipcache',
     rip='remove_ipcache',
+    mst='migrate_storage',
     pn='pulse_network',
     cnt='check_net_topo',
     pks='public_keys',
     ipc='ipcache',
     ms='messages',
+    rmi='rebuild_message_index',
     cip='cip'
 )
 
@@ -569,21 +796,40 @@ def main() -> None:
     # each command has special arguments that we need to add to the argparser. parse the command name
     # and mark up the arguments as required
     if command == 'init_user':
+        argparser.add_argument("--storage", required=False, choices=['directory', 'sqlite'], default='directory')
         check_user_exists = False
 
     elif command == 'seek_user':
         argparser.add_argument("--user2", required=True)
+        argparser.add_argument("--fanout", type=int, required=False, default=None)
+        argparser.add_argument("--ttl", type=int, required=False, default=None)
+        argparser.add_argument("--probability", type=float, required=False, default=None)
+        argparser.add_argument("--select", required=False, choices=GossipPolicy.SELECTIONS, default=None)
+        argparser.add_argument("--dht", required=False, action='store_true', default=False)
 
     elif command == 'surface_user':
         argparser.add_argument("--port", type=int, required=False, default=random.randint(8000, 9000))
+        argparser.add_argument("--accept_public_keys", required=False, choices=PUBLIC_KEY_POLICIES, default='none')
+        argparser.add_argument("--seek_fanout", type=int, required=False, default=None)
+        argparser.add_argument("--dht", required=False, action='store_true', default=False)
+
+    elif command == 'host_users':
+        argparser.add_argument("--users", required=False, nargs='*', default=[])
+        argparser.add_argument("--all", required=False, action='store_true', default=False)
+        argparser.add_argument("--port", type=int, required=False, default=random.randint(8000, 9000))
+        argparser.add_argument("--ports", type=int, required=False, default=1)
+        argparser.add_argument("--accept_public_keys", required=False, choices=PUBLIC_KEY_POLICIES, default='none')
+        argparser.add_argument("--seek_fanout", type=int, required=False, default=None)
+        argparser.add_argument("--dht", required=False, action='store_true', default=False)
 
     elif command == 'ping_user':
         argparser.add_argument("--user2", required=True)
 
     elif command == 'send_message':
-        argparser.add_argument("--user2", required=True)
+        argparser.add_argument("--user2", required=True, action='append')
         argparser.add_argument("--filename", required=True)
         argparser.add_argument("--mime_type", required=False, default='image/png')
+        argparser.add_argument("--swarm", required=False, action='store_true', default=False)
 
     elif command == 'challenge_user_pk':
         argparser.add_argument("--user2", required=True)
@@ -594,11 +840,19 @@ def main() -> None:
     elif command == 'request_public_key':
         argparser.add_argument("--user2", required=True)
 
+    elif command == 'exchange_public_keys':
+        argparser.add_argument("--user2", required=False, action='append')
+        argparser.add_argument("--all", required=False, action='store_true', default=False)
+        argparser.add_argument("--accept", required=False, choices=PUBLIC_KEY_POLICIES, default='contacts')
+        argparser.add_argument("--workers", type=int, required=False, default=16)
+
     elif command == 'process_public_key_requests':
-        pass
+        argparser.add_argument("--accept", required=False, choices=PUBLIC_KEY_POLICIES, default='all')
+        argparser.add_argument("--workers", type=int, required=False, default=16)
 
     elif command == 'process_public_key_responses':
-        pass
+        argparser.add_argument("--accept", required=False, choices=PUBLIC_KEY_POLICIES, default='all')
+        argparser.add_argument("--workers", type=int, required=False, default=16)
 
     elif command == 'add_ipcache':
         argparser.add_argument("--user2", required=True)
@@ -608,11 +862,15 @@ def main() -> None:
     elif command == 'remove_ipcache':
         argparser.add_argument("--user2", required=True)
 
-    elif command == 'pulse_network':
+    elif command == 'migrate_storage':
         pass
 
+    elif command == 'pulse_network':
+        argparser.add_argument("--measure", action='store_true', default=False)
+        argparser.add_argument("--max_hops", type=int, required=False, default=None)
+
     elif command == 'check_net_topo':
-        pass
+        argparser.add_argument("--capacity", type=int, required=False, default=None)
 
     elif command == 'public_keys':
         pass
@@ -621,6 +879,13 @@ def main() -> None:
         pass
 
     elif command == 'messages':
+        argparser.add_argument("--page", type=int, required=False, default=1)
+        argparser.add_argument("--per_page", type=int, required=False, default=20)
+        argparser.add_argument("--sender", required=False, default=None)
+        argparser.add_argument("--filename", required=False, default=None)
+        argparser.add_argument("--days", type=float, required=False, default=None)
+
+    elif command == 'rebuild_message_index':
         pass
 
     else:
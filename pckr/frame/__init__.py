@@ -1,5 +1,19 @@
 """ __init__.py for this module. """
 
 from .frame import Frame
+from .bloom import BloomFilter
+from .custody import CustodyChain
+from .gossip import GossipPolicy
+from .duplicates import DuplicateFilter
+from .topology import TopologyDigest
+from .sketch import DistinctCounter
+from .pulse import PulseSummary
 
 assert Frame
+assert BloomFilter
+assert CustodyChain
+assert GossipPolicy
+assert DuplicateFilter
+assert TopologyDigest
+assert DistinctCounter
+assert PulseSummary
@@ -0,0 +1,117 @@
+"""
+
+this file contains the bloom filter of hashed ids that frames carry.
+
+a bloom filter is a fixed number of bits, with a few of them set for every id that is
+added to it. checking an id is a few bit lookups, and it is the same size however many ids
+are in it. the price is that it can say an id is in it when it isn't, how often is set by
+its size, see BloomFilter.for_capacity. custody chains and topology digests are both
+bloom filters of sha256s.
+
+"""
+
+import math
+
+
+class BloomFilter:
+    """ this class is a bloom filter of sha256s, as hex strings. """
+
+    version = 1
+
+    # 1024 bits and 7 hashes: 1 false positive in ~5800 after 50 ids, ~1 in 135 after 100
+    bits = 1024
+    hashes = 7
+
+    # the biggest filter a frame can bring us: 4M bits, a 1MB payload, and no more hashes
+    # per id than a filter that size would ever want
+    max_bits = 1 << 22
+    max_hashes = 32
+
+    def __init__(self, bits: int = None, hashes: int = None, filter: int = 0):
+        if bits is not None:
+            self.bits = bits
+        if hashes is not None:
+            self.hashes = hashes
+        self.filter = filter
+
+    @classmethod
+    def for_capacity(cls, capacity: int, false_positive_rate: float) -> 'BloomFilter':
+        """
+        return an empty filter sized for capacity ids at false_positive_rate.
+
+        Parameters
+        ----------
+        capacity: int
+            how many ids are expected to be added
+
+        false_positive_rate: float
+            how often an id that wasn't added may look like it was, at capacity
+
+        Returns
+        -------
+        BloomFilter
+            the filter
+        """
+
+        bits = int(math.ceil(-capacity * math.log(false_positive_rate) / (math.log(2) ** 2)))
+        bits = max(8, (bits + 7) // 8 * 8)
+        hashes = max(1, int(round(float(bits) / capacity * math.log(2))))
+
+        return cls(bits=bits, hashes=hashes)
+
+    @classmethod
+    def from_payload(cls, value: dict) -> 'BloomFilter':
+        """ return the filter a frame carries. """
+
+        assert value.get('v') == cls.version, "unknown bloom filter version {}".format(value.get('v'))
+
+        bits, hashes, filter = value.get('m'), value.get('k'), value.get('filter')
+        assert type(bits) == int and 0 < bits <= cls.max_bits and bits % 4 == 0, "bad bloom filter size {}".format(bits)
+        assert type(hashes) == int and 0 < hashes <= cls.max_hashes, "bad bloom filter hashes {}".format(hashes)
+        assert type(filter) == str and len(filter) == bits // 4, "bloom filter isn't {} bits".format(bits)
+
+        try:
+            filter = int(filter, 16)
+        except ValueError:
+            raise AssertionError("bloom filter isn't hex")
+
+        return cls(bits=bits, hashes=hashes, filter=filter)
+
+    def to_payload(self) -> dict:
+        """ return the filter as it goes into a frame's payload. """
+
+        return dict(
+            v=self.version,
+            m=self.bits,
+            k=self.hashes,
+            filter="{:0{}x}".format(self.filter, self.bits // 4)
+        )
+
+    def _positions(self, hashed: str) -> list:
+        # the id is already a sha256, so two slices of it are good enough as two
+        # independent hashes, and the rest are combinations of those
+        h1 = int(hashed[0:16], 16)
+        h2 = int(hashed[16:32], 16) | 1
+
+        return [(h1 + i * h2) % self.bits for i in range(self.hashes)]
+
+    def add_hashed(self, hashed: str) -> None:
+        """ add a sha256 to the filter. """
+
+        for position in self._positions(hashed):
+            self.filter = self.filter | (1 << position)
+
+    def __contains__(self, hashed: str) -> bool:
+        filter = self.filter
+        return all((filter >> position) & 1 for position in self._positions(hashed))
+
+    def false_positive_rate(self) -> float:
+        """ return how often an id that wasn't added looks like it was, going by how full the filter is. """
+
+        return (float(bin(self.filter).count('1')) / self.bits) ** self.hashes
+
+    def union(self, other: 'BloomFilter') -> None:
+        """ add everything in other, which has to be the same size, to this filter. """
+
+        assert (self.bits, self.hashes) == (other.bits, other.hashes), "bloom filters are different sizes"
+        self.filter = self.filter | other.filter
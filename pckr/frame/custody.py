@@ -0,0 +1,74 @@
+"""
+
+this file contains the custody chain that gossip frames carry.
+
+seek_user, pulse_network and check_net_topo frames remember who they have been through,
+so nobody forwards them to someone who has already seen them. that used to be a list of
+hashed usernames, which grew by 64 characters every hop and was searched one by one for
+every contact of every node along the way. now it's a bloom filter: a fixed number of
+bits, with a few of them set for everyone it has been through. checking someone is a few
+bit lookups, and the frame is the same size on its last hop as on its first.
+
+the price is that a bloom filter can say someone has seen a frame when they haven't,
+and then they don't get it from us. how often that happens is set by the size of the
+filter, see BloomFilter.for_capacity, and scripts/custody_simulation.py shows what it
+does to how far frames get. the chain also counts its hops, which is what limits how far
+a frame travels, now that the length of the chain can't.
+
+"""
+
+from ..utilities import str2hashed_hexstr
+from .bloom import BloomFilter
+
+
+class CustodyChain(BloomFilter):
+    """ this class is a bloom filter of the hashed usernames a frame has been through. """
+
+    def __init__(self, bits: int = None, hashes: int = None, hops: int = 0, filter: int = 0):
+        super(CustodyChain, self).__init__(bits=bits, hashes=hashes, filter=filter)
+        self.hops = hops
+
+    @classmethod
+    def from_payload(cls, custody_chain) -> 'CustodyChain':
+        """
+        return the chain a frame carries.
+
+        Parameters
+        ----------
+        custody_chain: dict or list
+            what is in the frame's payload. frames from older clients carry a list of hashed
+            usernames, they are moved into a chain of the default size
+
+        Returns
+        -------
+        CustodyChain
+            the chain
+        """
+
+        if type(custody_chain) == list:
+            chain = cls(hops=len(custody_chain))
+            for hashed_username in custody_chain:
+                chain.add_hashed(hashed_username)
+            return chain
+
+        chain = super(CustodyChain, cls).from_payload(custody_chain)
+        chain.hops = custody_chain.get('hops')
+        assert type(chain.hops) == int and chain.hops >= 0, "bad custody chain hops {}".format(chain.hops)
+        return chain
+
+    def to_payload(self) -> dict:
+        """ return the chain as it goes into a frame's payload. """
+
+        return dict(super(CustodyChain, self).to_payload(), hops=self.hops)
+
+    def add(self, username: str) -> None:
+        """ mark the frame as having been through username, which is another hop. """
+
+        self.add_hashed(str2hashed_hexstr(username))
+        self.hops = self.hops + 1
+
+    def __len__(self) -> int:
+        return self.hops
+
+    def copy(self) -> 'CustodyChain':
+        return CustodyChain(bits=self.bits, hashes=self.hashes, hops=self.hops, filter=self.filter)
@@ -0,0 +1,120 @@
+"""
+
+this file contains the filter that drops gossip frames a user has already seen.
+
+a seek_user, pulse_network or check_net_topo frame reaches a user along many paths, and
+every copy gets a new frame_id when it is passed on. so the user who starts one gives it
+an origin_id as well, which every copy keeps. each user remembers the origin_ids they've
+seen for a while, in memory, and drops any frame with one of those before doing
+anything else with it. there are only so many of them kept, the oldest are forgotten first.
+
+seek_user and measuring pulse_network frames are dropped only if they haven't come fewer
+hops than the last copy the user handled. frames are passed on one contact at a time, so
+a user usually gets one along a long path first, and if the copies along shorter paths
+were dropped a seek_user would stop short of SEEK_HOPS, and a pulse would measure the
+long paths (see PulseSummary). scripts/gossip_simulation.py shows how far seeks get both ways.
+
+"""
+
+from collections import OrderedDict
+import threading
+import time
+
+
+class DuplicateFilter:
+    """ this class remembers which origin_ids one user has seen lately. """
+
+    # how long an origin_id is remembered, in seconds
+    ttl = 300.0
+
+    # how many are remembered at most
+    max_entries = 4096
+
+    _instances = dict()
+    _instances_lock = threading.Lock()
+
+    @classmethod
+    def for_user(cls, username: str) -> 'DuplicateFilter':
+        """
+        return the DuplicateFilter for username, creating it the first time it is asked for.
+
+        Parameters
+        ----------
+        username: str
+            the user
+
+        Returns
+        -------
+        DuplicateFilter
+            the one DuplicateFilter for that user in this process
+        """
+
+        with cls._instances_lock:
+            if username not in cls._instances:
+                cls._instances[username] = cls()
+            return cls._instances[username]
+
+    def __init__(self, ttl: float = None, max_entries: int = None):
+        if ttl is not None:
+            self.ttl = ttl
+        if max_entries is not None:
+            self.max_entries = max_entries
+
+        # origin_id -> when it is forgotten, and the fewest hops it came, oldest first
+        self.seen = OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = dict(checked=0, dropped=0, shorter=0, expired=0, evicted=0)
+
+    def _expire(self, now: float) -> None:
+        while len(self.seen) > 0:
+            origin_id, (expires_at, hops) = next(iter(self.seen.items()))
+            if expires_at > now:
+                return
+            del self.seen[origin_id]
+            self.stats['expired'] = self.stats['expired'] + 1
+
+    def __contains__(self, origin_id: str) -> bool:
+        with self.lock:
+            self._expire(time.time())
+            return origin_id in self.seen
+
+    def check(self, origin_id: str, hops: int = None) -> bool:
+        """
+        remember origin_id, and return whether it was already remembered.
+
+        Parameters
+        ----------
+        origin_id: str
+            the origin_id of the frame
+
+        hops: int
+            how many hops the frame has come. if it and the hops it came the first time are
+            both known, it is only a duplicate if it hasn't come fewer hops than that
+
+        Returns
+        -------
+        bool
+            True if it's a duplicate, and should be dropped
+        """
+
+        now = time.time()
+        with self.lock:
+            self._expire(now)
+            self.stats['checked'] = self.stats['checked'] + 1
+
+            if origin_id in self.seen:
+                expires_at, fewest = self.seen[origin_id]
+                if hops is None or fewest is None or hops >= fewest:
+                    self.stats['dropped'] = self.stats['dropped'] + 1
+                    return True
+
+                self.seen[origin_id] = (expires_at, hops)
+                self.stats['shorter'] = self.stats['shorter'] + 1
+                return False
+
+            self.seen[origin_id] = (now + self.ttl, hops)
+            while len(self.seen) > self.max_entries:
+                self.seen.popitem(last=False)
+                self.stats['evicted'] = self.stats['evicted'] + 1
+
+        return False
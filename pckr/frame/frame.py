@@ -7,14 +7,20 @@ class Frame:
     payload = None
     action = None
 
+    # the hashed username of who the frame is for, so a host serving many users can
+    # hand it to the right one. filled in when the frame is sent
+    to = None
+
     def __init__(
         self,
         payload: dict,
-        action: str
+        action: str,
+        to: str = None
     ) -> None:
         self.frame_id = str(uuid.uuid4())
         self.action = action
         self.payload = payload
+        self.to = to
 
     def __unicode__(self) -> str:
         return str(self)
@@ -0,0 +1,132 @@
+"""
+
+this file contains the gossip policy that seek_user frames can carry.
+
+without one, a seek_user frame is flooded: every user it reaches sends it on to every
+contact it hasn't been through, until it has been through SEEK_HOPS users. in a network
+where everyone has d contacts that is on the order of d ** SEEK_HOPS frames for one seek.
+with a gossip policy every user only sends it on to fanout of their contacts, picked at
+random or the ones that answered pings the quickest, the frame can go ttl hops, and each
+user only passes it on at all with some probability. the user who seeks picks the policy,
+and it travels with the frame so everyone along the way follows the same one.
+
+scripts/gossip_simulation.py compares policies against the flood.
+
+"""
+
+import random
+
+
+class GossipPolicy:
+    """ this class is how far, and how wide, a seek_user frame is passed on. """
+
+    # how many contacts each user passes the frame on to
+    fanout = 3
+
+    # how many users the frame can go through. with everyone passing it on to 3 contacts,
+    # 7 hops still finds almost anyone in a network of a thousand
+    ttl = 7
+
+    # how likely each user is to pass it on at all
+    probability = 1.0
+
+    # how the contacts are picked, 'random' or 'rtt' (the quickest to answer a ping first)
+    select = 'random'
+
+    SELECTIONS = ['random', 'rtt']
+
+    # the most a policy that came in with a frame gets to ask of us. whoever seeks picks
+    # the policy, so without these one frame could make everyone it reaches pass it on to
+    # all of their contacts, as far as it liked
+    max_fanout = 8
+    max_ttl = 10
+
+    def __init__(self, fanout: int = None, ttl: int = None, probability: float = None, select: str = None):
+        if fanout is not None:
+            self.fanout = fanout
+        if ttl is not None:
+            self.ttl = ttl
+        if probability is not None:
+            self.probability = probability
+        if select is not None:
+            self.select = select
+
+        assert self.fanout > 0, "fanout has to be at least 1"
+        assert 0 < self.probability <= 1, "probability has to be in (0, 1]"
+        assert self.select in self.SELECTIONS, "unknown selection '{}'".format(self.select)
+
+    @classmethod
+    def from_payload(cls, gossip: dict) -> 'GossipPolicy':
+        """
+        return the policy a frame carries.
+
+        Parameters
+        ----------
+        gossip: dict
+            what is in the frame's payload, or None if it is to be flooded
+
+        Returns
+        -------
+        GossipPolicy
+            the policy, or None for a flood. fanout and ttl are cut down to max_fanout
+            and max_ttl
+        """
+
+        if gossip is None:
+            return None
+
+        return cls(
+            fanout=min(int(gossip['fanout']), cls.max_fanout),
+            ttl=min(int(gossip['ttl']), cls.max_ttl),
+            probability=float(gossip['probability']),
+            select=gossip['select']
+        )
+
+    def to_payload(self) -> dict:
+        """ return the policy as it goes into a frame's payload. """
+
+        return dict(
+            fanout=self.fanout,
+            ttl=self.ttl,
+            probability=self.probability,
+            select=self.select
+        )
+
+    def passes_on(self, rng=random) -> bool:
+        """ return whether this user passes the frame on at all. """
+
+        return self.probability >= 1 or rng.random() < self.probability
+
+    def choose(self, contacts: list, rtts: dict = None, rng=random) -> list:
+        """
+        pick who to pass the frame on to.
+
+        Parameters
+        ----------
+        contacts: list
+            the contacts the frame hasn't been through
+
+        rtts: dict
+            contacts mapped to how long they took to answer a ping, in seconds. contacts
+            that were never pinged come after all of the ones that were
+
+        rng: random.Random
+            where the random picks come from
+
+        Returns
+        -------
+        list
+            at most fanout of the contacts
+        """
+
+        contacts = list(contacts)
+        if len(contacts) <= self.fanout:
+            return contacts
+
+        if self.select == 'rtt' and rtts:
+            # shuffle first so that ties, and contacts we never pinged, are picked at random
+            rng.shuffle(contacts)
+            contacts.sort(key=lambda c: rtts.get(c, float('inf')))
+            return contacts[:self.fanout]
+
+        return rng.sample(contacts, self.fanout)
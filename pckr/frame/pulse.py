@@ -0,0 +1,197 @@
+"""
+
+this file contains the summary that a measuring pulse_network gathers on its way back.
+
+pulse_network used to be a tracer: it went everywhere and nothing came back. a pulse
+started with a max_hops answers instead, with a PulseSummary of everyone it got to past
+that user, which the user who sent it adds to their own before passing it on to the next
+contact. the user who started it ends up with the summary of everyone it reached.
+
+the summary is count-distinct sketches, see DistinctCounter, not lists of users, so it is
+the same size whoever is in it and the same user can be in it along as many paths as the
+pulse took:
+
+- one counter for every hop ring, of the hashed usernames the pulse reached that many hops
+  from where it started. the size of the network is all of them together, and how many
+  users are within h hops is the rings up to h together, which gives how far the furthest
+  user is (the eccentricity of whoever started it), and how many hops it takes to reach
+  most of the network
+- one counter for every range of rtts, of the links between users (the xor of their hashed
+  usernames) whose rtt was in that range, from the rtts the users had for their contacts
+- how many frames the pulse cost, which is added up exactly, since every answer only goes
+  back the one way
+
+the frame is passed on one contact at a time, so it would otherwise reach most users along
+long paths first, and be dropped along the short ones. so a measuring pulse is handled again
+when it comes in along a shorter path than before (see DuplicateFilter.check), and only
+goes max_hops hops: each hop past how far the furthest user really is costs about another
+frame per link, so it is best set to a little more than the eccentricity the last pulse
+found. truncated says users max_hops away were reached, and there may be more beyond them.
+
+scripts/pulse_simulation.py compares the estimates with the real network.
+
+"""
+
+from .sketch import DistinctCounter
+
+
+class PulseSummary:
+    """ this class is what a measuring pulse_network found, from the user who answers onwards. """
+
+    # how far a measuring pulse goes, by default
+    max_hops = 6
+
+    # the upper ends of the rtt ranges, in seconds, and then anything slower
+    rtt_buckets = [0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0]
+
+    # how much of the network counts as most of it
+    effective_fraction = 0.9
+
+    # the furthest a summary a frame brings us can go
+    longest_max_hops = 64
+
+    def __init__(self, max_hops: int = None, rings: dict = None, rtts: dict = None, frames: int = 0):
+        if max_hops is not None:
+            self.max_hops = max_hops
+
+        # hops -> DistinctCounter of hashed usernames
+        self.rings = rings or dict()
+
+        # index into rtt_buckets -> DistinctCounter of links
+        self.rtts = rtts or dict()
+
+        self.frames = frames
+
+    @classmethod
+    def from_payload(cls, summary: dict) -> 'PulseSummary':
+        """ return the summary a frame carries. """
+
+        max_hops, frames = summary.get('max_hops'), summary.get('frames')
+        assert type(max_hops) == int and 0 <= max_hops <= cls.longest_max_hops, "bad pulse summary max_hops {}".format(max_hops)
+        assert type(frames) == int and frames >= 0, "bad pulse summary frames {}".format(frames)
+
+        return cls(
+            max_hops=max_hops,
+            rings=cls._counters(summary.get('rings'), max_hops),
+            rtts=cls._counters(summary.get('rtts'), len(cls.rtt_buckets)),
+            frames=frames
+        )
+
+    @staticmethod
+    def _counters(counters: dict, most: int) -> dict:
+        assert type(counters) == dict, "pulse summary counters aren't a dict"
+
+        parsed = dict()
+        for k, c in counters.items():
+            assert k.isdigit() and int(k) <= most, "bad pulse summary counter {}".format(k)
+            parsed[int(k)] = DistinctCounter.from_payload(c)
+
+        return parsed
+
+    def to_payload(self) -> dict:
+        """ return the summary as it goes into a frame's payload. """
+
+        return dict(
+            max_hops=self.max_hops,
+            rings={str(h): c.to_payload() for h, c in self.rings.items()},
+            rtts={str(b): c.to_payload() for b, c in self.rtts.items()},
+            frames=self.frames
+        )
+
+    def add_user(self, hashed_username: str, hops: int) -> None:
+        """ add a user the pulse reached hops hops from where it started. """
+
+        self.rings.setdefault(hops, DistinctCounter()).add_hashed(hashed_username)
+
+    def add_rtt(self, hashed_username: str, hashed_contact: str, seconds: float) -> None:
+        """ add the rtt a user had for one of their contacts. """
+
+        bucket = len(self.rtt_buckets)
+        for i, upper in enumerate(self.rtt_buckets):
+            if seconds <= upper:
+                bucket = i
+                break
+
+        # the xor is the same from either end, so a link both of them measured is one link
+        link = "{:064x}".format(int(hashed_username, 16) ^ int(hashed_contact, 16))
+        self.rtts.setdefault(bucket, DistinctCounter()).add_hashed(link)
+
+    def union(self, other: 'PulseSummary') -> None:
+        """ add everything in other, the answer of a contact we passed the pulse on to, to this summary. """
+
+        for name in ['rings', 'rtts']:
+            mine = getattr(self, name)
+            for k, counter in getattr(other, name).items():
+                if k in mine:
+                    mine[k].union(counter)
+                else:
+                    mine[k] = counter.copy()
+
+        self.frames = self.frames + other.frames
+
+    def _rtt_quantile(self, counts: list, fraction: float) -> float:
+        total = sum(counts)
+        running = 0
+        for i, count in enumerate(counts):
+            running = running + count
+            if running >= fraction * total:
+                return self.rtt_buckets[i] if i < len(self.rtt_buckets) else float('inf')
+        return None
+
+    def estimate(self) -> dict:
+        """
+        return what the summary says about the network.
+
+        Returns
+        -------
+        dict
+            users: how many users the pulse reached
+            within: how many of them were within each number of hops, from 0 to max_hops
+            hops: how many were exactly that many hops away
+            eccentricity: how many hops away the furthest one was
+            diameter: the least and most the diameter of the network can be, going by that
+            effective_hops: how many hops it took to reach effective_fraction of them
+            truncated: whether there were users max_hops away, so maybe more past them
+            links: how many links an rtt was known for
+            rtt: the median and 90th percentile rtt of those links, as the upper end of their range
+            frames: how many frames the pulse cost
+        """
+
+        within = []
+        cumulative = DistinctCounter()
+        for h in range(self.max_hops + 1):
+            if h in self.rings:
+                cumulative.union(self.rings[h])
+            within.append(len(cumulative))
+
+        # a user is in the ring of every path the pulse reached them along, but only counts
+        # once in within, from the shortest of them
+        users = within[-1]
+        hops = [within[0]] + [max(0, within[h] - within[h - 1]) for h in range(1, len(within))]
+        eccentricity = next(h for h, n in enumerate(within) if n >= users)
+        effective_hops = next(h for h, n in enumerate(within) if n >= self.effective_fraction * users)
+
+        links = DistinctCounter()
+        counts = []
+        for b in range(len(self.rtt_buckets) + 1):
+            if b in self.rtts:
+                links.union(self.rtts[b])
+                counts.append(len(self.rtts[b]))
+            else:
+                counts.append(0)
+
+        return dict(
+            users=users,
+            within=within,
+            hops=hops,
+            eccentricity=eccentricity,
+            diameter=(eccentricity, 2 * eccentricity),
+            effective_hops=effective_hops,
+            truncated=hops[-1] > 0,
+            links=len(links),
+            rtt=dict(
+                median=self._rtt_quantile(counts, 0.5),
+                p90=self._rtt_quantile(counts, 0.9)
+            ),
+            frames=self.frames
+        )
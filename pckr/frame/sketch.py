@@ -0,0 +1,101 @@
+"""
+
+this file contains the count-distinct sketch that pulse_network answers carry.
+
+a DistinctCounter is a hyperloglog: a fixed number of small registers, each holding the
+most leading zeros seen in the hashes that land on it. how many distinct ids went in can
+be estimated from them, to within about 1.04 / sqrt(registers), and two of them are merged
+by keeping the bigger of each register. adding the same id twice, or merging in a counter
+that already had it, changes nothing, so it doesn't matter how many ways a pulse reached
+someone, they are only counted once.
+
+"""
+
+import math
+
+
+class DistinctCounter:
+    """ this class is a hyperloglog of sha256s, as hex strings. """
+
+    version = 1
+
+    # 2 ** 8 = 256 registers: within about 6.5% either way, 512 characters in a frame
+    precision = 8
+
+    # the biggest counter a frame can bring us, 2 ** 16 registers
+    max_precision = 16
+
+    def __init__(self, precision: int = None, registers: list = None):
+        if precision is not None:
+            self.precision = precision
+        self.registers = registers if registers is not None else [0] * (1 << self.precision)
+
+    @classmethod
+    def from_payload(cls, value: dict) -> 'DistinctCounter':
+        """ return the counter a frame carries. """
+
+        assert value.get('v') == cls.version, "unknown distinct counter version {}".format(value.get('v'))
+
+        precision, registers = value.get('p'), value.get('registers')
+        assert type(precision) == int and 0 < precision <= cls.max_precision, "bad distinct counter precision {}".format(precision)
+        assert type(registers) == str and len(registers) == 2 << precision, "distinct counter doesn't have {} registers".format(
+            1 << precision
+        )
+
+        try:
+            registers = [int(registers[i:i + 2], 16) for i in range(0, len(registers), 2)]
+        except ValueError:
+            raise AssertionError("distinct counter isn't hex")
+
+        return cls(precision=precision, registers=registers)
+
+    def to_payload(self) -> dict:
+        """ return the counter as it goes into a frame's payload. """
+
+        return dict(
+            v=self.version,
+            p=self.precision,
+            registers="".join("{:02x}".format(r) for r in self.registers)
+        )
+
+    def add_hashed(self, hashed: str) -> None:
+        """ add a sha256 to the counter. """
+
+        # the first 64 bits of the hash: the top bits pick the register, and the rest
+        # give the rank, which is how far along the first 1 is
+        value = int(hashed[0:16], 16)
+        index = value >> (64 - self.precision)
+        rest = value & ((1 << (64 - self.precision)) - 1)
+        rank = (64 - self.precision) - rest.bit_length() + 1
+
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def union(self, other: 'DistinctCounter') -> None:
+        """ add everything in other, which has to be the same size, to this counter. """
+
+        assert self.precision == other.precision, "distinct counters are different sizes"
+        self.registers = [max(a, b) for a, b in zip(self.registers, other.registers)]
+
+    def copy(self) -> 'DistinctCounter':
+        return DistinctCounter(precision=self.precision, registers=list(self.registers))
+
+    def __len__(self) -> int:
+        """ return the estimate of how many distinct ids are in the counter, rounded. """
+
+        return int(round(self.estimate()))
+
+    def estimate(self) -> float:
+        """ return the estimate of how many distinct ids are in the counter. """
+
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+
+        # with only a few ids in it most registers are still empty, and counting those
+        # is much closer than the raw estimate
+        zeros = self.registers.count(0)
+        if raw <= 2.5 * m and zeros > 0:
+            return m * math.log(float(m) / zeros)
+
+        return raw
@@ -0,0 +1,190 @@
+"""
+
+this file contains the digest that check_net_topo frames carry.
+
+check_net_topo used to carry hashed_ipcaches: every hashed username that anyone along the
+way had in their ipcache, mapped to the hash of the ip:port they had for them. a user
+whose ip:port for someone didn't match what was already there sent out net_topo_damaged.
+that map got 130 bytes bigger for every user anyone had heard of, so on a big network the
+frame was the whole network's address book, sent once for every link.
+
+now the frame carries two bloom filters instead: one of the hashed usernames, and one of
+the hashed username and hashed ip:port pairs. a user adds their ipcache to both and passes
+them on. a hashed username that is in the first but whose pair isn't in the second means
+someone along the way has a different ip:port for that user, and only those are sent on in
+full, in net_topo_damaged.
+
+the user who starts the check picks how many users the filters are sized for. a bloom
+filter can't be made bigger once ids are in it, so when they have taken in that many
+another layer is started, twice as big, and a bit stricter so that all of the layers
+together still make about as few mistakes, and so on. every layer is a fixed size, so
+the frame only grows with the network one doubling at a time, and stays far smaller than
+the hashed ipcaches would be. after max_layers of them a digest just fills up, makes more
+mistakes, and stops reporting anyone once it is too full to be trusted. pckr
+check_net_topo --capacity sizes the first layer for bigger networks.
+
+the frame is passed on one contact at a time, and each of them answers with the digest as
+it is once they, and everyone they passed it on to, have added to it. so that is checked
+against and added in before it goes to the next contact, and the digest ends up having been
+through everyone before it gets to anyone, not just the ones on the way to them.
+
+a mistake in the first filter reports a user as damaged when they aren't, which costs a
+flush and a seek, so it is sized for far fewer of those than the second, where a mistake
+only means a damaged user is missed this time.
+
+scripts/topology_simulation.py compares the payloads against hashed_ipcaches.
+
+"""
+
+from .bloom import BloomFilter
+
+
+class TopologyDigest:
+    """ this class is the hashed usernames and hashed ip:ports a check_net_topo frame has seen. """
+
+    # how many users the first layer is sized for
+    capacity = 1024
+
+    # how often a user is reported as damaged when they aren't, in all of the layers together
+    key_false_positive_rate = 0.0001
+
+    # how often a damaged user is missed, in all of the layers together
+    pair_false_positive_rate = 0.01
+
+    # the most layers a digest can have, up to 255 times capacity users
+    max_layers = 8
+
+    def __init__(self, capacity: int = None, keys: list = None, pairs: list = None):
+        if capacity is not None:
+            self.capacity = capacity
+
+        # the layers, in the order they were started
+        self.keys = keys or [self._layer(0, self.key_false_positive_rate)]
+        self.pairs = pairs or [self._layer(0, self.pair_false_positive_rate)]
+
+        assert len(self.keys) == len(self.pairs), "topology digest layers don't match"
+
+    def _layer(self, index: int, false_positive_rate: float) -> BloomFilter:
+        # the layers are twice as big every time, and half as likely to make a mistake,
+        # so however many there are they make at most twice as many as the first
+        return BloomFilter.for_capacity(self.capacity << index, false_positive_rate / 2 ** (index + 1))
+
+    @classmethod
+    def for_capacity(cls, capacity: int) -> 'TopologyDigest':
+        """ return an empty digest with a first layer sized for capacity users. """
+
+        return cls(capacity=capacity)
+
+    @classmethod
+    def from_payload(cls, digest: dict) -> 'TopologyDigest':
+        """
+        return the digest a frame carries.
+
+        digests from older clients are one pair of filters, not lists of them, and don't say
+        what they were sized for, which only matters if they ever need another layer.
+        """
+
+        if type(digest['keys']) == dict:
+            return cls(
+                capacity=digest.get('capacity'),
+                keys=[BloomFilter.from_payload(digest['keys'])],
+                pairs=[BloomFilter.from_payload(digest['pairs'])]
+            )
+
+        capacity = digest.get('capacity')
+        assert type(capacity) == int and capacity > 0, "bad topology digest capacity {}".format(capacity)
+        assert type(digest['keys']) == list and 0 < len(digest['keys']) <= cls.max_layers, "bad topology digest layers"
+
+        return cls(
+            capacity=capacity,
+            keys=[BloomFilter.from_payload(keys) for keys in digest['keys']],
+            pairs=[BloomFilter.from_payload(pairs) for pairs in digest['pairs']]
+        )
+
+    def to_payload(self) -> dict:
+        """ return the digest as it goes into a frame's payload. """
+
+        # one layer goes out the way older clients can read it
+        if len(self.keys) == 1:
+            return dict(
+                capacity=self.capacity,
+                keys=self.keys[0].to_payload(),
+                pairs=self.pairs[0].to_payload()
+            )
+
+        return dict(
+            capacity=self.capacity,
+            keys=[keys.to_payload() for keys in self.keys],
+            pairs=[pairs.to_payload() for pairs in self.pairs]
+        )
+
+    @staticmethod
+    def _pair(hashed_username: str, hashed_ip_port: str) -> str:
+        # both are sha256s already, so their xor is as good a hash of the pair
+        return "{:064x}".format(int(hashed_username, 16) ^ int(hashed_ip_port, 16))
+
+    @staticmethod
+    def _false_positive_rate(layers: list) -> float:
+        correct = 1.0
+        for layer in layers:
+            correct = correct * (1 - layer.false_positive_rate())
+        return 1 - correct
+
+    def _full(self) -> bool:
+        # a layer makes as many mistakes as it was sized for once it has taken in as many
+        # ids as it was sized for
+        index = len(self.keys) - 1
+        return self.keys[-1].false_positive_rate() >= self.key_false_positive_rate / 2 ** (index + 1)
+
+    def add(self, hashed_username: str, hashed_ip_port: str) -> None:
+        """ add an entry from a hashed ipcache, to the newest layer, starting another one if it is full. """
+
+        # most entries are in most ipcaches, and are already in an older layer
+        pair = self._pair(hashed_username, hashed_ip_port)
+        if any(hashed_username in keys for keys in self.keys) and any(pair in pairs for pairs in self.pairs):
+            return
+
+        if len(self.keys) < self.max_layers and self._full():
+            keys = self._layer(len(self.keys), self.key_false_positive_rate)
+
+            # nobody would take a layer bigger than this
+            if keys.bits <= BloomFilter.max_bits:
+                self.keys.append(keys)
+                self.pairs.append(self._layer(len(self.pairs), self.pair_false_positive_rate))
+
+        self.keys[-1].add_hashed(hashed_username)
+        self.pairs[-1].add_hashed(pair)
+
+    def union(self, other: 'TopologyDigest') -> None:
+        """ add everything in other, a digest with the same first layer, to this one. """
+
+        for i in range(len(other.keys)):
+            if i < len(self.keys):
+                self.keys[i].union(other.keys[i])
+                self.pairs[i].union(other.pairs[i])
+            else:
+                self.keys.append(BloomFilter(bits=other.keys[i].bits, hashes=other.keys[i].hashes, filter=other.keys[i].filter))
+                self.pairs.append(BloomFilter(bits=other.pairs[i].bits, hashes=other.pairs[i].hashes, filter=other.pairs[i].filter))
+
+    @property
+    def overfull(self) -> bool:
+        """ return whether the digest has taken in so many more users than it was sized for that it can't be trusted. """
+
+        return self._false_positive_rate(self.keys) > 100 * self.key_false_positive_rate
+
+    def conflicts(self, hashed_username: str, hashed_ip_port: str) -> bool:
+        """
+        return whether someone the frame has been through has a different ip:port for hashed_username.
+
+        an overfull digest would report far too many users that aren't damaged, so it doesn't
+        report anyone.
+        """
+
+        if not any(hashed_username in keys for keys in self.keys):
+            return False
+
+        pair = self._pair(hashed_username, hashed_ip_port)
+        if any(pair in pairs for pairs in self.pairs):
+            return False
+
+        return self.overfull is False
@@ -1,5 +1,11 @@
 """ __init__.py for this module. """
 
 from .message import Message
+from .progress import TransferProgress, print_progress
+from .swarm import assign_seed_chunks, plan_swarm_fetch
 
 assert Message
+assert TransferProgress
+assert print_progress
+assert assign_seed_chunks
+assert plan_swarm_fetch
@@ -1,46 +1,199 @@
 import json
+import os
+import queue
+import threading
 import uuid
 import time
 
 from termcolor import colored
 
-from ..utilities import send_frame_users, split_contents, is_binary, \
-    encrypt_rsa, encrypt_symmetric, bytes2hexstr
+from ..utilities import send_frame_users, chunk_contents, \
+    encrypt_rsa, encrypt_symmetric, bytes2hexstr, str2hashed_hexstr
 from ..frame import Frame
+from .swarm import assign_seed_chunks
+from .progress import TransferProgress
+
+
+class EncryptedChunkCache:
+    """
+    hold encrypted chunks just long enough for every recipient that needs them to send them.
+
+    chunks are encrypted once, in order, no matter how many recipients there are. each
+    chunk is dropped once the last recipient that needs it has taken it, and the producer
+    waits if too many chunks are waiting on a slow recipient.
+    """
+
+    def __init__(self, window: int = 64):
+        self.window = window
+        self.chunks = dict()
+        self.waiting = dict()
+        self.condition = threading.Condition()
+
+    def put(self, index: int, encrypted_content: str, recipients: int) -> None:
+        """
+        add an encrypted chunk that recipients number of recipients are going to take.
+
+        blocks while the cache is full.
+        """
+
+        with self.condition:
+            while len(self.chunks) >= self.window:
+                self.condition.wait()
+
+            self.chunks[index] = encrypted_content
+            self.waiting[index] = recipients
+            self.condition.notify_all()
+
+    def take(self, index: int) -> str:
+        """
+        wait for the chunk at index to be encrypted and return it.
+
+        every recipient that needs the chunk has to call take (or release) exactly once.
+        """
+
+        with self.condition:
+            while index not in self.chunks:
+                self.condition.wait()
+
+            encrypted_content = self.chunks[index]
+            self._release(index)
+            return encrypted_content
+
+    def release(self, index: int) -> None:
+        """ let go of a chunk without taking it, ie: if a recipient went away. """
+
+        with self.condition:
+            while index not in self.chunks:
+                self.condition.wait()
+
+            self._release(index)
+
+    def _release(self, index: int) -> None:
+        self.waiting[index] = self.waiting[index] - 1
+        if self.waiting[index] == 0:
+            del self.waiting[index]
+            del self.chunks[index]
+            self.condition.notify_all()
 
 
 class Message:
     user = None
     user2 = None
+    recipients = None
     filename = None
     mime_type = None
     message_id = None
     password = None
+    content = None
+    files = None
+    packed = False
+    root = None
+    chunks = None
+    missing = None
+    seeds = None
+    swarm = False
+    progress = None  # type: TransferProgress
+
+    def __init__(self, user, filename, mime_type, user2, swarm=False, on_progress=None):
+        """
+        prepare a message from user to user2.
+
+        user2 can be a list of users. the content is then encrypted once under
+        one password, and only that password is wrapped for each recipient.
+
+        with swarm, each chunk is only sent to one of the recipients, and they
+        fetch the rest from each other.
+
+        on_progress is a callable, or a list of them, that gets every progress
+        event as a dict. see progress.py for what is in them.
+        """
 
-    def __init__(self, user, filename, mime_type, user2):
         self.user = user
         self.user2 = user2
+        self.recipients = list(user2) if type(user2) == list else [user2]
         self.filename = filename
         self.mime_type = mime_type
         self.message_id = str(uuid.uuid4())
         self.password = str(uuid.uuid4())
+        self.missing = dict()
+        self.swarm = swarm
+
+        if on_progress is None:
+            on_progress = []
+        elif callable(on_progress):
+            on_progress = [on_progress]
+        self.progress = TransferProgress(self.message_id, on_progress)
 
     def __str__(self):
         return json.dumps(self.__dict__, default=str)
 
-    def _send_key(self):
-        public_key_text = self.user.get_contact_public_key(self.user2)
-        if public_key_text is None:
-            print(colored("public_key for {} not found, can't send message".format(self.user2), "red"))
-            return False
+    def _pack(self):
+        """
+        read the file, or every file under the directory, into one stream.
 
-        key = dict(
-            password=self.password,
-            message_id=self.message_id,
-            md5='',
-            length=1000,
-            filename=self.filename
-        )
+        a directory goes out as one message with an index of where each file sits in
+        the stream, so it costs one key and one term however many files are in it.
+        """
+
+        if os.path.isdir(self.filename):
+            self.packed = True
+            self.root = os.path.abspath(self.filename)
+            filenames = []
+            for d, sds, files in os.walk(self.root):
+                sds.sort()
+                filenames.extend(sorted([os.path.relpath(os.path.join(d, f), self.root) for f in files]))
+        else:
+            self.root = os.path.dirname(os.path.abspath(self.filename))
+            filenames = [os.path.basename(self.filename)]
+
+        self.files = []
+        contents = []
+        offset = 0
+        for filename in filenames:
+            content = open(os.path.join(self.root, filename), "rb").read()
+            self.files.append(dict(
+                filename=filename,
+                offset=offset,
+                length=len(content)
+            ))
+            contents.append(content)
+            offset = offset + len(content)
+
+        self.content = b"".join(contents)
+
+        return True
+
+    def _chunk(self):
+        """
+        cut the stream into content-defined chunks.
+
+        the chunk hashes go out with the key so the receiving user can tell us which
+        chunks they already have from earlier messages.
+        """
+
+        self.chunks = [dict(
+            offset=offset,
+            length=length,
+            hash=str2hashed_hexstr(self.content[offset:offset + length])
+        ) for offset, length in chunk_contents(self.content)]
+
+        return True
+
+    def _encrypt_for(self, user2, content):
+        """
+        encrypt content so that only user2 can read it.
+
+        Returns
+        -------
+        (str, str)
+            the rsa-encrypted password and the content encrypted with that password,
+            or (None, None) if we don't have user2's public_key
+        """
+
+        public_key_text = self.user.get_contact_public_key(user2)
+        if public_key_text is None:
+            print(colored("public_key for {} not found, can't send message".format(user2), "red"))
+            return None, None
 
         password = str(uuid.uuid4())
         password_encrypted = bytes2hexstr(encrypt_rsa(
@@ -48,11 +201,38 @@ class Message:
             public_key_text
         ))
 
-        key_encrypted = bytes2hexstr(encrypt_symmetric(
-            json.dumps(key),
+        content_encrypted = bytes2hexstr(encrypt_symmetric(
+            json.dumps(content),
             password
         ))
 
+        return password_encrypted, content_encrypted
+
+    def _send_key(self, user2):
+        key = dict(
+            password=self.password,
+            message_id=self.message_id,
+            sender=self.user.username,
+            md5='',
+            length=len(self.content),
+            filename=self.filename,
+            mime_type=self.mime_type,
+            files=self.files,
+            packed=self.packed,
+            chunks=self.chunks
+        )
+
+        if self.swarm:
+            key.update(swarm=dict(
+                origin=self.user.username,
+                peers=self.recipients
+            ))
+
+        password_encrypted, key_encrypted = self._encrypt_for(user2, key)
+        if password_encrypted is None:
+            self.progress.key_failed(user2, "public_key not found")
+            return False
+
         payload = dict(
             key=key_encrypted,
             password=password_encrypted
@@ -62,16 +242,44 @@ class Message:
             action='send_message_key',
             payload=payload
         )
-        response = send_frame_users(key_frame, self.user, self.user2)
-        print("send_message_key", response)
+        response = send_frame_users(key_frame, self.user, user2)
+
+        if response.get('success') is not True:
+            self.progress.key_failed(user2, response.get('error', 'unknown error'))
+            return False
+
+        # the receiver tells us which chunks they couldn't find locally. a receiver
+        # that doesn't know about chunk reuse won't say anything, so send them all
+        self.missing[user2] = response.get('missing', list(range(len(self.chunks))))
 
         return True
 
-    def _send_message(self):
-        public_key_text = self.user.get_contact_public_key(self.user2)
-        if public_key_text is None:
-            print(colored("public_key for {} not found, can't send message".format(self.user2), "red"))
-            return False
+    def _send_chunk_frame(self, frame, user2, index, max_retries=20):
+        """
+        send a chunk frame, backing off for as long as user2 says they are full up.
+
+        every response tells us how many bytes user2 has room for (the window). when
+        that runs out the chunk isn't taken, and we wait a little longer each time.
+        """
+
+        backoff = 0.05
+        for _ in range(max_retries):
+            response = send_frame_users(frame, self.user, user2)
+            if response.get('success') is True or response.get('window') != 0:
+                return response
+
+            self.progress.chunk_retried(user2, index)
+            time.sleep(backoff)
+            backoff = min(backoff * 2, 2)
+
+        return response
+
+    def _send_message_to(self, user2, cache):
+        """
+        send user2 their share of the chunks, taking each of them from the shared cache.
+
+        runs in its own thread, one per recipient.
+        """
 
         meta = dict(
             message_id=self.message_id,
@@ -79,70 +287,123 @@ class Message:
             mime_type=self.mime_type
         )
 
-        password = str(uuid.uuid4())
-        password_encrypted = bytes2hexstr(encrypt_rsa(
-            password,
-            public_key_text
-        ))
+        missing = self.seeds[user2]
 
-        meta_encrypted = bytes2hexstr(encrypt_symmetric(
-            json.dumps(meta),
-            password
-        ))
+        taken = 0
+        try:
+            password_encrypted, meta_encrypted = self._encrypt_for(user2, meta)
 
-        if is_binary(self.mime_type):
-            content = open(self.filename, "rb").read()
-        else:
-            content = open(self.filename, "r").read()
+            for count, index in enumerate(missing):
+                encrypted_content = cache.take(index)
+                taken = count + 1
 
-        tt = time.time()
-        et = time.time()
-        print("encryption time", time.time() - et)
+                frame = Frame(
+                    action='send_message',
+                    payload=dict(
+                        password=password_encrypted,
+                        content=encrypted_content,
+                        meta=meta_encrypted,
+                        index=index
+                    )
+                )
+
+                response = self._send_chunk_frame(frame, user2, index)
+                if response.get('success') is True:
+                    self.progress.chunk_acked(user2, index, self.chunks[index]['length'])
+                else:
+                    self.progress.chunk_failed(user2, index, response.get('error', 'unknown error'))
+        finally:
+            # if we bailed out early, don't leave the other recipients waiting on us
+            for index in missing[taken:]:
+                cache.release(index)
+
+        return True
 
-        content_splits = split_contents(content)
-        for index, content_split in enumerate(content_splits):
-            encrypted_content = bytes2hexstr(encrypt_symmetric(
-                content_split,
-                self.password
+    def _send_message(self):
+        recipients = [user2 for user2 in self.recipients if user2 in self.missing]
+
+        if self.swarm:
+            self.seeds = assign_seed_chunks({user2: self.missing[user2] for user2 in recipients})
+
+            # our own surface hands out chunks that none of the recipients can get from each other
+            self.user.store_message_seed(dict(
+                message_id=self.message_id,
+                password=self.password,
+                root=self.root,
+                files=self.files,
+                chunks=self.chunks
             ))
-            ft = time.time()
-            frame = Frame(
-                action='send_message',
-                payload=dict(
-                    password=password_encrypted,
-                    content=encrypted_content,
-                    meta=meta_encrypted
-                )
+        else:
+            self.seeds = {user2: self.missing[user2] for user2 in recipients}
+
+        for user2 in recipients:
+            self.progress.key_sent(
+                user2,
+                len(self.content),
+                len(self.seeds[user2]),
+                sum(self.chunks[index]['length'] for index in self.seeds[user2])
             )
 
-            response = send_frame_users(frame, self.user, self.user2)
-            print("send_message", index, response, time.time() - ft, (index / len(content_splits) * 100))
+        cache = EncryptedChunkCache()
+        threads = [threading.Thread(
+            target=self._send_message_to,
+            args=(user2, cache)
+        ) for user2 in recipients]
+
+        for thread in threads:
+            thread.start()
+
+        # encrypt every chunk that at least one recipient needs, exactly once
+        needed = dict()
+        for user2 in recipients:
+            for index in self.seeds[user2]:
+                needed[index] = needed.get(index, 0) + 1
+
+        for index in sorted(needed.keys()):
+            cache.put(index, self._encrypt_chunk(index), needed[index])
+
+        for thread in threads:
+            thread.join()
 
-        print("total time", time.time() - tt)
         return True
 
-    def _send_message_term(self):
-        public_key_text = self.user.get_contact_public_key(self.user2)
-        if public_key_text is None:
-            print(colored("public_key for {} not found, can't send message".format(self.user2), "red"))
-            return False
+    def _encrypt_chunk(self, index):
+        chunk = self.chunks[index]
+        return bytes2hexstr(encrypt_symmetric(
+            self.content[chunk['offset']:chunk['offset'] + chunk['length']],
+            self.password
+        ))
+
+    def _resend_chunks(self, user2, indexes):
+        """ send user2 the chunks they told us never made it, again. """
+
+        self.seeds[user2] = [index for index in indexes if type(index) == int and 0 <= index < len(self.chunks)]
+
+        cache = EncryptedChunkCache()
+        thread = threading.Thread(
+            target=self._send_message_to,
+            args=(user2, cache)
+        )
+        thread.start()
+
+        for index in self.seeds[user2]:
+            cache.put(index, self._encrypt_chunk(index), 1)
+
+        thread.join()
 
+        return True
+
+    def _send_message_term(self, user2, retries=2):
         term = dict(
             message_id=self.message_id,
             filename=self.filename,
             mime_type=self.mime_type
         )
 
-        password = str(uuid.uuid4())
-        password_encrypted = bytes2hexstr(encrypt_rsa(
-            password,
-            public_key_text
-        ))
-
-        term_encrypted = bytes2hexstr(encrypt_symmetric(
-            json.dumps(term),
-            password
-        ))
+        password_encrypted, term_encrypted = self._encrypt_for(user2, term)
+        if password_encrypted is None:
+            self.progress.term_sent(user2, False)
+            return False
 
         payload = dict(
             term=term_encrypted,
@@ -154,13 +415,53 @@ class Message:
             payload=payload
         )
 
-        response = send_frame_users(term_frame, self.user, self.user2)
-        print("send_frame_term", response)
+        response = send_frame_users(term_frame, self.user, user2)
+
+        # a receiver that is missing chunks tells us which, instead of finishing without them
+        while response.get('success') is not True and response.get('missing') and retries > 0:
+            self._resend_chunks(user2, response['missing'])
+            response = send_frame_users(term_frame, self.user, user2)
+            retries = retries - 1
+
+        self.progress.term_sent(user2, response.get('success') is True)
 
         return True
 
     def send(self):
-        self._send_key()
-        self._send_message()
-        self._send_message_term()
+        try:
+            self._pack()
+            self._chunk()
+            for user2 in self.recipients:
+                self._send_key(user2)
+
+            self._send_message()
+
+            for user2 in self.recipients:
+                if user2 in self.missing:
+                    self._send_message_term(user2)
+        finally:
+            self.progress.message_done()
+            self.user.store_sent_message_summary(self.progress.summary())
+
         return True
+
+    def iter_send(self):
+        """
+        send the message in the background, yielding progress events as they happen.
+
+        the last event is always message_done, which carries the summary.
+        """
+
+        events = queue.Queue()
+        self.progress.callbacks.append(events.put)
+
+        thread = threading.Thread(target=self.send)
+        thread.start()
+
+        while True:
+            event = events.get()
+            yield event
+            if event['event'] == 'message_done':
+                break
+
+        thread.join()
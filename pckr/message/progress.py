@@ -0,0 +1,223 @@
+"""
+
+progress and throughput tracking for messages on their way out.
+
+a Message reports everything that happens to a TransferProgress, which turns it into
+event dicts and hands them to whoever is listening (on_progress callbacks, or
+Message.iter_send). when the message is done, the summary is stored with the user.
+
+every event has the event name, the message_id, the recipient (user2, None for
+message_done), the time, and the stats for that recipient (none for key_failed, the key
+never got to them):
+
+- bytes_total: the size of the message
+- bytes_skipped: what the recipient already had, or gets from the swarm
+- bytes_sent: what they have acknowledged so far
+- chunks_total, chunks_acked
+- retries: how often we had to back off because they were full up
+- failures: chunks they refused
+- mbps_now: MB/s over the last few seconds
+- mbps_avg: MB/s since we started sending to them
+- eta: seconds left at mbps_now, None if we can't tell
+- elapsed: seconds since we started sending to them
+
+"""
+
+from collections import deque
+import threading
+import time
+
+from termcolor import colored
+
+
+class TransferProgress:
+    """ this class keeps the running stats for one message, per recipient. """
+
+    message_id = None
+    callbacks = None
+    rate_window = 5.0
+
+    def __init__(self, message_id: str, callbacks: list = None):
+        self.message_id = message_id
+        self.callbacks = list(callbacks or [])
+        self.recipients = dict()
+        self.started_at = time.time()
+        self.finished_at = None
+        self.lock = threading.Lock()
+
+    def _emit(self, event: str, user2: str, **extra) -> dict:
+        with self.lock:
+            stats = self._stats(user2) if user2 in self.recipients else dict()
+
+        event = dict(
+            event=event,
+            message_id=self.message_id,
+            user2=user2,
+            time=time.time(),
+            **stats
+        )
+        event.update(extra)
+
+        for callback in self.callbacks:
+            callback(event)
+
+        return event
+
+    def _stats(self, user2: str) -> dict:
+        recipient = self.recipients[user2]
+        now = recipient['finished_at'] or time.time()
+        elapsed = now - recipient['started_at']
+
+        # only look at what was acknowledged in the last few seconds for the current rate
+        recent = recipient['recent']
+        while len(recent) > 0 and recent[0][0] < now - self.rate_window:
+            recent.popleft()
+        recent_span = min(self.rate_window, elapsed)
+        mbps_now = sum(b for _, b in recent) / recent_span / 1e6 if recent_span > 0 else 0.0
+        mbps_avg = recipient['bytes_sent'] / elapsed / 1e6 if elapsed > 0 else 0.0
+
+        remaining = recipient['bytes_to_send'] - recipient['bytes_sent']
+        eta = None
+        if remaining <= 0:
+            eta = 0.0
+        elif mbps_now > 0:
+            eta = remaining / (mbps_now * 1e6)
+
+        return dict(
+            bytes_total=recipient['bytes_total'],
+            bytes_skipped=recipient['bytes_total'] - recipient['bytes_to_send'],
+            bytes_sent=recipient['bytes_sent'],
+            chunks_total=recipient['chunks_total'],
+            chunks_acked=recipient['chunks_acked'],
+            retries=recipient['retries'],
+            failures=recipient['failures'],
+            mbps_now=mbps_now,
+            mbps_avg=mbps_avg,
+            eta=eta,
+            elapsed=elapsed
+        )
+
+    def key_sent(self, user2: str, bytes_total: int, chunks: int, bytes_to_send: int) -> dict:
+        """ the key went out, user2 needs chunks chunks totalling bytes_to_send. """
+
+        with self.lock:
+            self.recipients[user2] = dict(
+                bytes_total=bytes_total,
+                bytes_to_send=bytes_to_send,
+                bytes_sent=0,
+                chunks_total=chunks,
+                chunks_acked=0,
+                retries=0,
+                failures=0,
+                recent=deque(),
+                started_at=time.time(),
+                finished_at=None,
+                success=None
+            )
+
+        return self._emit('key_sent', user2)
+
+    def key_failed(self, user2: str, error: str) -> dict:
+        """ the key didn't make it, so nothing else is going to user2. """
+
+        return self._emit('key_failed', user2, error=error)
+
+    def chunk_acked(self, user2: str, index: int, length: int) -> dict:
+        with self.lock:
+            recipient = self.recipients[user2]
+            recipient['bytes_sent'] = recipient['bytes_sent'] + length
+            recipient['chunks_acked'] = recipient['chunks_acked'] + 1
+            recipient['recent'].append((time.time(), length))
+
+        return self._emit('chunk_acked', user2, index=index)
+
+    def chunk_retried(self, user2: str, index: int) -> dict:
+        with self.lock:
+            self.recipients[user2]['retries'] = self.recipients[user2]['retries'] + 1
+
+        return self._emit('chunk_retried', user2, index=index)
+
+    def chunk_failed(self, user2: str, index: int, error: str) -> dict:
+        with self.lock:
+            self.recipients[user2]['failures'] = self.recipients[user2]['failures'] + 1
+
+        return self._emit('chunk_failed', user2, index=index, error=error)
+
+    def term_sent(self, user2: str, success: bool) -> dict:
+        """ we're done with user2, one way or the other. """
+
+        with self.lock:
+            self.recipients[user2]['finished_at'] = time.time()
+            self.recipients[user2]['success'] = success
+
+        return self._emit('term_sent', user2, success=success)
+
+    def summary(self) -> dict:
+        """
+        return the summary of the whole message, to be stored with it.
+
+        Returns
+        -------
+        dict
+            the message_id, start and finish times, and the final stats per recipient
+        """
+
+        with self.lock:
+            recipients = dict()
+            for user2, recipient in self.recipients.items():
+                recipients[user2] = self._stats(user2)
+                recipients[user2].update(success=recipient['success'])
+
+        return dict(
+            message_id=self.message_id,
+            started_at=self.started_at,
+            finished_at=self.finished_at,
+            elapsed=(self.finished_at or time.time()) - self.started_at,
+            bytes_sent=sum(r['bytes_sent'] for r in recipients.values()),
+            recipients=recipients
+        )
+
+    def message_done(self) -> dict:
+        """ everything is over, this is always the last event. """
+
+        self.finished_at = time.time()
+        return self._emit('message_done', None, summary=self.summary())
+
+
+def print_progress(event: dict) -> None:
+    """
+    print progress events out to the terminal, for the command line client.
+
+    Parameters
+    ----------
+    event: dict
+        the event
+    """
+
+    if event['event'] == 'key_sent':
+        print("send_message_key {}: sending {} of {} bytes".format(
+            event['user2'],
+            event['bytes_total'] - event['bytes_skipped'],
+            event['bytes_total']
+        ))
+    elif event['event'] == 'key_failed':
+        print(colored("send_message_key {}: {}".format(event['user2'], event['error']), "red"))
+    elif event['event'] == 'chunk_acked':
+        print("send_message {} {} {:.1f}% {:.2f}MB/s eta {}".format(
+            event['user2'],
+            event['index'],
+            event['bytes_sent'] / max(event['bytes_total'] - event['bytes_skipped'], 1) * 100,
+            event['mbps_now'],
+            "{:.1f}s".format(event['eta']) if event['eta'] is not None else "?"
+        ))
+    elif event['event'] == 'chunk_failed':
+        print(colored("send_message {} {}: {}".format(event['user2'], event['index'], event['error']), "red"))
+    elif event['event'] == 'term_sent':
+        print(colored("send_message_term {}: {} in {:.2f}s at {:.2f}MB/s".format(
+            event['user2'],
+            "done" if event['success'] else "failed",
+            event['elapsed'],
+            event['mbps_avg']
+        ), "green" if event['success'] else "red"))
+    elif event['event'] == 'message_done':
+        print("total time", event['summary']['elapsed'])
@@ -0,0 +1,83 @@
+"""
+
+helpers for sending one message to a swarm of recipients.
+
+the origin only sends each chunk once, to one of the recipients. the recipients then
+fetch the rest of the chunks from each other, so the origin's uplink stops being the
+bottleneck. the same functions are used by the simulation in scripts/swarm_simulation.py
+
+"""
+
+
+def assign_seed_chunks(missing: dict) -> dict:
+    """
+    decide which recipient the origin sends each chunk to.
+
+    every chunk that somebody is missing goes to exactly one of the recipients that is
+    missing it, whoever has been given the fewest chunks so far.
+
+    Parameters
+    ----------
+    missing: dict
+        recipients mapped to the list of chunk indexes they are missing
+
+    Returns
+    -------
+    dict
+        recipients mapped to the sorted list of chunk indexes the origin sends them
+    """
+
+    seeds = {user2: [] for user2 in missing.keys()}
+
+    wanted_by = dict()
+    for user2, indexes in missing.items():
+        for index in indexes:
+            wanted_by.setdefault(index, []).append(user2)
+
+    for index in sorted(wanted_by.keys()):
+        user2 = min(wanted_by[index], key=lambda u: len(seeds[u]))
+        seeds[user2].append(index)
+
+    return seeds
+
+
+def plan_swarm_fetch(missing: list, haves: dict, fallback: str = None) -> dict:
+    """
+    decide which peer to fetch each missing chunk from.
+
+    each chunk is fetched from the least loaded peer that has it. the fallback (the origin)
+    is only used for chunks that no other peer has.
+
+    Parameters
+    ----------
+    missing: list
+        the chunk indexes we still need
+
+    haves: dict
+        peers mapped to the chunk indexes they say they hold
+
+    fallback: str
+        the peer to ask for anything nobody else has
+
+    Returns
+    -------
+    dict
+        peers mapped to the list of chunk indexes to fetch from them
+    """
+
+    haves = {peer: set(indexes) for peer, indexes in haves.items()}
+    plan = dict()
+    load = {peer: 0 for peer in haves.keys()}
+
+    for index in missing:
+        candidates = [peer for peer in haves.keys() if index in haves[peer] and peer != fallback]
+        if len(candidates) == 0:
+            if fallback is None or index not in haves.get(fallback, set()):
+                continue
+            candidates = [fallback]
+
+        peer = min(candidates, key=lambda p: load[p])
+        load[peer] = load[peer] + 1
+        plan.setdefault(peer, []).append(index)
+
+    return plan
@@ -9,7 +9,6 @@ usage: pckr_plot_nt
 """
 
 import os
-import json
 
 import matplotlib.pyplot as plt
 import networkx as nx
@@ -34,11 +33,9 @@ def main():
         print("-" * 100)
         print("user {}".format(user.username))
 
-        path = os.path.join(user.ipcache_path, 'cache.json')
-        if os.path.exists(path):
-            ipcache = json.loads(open(path).read())
-            for k in sorted(ipcache.keys()):
-                graph.add_edge(user.username, k)
+        ipcache = user.ipcache
+        for k in sorted(ipcache.keys()):
+            graph.add_edge(user.username, k)
 
     # write in UTF-8 encoding
     file_handle = open('./test/edgelist.utf-8', 'wb')
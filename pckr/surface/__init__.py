@@ -1,7 +1,10 @@
 """ __init__.py for this module. """
 
 from .surface import Surface, SurfaceUserThread, SeekUsersThread
+from .host import Host, HostSeekThread
 
 assert Surface
 assert SurfaceUserThread
 assert SeekUsersThread
+assert Host
+assert HostSeekThread
@@ -0,0 +1,255 @@
+"""
+
+this file contains the classes that put incoming messages together on disk.
+
+chunks of a message can come in on any number of IncomingFrameThreads at once. instead of
+each of them opening the file, appending and closing it again, they hand the decrypted chunk
+to the MessageAssemblers for their surface. one background writer writes everything that is
+queued up in batches, through a bounded set of open files, and the number of bytes waiting
+to be written is capped. senders are told how much room is left (the window) with every
+response, and are told to back off when there isn't any.
+
+"""
+
+from collections import OrderedDict
+import threading
+
+from ..user import User
+from ..utilities import decrypt_rsa, hexstr2bytes, write_stream_range
+from ..utilities.logging import assert_logger
+
+
+class MessageAssembler:
+    """ this class holds on to everything we need while one message is on its way to us. """
+
+    key = None
+    files = None
+    pending = 0
+
+    def __init__(self, key: dict, files: list):
+        self.key = key
+        self.files = files
+        self.pending = 0
+
+
+class MessageAssemblers:
+    """
+    this class owns the MessageAssembler for every message a surface is receiving.
+
+    memory (bytes waiting to be written), open files and the number of messages whose
+    keys are kept in memory are all bounded, however many contacts are sending at once.
+    """
+
+    user = None  # type: User
+
+    def __init__(
+        self,
+        user: User,
+        max_pending_bytes: int = 32 * 1024 * 1024,
+        max_open_files: int = 32,
+        max_messages: int = 16,
+        max_passwords: int = 256
+    ):
+        self.user = user
+        self.max_pending_bytes = max_pending_bytes
+        self.max_open_files = max_open_files
+        self.max_messages = max_messages
+        self.max_passwords = max_passwords
+
+        self.assemblers = OrderedDict()
+        self.handles = OrderedDict()
+        self.passwords = OrderedDict()
+        self.queue = []
+        self.pending_bytes = 0
+
+        self.condition = threading.Condition()
+        self.files_lock = threading.Lock()
+
+        self.writer = threading.Thread(target=self._write)
+        self.writer.daemon = True
+        self.writer.start()
+
+    @property
+    def window(self) -> int:
+        """ how many more bytes we are willing to take right now. """
+
+        return max(self.max_pending_bytes - self.pending_bytes, 0)
+
+    def decrypt_password(self, password: str) -> bytes:
+        """
+        decrypt an rsa-encrypted password, remembering the last few.
+
+        every chunk frame of a message carries the same encrypted password, so this
+        saves a private key operation per chunk.
+
+        Parameters
+        ----------
+        password: str
+            the encrypted password as a hex str
+
+        Returns
+        -------
+        bytes
+            the decrypted password
+        """
+
+        with self.condition:
+            if password in self.passwords:
+                self.passwords.move_to_end(password)
+                return self.passwords[password]
+
+        decrypted = decrypt_rsa(hexstr2bytes(password), self.user.private_key_text)
+
+        with self.condition:
+            self.passwords[password] = decrypted
+            while len(self.passwords) > self.max_passwords:
+                self.passwords.popitem(last=False)
+
+        return decrypted
+
+    def get(self, message_id: str) -> MessageAssembler:
+        """
+        return the assembler for a message, loading its key from disk if we have to.
+
+        Parameters
+        ----------
+        message_id: str
+            the id of the message
+
+        Returns
+        -------
+        MessageAssembler
+            the assembler, or None if we never got a key for the message
+        """
+
+        with self.condition:
+            if message_id in self.assemblers:
+                self.assemblers.move_to_end(message_id)
+                return self.assemblers[message_id]
+
+        key = self.user.get_message_key(message_id)
+        if key is None:
+            return None
+
+        assembler = MessageAssembler(key, self.user.message_files(key))
+        with self.condition:
+            assembler = self.assemblers.setdefault(message_id, assembler)
+
+            # only forget about messages that have nothing waiting to be written
+            for idle in [m for m, a in self.assemblers.items() if a.pending == 0 and m != message_id]:
+                if len(self.assemblers) <= self.max_messages:
+                    break
+                del self.assemblers[idle]
+
+        return assembler
+
+    def offer(self, message_id: str, offset: int, data: bytes) -> bool:
+        """
+        queue a decrypted, verified chunk to be written, if there is room for it.
+
+        Parameters
+        ----------
+        message_id: str
+            the id of the message
+
+        offset: int
+            where in the message the chunk goes
+
+        data: bytes
+            the chunk
+
+        Returns
+        -------
+        bool
+            False if we are full up and the sender has to try again later
+        """
+
+        assembler = self.get(message_id)
+
+        with self.condition:
+            # a chunk bigger than the whole budget still has to get through sometime
+            if self.pending_bytes > 0 and self.pending_bytes + len(data) > self.max_pending_bytes:
+                return False
+
+            assembler = self.assemblers.setdefault(message_id, assembler)
+            self.pending_bytes = self.pending_bytes + len(data)
+            assembler.pending = assembler.pending + 1
+            self.queue.append((message_id, offset, data))
+            self.condition.notify_all()
+
+        return True
+
+    def finish(self, message_id: str) -> bool:
+        """
+        wait for everything queued up for a message to hit the disk, then let go of it.
+
+        Parameters
+        ----------
+        message_id: str
+            the id of the message
+
+        Returns
+        -------
+        bool
+            usually True
+        """
+
+        with self.condition:
+            assembler = self.assemblers.get(message_id)
+            if assembler is None:
+                return True
+
+            while assembler.pending > 0:
+                self.condition.wait()
+
+            self.assemblers.pop(message_id, None)
+
+        with self.files_lock:
+            for path, _, _ in assembler.files:
+                f = self.handles.pop(path, None)
+                if f is not None:
+                    f.close()
+
+        return True
+
+    def _open_file(self, path: str):
+        """ return an open file for path, closing the least recently used one if we have to. """
+
+        if path in self.handles:
+            self.handles.move_to_end(path)
+            return self.handles[path]
+
+        while len(self.handles) >= self.max_open_files:
+            _, f = self.handles.popitem(last=False)
+            f.close()
+
+        self.handles[path] = open(path, "r+b")
+        return self.handles[path]
+
+    def _write(self) -> None:
+        """ write whatever is queued up, in order, batch after batch. """
+
+        while True:
+            with self.condition:
+                while len(self.queue) == 0:
+                    self.condition.wait()
+
+                batch = sorted(self.queue, key=lambda w: (w[0], w[1]))
+                self.queue = []
+                assemblers = {message_id: self.assemblers[message_id] for message_id, _, _ in batch}
+
+            with self.files_lock:
+                for message_id, offset, data in batch:
+                    try:
+                        write_stream_range(assemblers[message_id].files, offset, data, open_file=self._open_file)
+                    except OSError as e:
+                        assert_logger.error("couldn't write chunk of {}: {}".format(message_id, e))
+
+                for f in self.handles.values():
+                    f.flush()
+
+            with self.condition:
+                for message_id, _, data in batch:
+                    self.pending_bytes = self.pending_bytes - len(data)
+                    assemblers[message_id].pending = assemblers[message_id].pending - 1
+                self.condition.notify_all()
@@ -0,0 +1,225 @@
+"""
+
+this file contains the host, a surface that serves many local users from one process.
+
+running a user means a `pckr surface_user` process each: an interpreter, a listening
+socket, a thread per connection and a seek loop, for every user. a host loads any number
+of users from ~/pckr/ into one process instead. it listens on one or more ports, and
+every frame says who it is for (the hashed username in Frame.to), so whichever port it
+arrives on it is handed to the right user. the users share everything that is per
+process: the ipcaches and storages, the file cache that keys are read through, the
+connection limit, and one seek loop that takes turns going through all of them.
+frames between two users in the same process never touch a socket at all.
+
+"""
+
+import socket
+import threading
+import time
+
+from termcolor import colored
+
+from ..user import User
+from ..utilities import str2hashed_hexstr, register_local_surface, SOCKET_TIMEOUT
+from .assembler import MessageAssemblers
+from .surface import IncomingFrameThread, SeekUsersThread
+
+
+class HostedFrameThread(IncomingFrameThread):
+    """ this class is an IncomingFrameThread that first finds out which of the host's users a frame is for. """
+
+    host = None  # type: Host
+
+    def __init__(
+        self,
+        clientsocket: socket.socket,
+        host: 'Host',
+        connections: threading.BoundedSemaphore
+    ):
+        super(HostedFrameThread, self).__init__(clientsocket, None, None, connections, host.accept_public_keys)
+        self.host = host
+
+    def process_request(self, request: dict) -> dict:
+        user = self.host.route(request.get('to'))
+        if user is None:
+            return dict(
+                success=False,
+                error="{} is not hosted here".format(request.get('to'))
+            )
+
+        self.user = user
+        self.assemblers = self.host.assemblers(user)
+
+        return super(HostedFrameThread, self).process_request(request)
+
+
+class HostListenerThread(threading.Thread):
+    """ this class accepts connections on one of the host's ports. """
+
+    host = None  # type: Host
+    serversocket = None  # type: socket.socket
+    port = None
+
+    def __init__(self, host: 'Host', port: int):
+        super(HostListenerThread, self).__init__()
+        self.daemon = True
+        self.host = host
+
+        while True:
+            try:
+                self.serversocket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                self.serversocket.bind((socket.gethostname(), port))
+                self.serversocket.listen(5)
+                break
+            except OSError:
+                print(colored("trying next port", "yellow"))
+                port = port + 1
+
+        self.port = port
+
+        register_local_surface(self.serversocket.getsockname()[0], self.port, self.dispatch)
+
+    def dispatch(self, request: dict) -> dict:
+        """ respond to a request from a user in this process, on one of our LocalSurface threads, without a socket. """
+
+        return HostedFrameThread(None, self.host, self.host.connections).respond(request)
+
+    def run(self) -> None:
+        while True:
+            try:
+                self.host.connections.acquire()
+                (clientsocket, address) = self.serversocket.accept()
+                clientsocket.settimeout(SOCKET_TIMEOUT)
+                st = HostedFrameThread(clientsocket, self.host, self.host.connections)
+                st.start()
+            except ConnectionAbortedError:
+                self.host.connections.release()
+
+
+class HostSeekThread(SeekUsersThread):
+    """
+    this class is one seek loop for every user on the host.
+
+    each user is swept once per interval, like they would be by their own SeekUsersThread,
+    but the sweeps are spread out over the interval instead of all running at once.
+    """
+
+    users = None
+
+    def __init__(self, users: list, interval: int = 60):
+        super(HostSeekThread, self).__init__(None)
+        self.users = users
+        self.interval = interval
+
+    def run(self) -> bool:
+        while True:
+            for user in list(self.users):
+                self.user = user
+                self._seek_users()
+                time.sleep(float(self.interval) / max(len(self.users), 1))
+
+        return True
+
+
+class Host(threading.Thread):
+    """
+    this class represents a network surface that is shared by many local users.
+
+    every user is told to surface on one of the host's ports, taking turns, but frames for
+    any of them are accepted on all of them.
+    """
+
+    users = None
+    listeners = None
+    connections = None  # type: threading.BoundedSemaphore
+    accept_public_keys = 'none'
+
+    def __init__(
+        self,
+        usernames: list,
+        port: int,
+        ports: int = 1,
+        max_connections: int = 256,
+        accept_public_keys: str = 'none'
+    ):
+        super(Host, self).__init__()
+        self.accept_public_keys = accept_public_keys
+
+        self.users = dict()
+        for username in usernames:
+            user = User(username)
+            self.users[str2hashed_hexstr(user.username)] = user
+
+        # message assemblers start a writer thread, so they're only made for users that
+        # are actually sent a message
+        self._assemblers = dict()
+        self._assemblers_lock = threading.Lock()
+
+        self.connections = threading.BoundedSemaphore(max_connections)
+
+        self.listeners = []
+        for _ in range(ports):
+            listener = HostListenerThread(self, port)
+            self.listeners.append(listener)
+            port = listener.port + 1
+
+    def route(self, to: str) -> User:
+        """
+        return the user a frame is for.
+
+        Parameters
+        ----------
+        to: str
+            the hashed username from the frame, or None if the sender didn't say
+
+        Returns
+        -------
+        User
+            the user, or None if they aren't hosted here. a frame that doesn't say who it
+            is for can only go to a host with one user
+        """
+
+        if to is None:
+            if len(self.users) == 1:
+                return list(self.users.values())[0]
+            return None
+
+        return self.users.get(to)
+
+    def assemblers(self, user: User) -> MessageAssemblers:
+        """ return the MessageAssemblers for user, making them the first time they're needed. """
+
+        with self._assemblers_lock:
+            if user.username not in self._assemblers:
+                self._assemblers[user.username] = MessageAssemblers(user)
+            return self._assemblers[user.username]
+
+    def surface(self) -> bool:
+        """
+        tell every user where they are listening, and let their contacts know.
+
+        Returns
+        -------
+        bool
+            usually True
+        """
+
+        for n, user in enumerate(self.users.values()):
+            listener = self.listeners[n % len(self.listeners)]
+            user.set_current_ip_port(listener.serversocket.getsockname()[0], listener.port)
+
+        for user in self.users.values():
+            user.surface()
+
+        for user in self.users.values():
+            if user.seek_dht is True:
+                user.dht_join()
+
+        return True
+
+    def run(self) -> None:
+        for listener in self.listeners:
+            listener.start()
+
+        for listener in self.listeners:
+            listener.join()
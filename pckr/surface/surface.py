@@ -20,14 +20,79 @@ import uuid
 
 from termcolor import colored
 
-from ..user import User
-from ..utilities import is_binary, send_frame_users
+from ..user import User, SEEK_HOPS
+from ..utilities import send_frame_users, recv_all, register_local_surface, SOCKET_TIMEOUT
 from ..utilities import encrypt_rsa, encrypt_symmetric, decrypt_symmetric, decrypt_rsa
 from ..utilities import hexstr2bytes, bytes2hexstr, str2hashed_hexstr
-from ..frame import Frame
+from ..frame import Frame, CustodyChain, GossipPolicy, DuplicateFilter, TopologyDigest
+from ..message import plan_swarm_fetch
+from .assembler import MessageAssemblers
 from ..utilities.logging import assert_logger, debug_logger
 
 
+# the frames that are passed on from user to user, and reach everyone along many paths
+GOSSIP_ACTIONS = ['seek_user', 'pulse_network', 'check_net_topo']
+
+
+def decrypt_chunk(key: dict, index: int, content: str) -> bytes:
+    """
+    decrypt a chunk of a message with the message password.
+
+    the symmetric encryption pads the content out, so it's cut back to the real length.
+
+    Parameters
+    ----------
+    key: dict
+        the key for the message
+
+    index: int
+        the index of the chunk
+
+    content: str
+        the encrypted chunk, as a hex str
+
+    Returns
+    -------
+    bytes
+        the decrypted chunk
+    """
+
+    return decrypt_symmetric(
+        hexstr2bytes(content),
+        key['password'],
+        decode=False
+    )[:key['chunks'][index]['length']]
+
+
+def finish_message(user: User, key: dict) -> str:
+    """
+    complete a message that has fully arrived and open it up.
+
+    Parameters
+    ----------
+    user: User
+        the receiving user
+
+    key: dict
+        the key for the message
+
+    Returns
+    -------
+    str
+        the path to the file
+    """
+
+    path = user.complete_message(key)
+    print("wrote to", path)
+
+    subprocess.check_call([
+        "open",
+        path
+    ])
+
+    return path
+
+
 class IncomingFrameThread(threading.Thread):
     """
     this class does all of the heavy lifting for incoming Frames.
@@ -37,11 +102,40 @@ class IncomingFrameThread(threading.Thread):
 
     clientsocket = None
     user = None
+    assemblers = None  # type: MessageAssemblers
+    connections = None  # type: threading.BoundedSemaphore
+    accept_public_keys = 'none'
 
-    def __init__(self, clientsocket: socket.socket, username: str):
+    def __init__(
+        self,
+        clientsocket: socket.socket,
+        user: User,
+        assemblers: MessageAssemblers,
+        connections: threading.BoundedSemaphore,
+        accept_public_keys: str = 'none'
+    ):
         super(IncomingFrameThread, self).__init__()
         self.clientsocket = clientsocket
-        self.user = User(username)
+        self.user = user
+        self.assemblers = assemblers
+        self.connections = connections
+        self.accept_public_keys = accept_public_keys
+
+        # only a thread that was started for a socket holds one of the connections
+        self.holds_connection = False
+
+    def release_connection(self) -> None:
+        """
+        give up our connection, before we wait on other users, or once we're done.
+
+        two busy surfaces passing frames on to each other would otherwise each have all of
+        their connections waiting on the other, until the sockets timed out. it isn't taken
+        again afterwards, what is left to do is answering, which doesn't wait on anyone.
+        """
+
+        if self.holds_connection is True:
+            self.holds_connection = False
+            self.connections.release()
 
     def _receive_ping(self, frame: dict):
         """
@@ -63,7 +157,7 @@ class IncomingFrameThread(threading.Thread):
             message="pong"
         )
 
-    def _receive_seek_user(self, frame: dict):
+    def _receive_seek_user(self, frame: dict, answer: bool = True):
         """
         receive the seek_user frame. try to decrypt the and respond to the message contained in it.
 
@@ -72,6 +166,10 @@ class IncomingFrameThread(threading.Thread):
         frame: Frame # TODO JHILL: make this refactoring!
             the frame that represents the action
 
+        answer: bool
+            whether to answer it if it is for us. False for a copy that came a shorter way
+            than one we've already handled, which we answered then
+
         Returns
         -------
         dict
@@ -84,8 +182,12 @@ class IncomingFrameThread(threading.Thread):
         responded = False
 
         # 1) try to decrypt the message using our own private key
-        # if we can decrypt it we should answer the other host
+        # if we can decrypt it we should answer the other host. the recipient tag
+        # rules out almost every frame that isn't for us without the rsa decryption
         try:
+            if self.user.may_be_recipient(frame['payload']) is False:
+                raise ValueError("the recipient tag isn't ours")
+
             password_decrypted = decrypt_rsa(
                 hexstr2bytes(frame['payload']['password']),
                 self.user.private_key_text
@@ -97,6 +199,13 @@ class IncomingFrameThread(threading.Thread):
             # TODO JHILL: error handling
             host_info = json.loads(decrypted_text)
 
+            if answer is False:
+                return dict(
+                    success=True,
+                    message="that was me, and I've answered already",
+                    recipient=True
+                )
+
             password = str(uuid.uuid4())
             password_encrypted = bytes2hexstr(encrypt_rsa(password, host_info['public_key']))
 
@@ -128,6 +237,7 @@ class IncomingFrameThread(threading.Thread):
                 host_info['port']
             )
 
+            self.release_connection()
             ping = self.user.ping_user(user2)
             if ping is False:
                 self.user.set_contact_ip_port(user2, ip, port)
@@ -176,28 +286,42 @@ class IncomingFrameThread(threading.Thread):
         # if it wasn't us, we should pass the message along
         if responded is False:
 
-            # don't go more than 4 hops away
-            if len(frame['payload']['custody_chain']) >= 4:
+            custody_chain = CustodyChain.from_payload(frame['payload']['custody_chain'])
+            gossip = GossipPolicy.from_payload(frame['payload'].get('gossip'))
+
+            # don't go more than SEEK_HOPS hops away, or as far as the gossip policy says
+            if custody_chain.hops >= (gossip.ttl if gossip is not None else SEEK_HOPS):
                 return dict(
                     success=True,
                     message='custody_chain len exceeded'
                 )
 
-            count = 0
+            if gossip is not None and gossip.passes_on() is False:
+                return dict(
+                    success=True,
+                    message='not passing this one on'
+                )
 
-            frame['payload']['custody_chain'].append(
-                str2hashed_hexstr(self.user.username)
-            )
+            count = 0
 
-            for k, _ in self.user.ipcache.items():
-                hashed_username = str2hashed_hexstr(k)
-                if hashed_username not in frame['payload']['custody_chain']:
-                    response_frame = Frame(
-                        action=frame['action'],
-                        payload=frame['payload'],
-                    )
-                    send_frame_users(response_frame, self.user, k)
-                    count = count + 1
+            custody_chain.add(self.user.username)
+            payload = dict(frame['payload'], custody_chain=custody_chain.to_payload())
+
+            contacts = [
+                k for k, hashed_username in self.user.ipcache_store.hashed_usernames().items()
+                if hashed_username not in custody_chain
+            ]
+            if gossip is not None:
+                contacts = gossip.choose(contacts, self.user.rtts)
+
+            self.release_connection()
+            for k in contacts:
+                response_frame = Frame(
+                    action=frame['action'],
+                    payload=payload,
+                )
+                send_frame_users(response_frame, self.user, k)
+                count = count + 1
 
             return dict(
                 success=True,
@@ -206,7 +330,8 @@ class IncomingFrameThread(threading.Thread):
         else:
             return dict(
                 success=True,
-                message="that was me, a seek_user_response is imminent"
+                message="that was me, a seek_user_response is imminent",
+                recipient=True
             )
 
     def _receive_request_public_key(
@@ -216,8 +341,9 @@ class IncomingFrameThread(threading.Thread):
         """
         a user is requesting our public key, so we'll store the request and look at it later.
 
-        this doesn't automatically send your public key out, you have to do
-        process_public_key_requests to process them and send them back to the other user
+        this doesn't send your public key out unless the surface accepts public key
+        requests from them, otherwise you have to do process_public_key_requests to
+        process them and send them back to the other user
 
         Parameters
         ----------
@@ -233,10 +359,21 @@ class IncomingFrameThread(threading.Thread):
         self.user.store_public_key_request(request_frame)
         self.user.store_volunteered_public_key(request_frame)
 
+        # answer it once they've heard back from us, they might be the ones holding it up
+        if self.user.accepts_public_key_from(request_frame['payload']['user2'], self.accept_public_keys):
+            threading.Thread(
+                target=self._answer_public_key_request,
+                args=(request_frame['payload'],)
+            ).start()
+
         return dict(
             success=True
         )
 
+    def _answer_public_key_request(self, request: dict) -> None:
+        if self.user.process_public_key_request(request):
+            self.user.remove_public_key_request(request)
+
     def _receive_public_key_response(
         self,
         request_frame: dict
@@ -259,11 +396,13 @@ class IncomingFrameThread(threading.Thread):
              dictionary that can be packaged into a Frame
         """
 
-        # TODO JHILL: maybe just make this automatic, don't store it to a
-        # file for later processing. we could challenge the user back
-        # and see if it's really them, and then add it to our cache
+        # TODO JHILL: we could challenge the user back and see if it's really them,
+        # and then add it to our cache
 
-        self.user.store_public_key_response(request_frame)
+        if self.user.accepts_public_key_from(request_frame['payload']['user2'], self.accept_public_keys):
+            self.user.process_public_key_response(request_frame['payload'])
+        else:
+            self.user.store_public_key_response(request_frame)
 
         return dict(
             success=True
@@ -363,9 +502,10 @@ class IncomingFrameThread(threading.Thread):
              dictionary that can be packaged into a Frame
         """
 
-        password_decrypted = decrypt_rsa(
-            hexstr2bytes(request_frame['payload']['password']),
-            self.user.private_key_text
+        # every chunk of the message carries the same password, the assemblers
+        # remember it so we only pay for the rsa once
+        password_decrypted = self.assemblers.decrypt_password(
+            request_frame['payload']['password']
         )
 
         meta_decrypted = decrypt_symmetric(
@@ -374,38 +514,34 @@ class IncomingFrameThread(threading.Thread):
         )
 
         meta = json.loads(meta_decrypted)
-        key = None
-        key_path = os.path.join(self.user.message_keys_path, meta['message_id'])
-        with open(os.path.join(key_path, "key.json"), "r") as f:
-            key = json.loads(f.read())
-
-        path = os.path.join(self.user.messages_path, meta['message_id'])
-        if not os.path.exists(path):
-            os.makedirs(path)
-        filename = os.path.basename(os.path.normpath(meta['filename']))
-        path = os.path.join(path, filename)
-
-        if is_binary(meta['mime_type']):
-            content_decrypted = decrypt_symmetric(
-                hexstr2bytes(request_frame['payload']['content']),
-                key['password'],
-                decode=False
-            )
-            print(content_decrypted)
+        assembler = self.assemblers.get(meta['message_id'])
 
-            with open(path, "ab+") as f:
-                f.write(content_decrypted)
-        else:
-            content_decrypted = decrypt_symmetric(
-                hexstr2bytes(request_frame['payload']['content']),
-                key['password']
+        assert assembler is not None, "no key for message {}".format(meta['message_id'])
+        assert 'index' in request_frame['payload'], "index not in request_frame['payload']"
+
+        key = assembler.key
+        index = request_frame['payload']['index']
+        chunk = key['chunks'][index]
+        content_decrypted = decrypt_chunk(key, index, request_frame['payload']['content'])
+
+        if str2hashed_hexstr(content_decrypted) != chunk['hash']:
+            return dict(
+                success=False,
+                error="chunk {} doesn't match its hash".format(index)
             )
 
-            with open(path, "a+") as f:
-                f.write(content_decrypted)
+        # the write happens in the background. if too much is waiting to be
+        # written already, the sender has to come back later
+        if not self.assemblers.offer(meta['message_id'], chunk['offset'], content_decrypted):
+            return dict(
+                success=False,
+                error="busy",
+                window=0
+            )
 
         return dict(
-            success=True
+            success=True,
+            window=self.assemblers.window
         )
 
     def _receive_send_message_term(
@@ -441,36 +577,32 @@ class IncomingFrameThread(threading.Thread):
         )
 
         term = json.loads(term_decrypted)
-        path = os.path.join(self.user.messages_path, term['message_id'])
-        filename = os.path.basename(os.path.normpath(term['filename']))
-        path = os.path.join(path, filename)
+        key = self.user.get_message_key(term['message_id'])
+        assert key is not None, "no key for message {}".format(term['message_id'])
 
-        """
-        path = path
-        if is_binary(term['mime_type']):
-            content_decrypted = decrypt_symmetric(
-                hexstr2bytes(content),
-                key['password'],
-                decode=False
-            )
+        # everything the sender sent us has to be on disk before we look at it
+        self.assemblers.finish(term['message_id'])
 
-            with open(path, "wb+") as f:
-                f.write(content_decrypted)
-        else:
-            content_decrypted = decrypt_symmetric(
-                hexstr2bytes(content),
-                key['password']
-            )
+        missing = self.user.missing_message_chunks(key)
+        if len(missing) > 0:
+            # in a swarm the origin only sent us some of the chunks, the rest
+            # we have to go and get from the other recipients
+            if key.get('swarm') is not None:
+                SwarmFetchThread(self.user, key, missing).start()
 
-            with open(path, "w+") as f:
-                f.write(content_decrypted)
-        """
-        print("wrote to", path)
+                return dict(
+                    success=True,
+                    message="fetching {} chunks from the swarm".format(len(missing))
+                )
 
-        subprocess.check_call([
-            "open",
-            path
-        ])
+            # otherwise some of them never made it, and the sender has to send them again
+            return dict(
+                success=False,
+                error="missing {} chunks".format(len(missing)),
+                missing=missing
+            )
+
+        finish_message(self.user, key)
 
         return dict(
             success=True
@@ -508,15 +640,81 @@ class IncomingFrameThread(threading.Thread):
 
         key = json.loads(key_decrypted)
 
-        key_path = os.path.join(self.user.message_keys_path, key['message_id'])
-        if not os.path.exists(key_path):
-            os.makedirs(key_path)
+        # fill in everything we already have from earlier messages and tell the
+        # sender which chunks they still have to send us
+        missing = self.user.prepare_message(key)
 
-        with open(os.path.join(key_path, "key.json"), "w+") as f:
-            f.write(json.dumps(key))
+        return dict(
+            success=True,
+            missing=missing
+        )
+
+    def _receive_swarm_have(
+        self,
+        request_frame: dict
+    ) -> dict:
+        """
+        tell a fellow recipient of a swarm message which chunks of it we hold.
+
+        Parameters
+        ----------
+        frame: Frame # TODO JHILL: make this refactoring!
+            the frame that represents the action
+
+        Returns
+        -------
+        dict
+             dictionary that can be packaged into a Frame
+        """
+
+        assert 'payload' in request_frame, 'payload not in request_frame'
+        assert 'message_id' in request_frame['payload'], "message_id not in request_frame['payload']"
 
         return dict(
-            success=True
+            success=True,
+            have=self.user.held_message_chunks(request_frame['payload']['message_id'])
+        )
+
+    def _receive_swarm_chunk(
+        self,
+        request_frame: dict
+    ) -> dict:
+        """
+        hand a chunk of a swarm message to a fellow recipient.
+
+        the chunk goes out encrypted with the message password, so only the
+        recipients of the message can do anything with it.
+
+        Parameters
+        ----------
+        frame: Frame # TODO JHILL: make this refactoring!
+            the frame that represents the action
+
+        Returns
+        -------
+        dict
+             dictionary that can be packaged into a Frame
+        """
+
+        assert 'payload' in request_frame, 'payload not in request_frame'
+        assert 'message_id' in request_frame['payload'], "message_id not in request_frame['payload']"
+        assert 'index' in request_frame['payload'], "index not in request_frame['payload']"
+
+        message_id = request_frame['payload']['message_id']
+        index = request_frame['payload']['index']
+
+        data = self.user.read_message_chunk(message_id, index)
+        if data is None:
+            return dict(
+                success=False,
+                error="we don't have chunk {}".format(index)
+            )
+
+        key = self.user.get_message_key(message_id) or self.user.get_message_seed(message_id)
+
+        return dict(
+            success=True,
+            content=bytes2hexstr(encrypt_symmetric(data, key['password']))
         )
 
     def _receive_surface_user(
@@ -623,32 +821,17 @@ class IncomingFrameThread(threading.Thread):
         assert 'ip' in host_info
         assert 'port' in host_info
 
-        seek_token_path = os.path.join(
-            self.user.seek_tokens_path,
-            "{}.json".format(host_info['username'])
-        )
-
-        seek_tokens = []
-        try:
-            seek_tokens = json.loads(open(seek_token_path).read())
-        except FileNotFoundError:
-            return dict(
-                success=False,
-                error='seek_tokens not found'
-            )
-
-        # TODO JHILL: this could be a one-liner using 'in' but you need to test it again
-        found = False
-        for x in seek_tokens:
-            if x.strip() == seek_token_decrypted.strip():
-                found = True
-
-        if found:
+        if self.user.consume_seek_token(host_info['username'], seek_token_decrypted):
             self.user.set_contact_ip_port(
                 host_info['username'],
                 host_info['ip'],
                 int(host_info['port'])
             )
+            self.user.seek_scheduler.resolve(
+                host_info['username'],
+                host_info['ip'],
+                int(host_info['port'])
+            )
 
             return dict(
                 success=True
@@ -665,18 +848,29 @@ class IncomingFrameThread(threading.Thread):
     ) -> dict:
         """
         receive a pulse_network frame and process it, by passing it along all of the other users
-        that we have knowledge of
+        that we have knowledge of. a measuring pulse is answered with the summary of us and
+        all of them
         """
 
         assert 'payload' in request_frame, "payload not in request_frame"
         assert 'custody_chain' in request_frame['payload'], "custody_chain not in request_frame['payload']"
 
-        self.user.pulse_network(
-            request_frame['payload']['custody_chain']
+        payload = request_frame['payload']
+        self.release_connection()
+        summary = self.user.pulse_network(
+            CustodyChain.from_payload(payload['custody_chain']),
+            payload.get('origin_id'),
+            max_hops=payload.get('max_hops')
         )
 
+        if payload.get('max_hops') is None:
+            return dict(
+                success=True
+            )
+
         return dict(
-            success=True
+            success=True,
+            summary=summary.to_payload()
         )
 
     def _receive_check_net_topo(
@@ -685,30 +879,96 @@ class IncomingFrameThread(threading.Thread):
     ) -> dict:
         assert 'payload' in request_frame, "payload not in request_frame"
         assert 'custody_chain' in request_frame['payload'], "custody_chain not in request_frame['payload']"
-        assert 'hashed_ipcaches' in request_frame['payload'], "hashed_ipcaches not in request_frame['payload']"
 
-        self.user.check_net_topo(
-            request_frame['payload']['custody_chain'],
-            request_frame['payload']['hashed_ipcaches']
+        payload = request_frame['payload']
+        if 'digest' in payload:
+            digest = TopologyDigest.from_payload(payload['digest'])
+        else:
+            # frames from older clients carry everyone's hashed ipcaches in full
+            assert 'hashed_ipcaches' in payload, "digest not in request_frame['payload']"
+            digest = TopologyDigest()
+            for k, v in payload['hashed_ipcaches'].items():
+                digest.add(k, v)
+
+        self.release_connection()
+        digest = self.user.check_net_topo(
+            CustodyChain.from_payload(payload['custody_chain']),
+            digest,
+            payload.get('origin_id')
         )
 
+        # so whoever passed it to us can check against everything that was added after them
         return dict(
             success=True,
+            digest=digest.to_payload()
         )
 
     def _receive_net_topo_damaged(
         self,
         request_frame: dict
     ) -> dict:
+        """
+        receive a net_topo_damaged frame, and queue the inconsistent users in it to be flushed.
+
+        Parameters
+        ----------
+        request_frame: dict
+            the frame, with the hashed usernames of the inconsistent users
+
+        Returns
+        -------
+        dict
+            dictionary that can be packaged into a Frame
+        """
+
         assert 'payload' in request_frame, "payload not in request_frame"
-        assert 'inconsistent_user' in request_frame['payload'], "custody_chain not in request_frame['payload']"
 
-        self.user.flush_inconsistent_user(
-            request_frame['payload']['inconsistent_user']
+        payload = request_frame['payload']
+        if 'inconsistent_users' in payload:
+            inconsistent_users = payload['inconsistent_users']
+        else:
+            # frames from older clients carry one each
+            assert 'inconsistent_user' in payload, "inconsistent_users not in request_frame['payload']"
+            inconsistent_users = [payload['inconsistent_user']]
+
+        assert type(inconsistent_users) == list, "inconsistent_users is not a list"
+
+        return dict(
+            success=True,
+            queued=self.user.queue_inconsistent_users(inconsistent_users)
         )
 
+    def _receive_dht_find_node(
+        self,
+        request_frame: dict
+    ) -> dict:
+        """
+        receive a dht_find_node frame, and answer with who we know of closest to what they're looking for.
+
+        Parameters
+        ----------
+        request_frame: dict
+            the frame, with the hashed username being looked for and who is asking
+
+        Returns
+        -------
+        dict
+            dictionary that can be packaged into a Frame
+        """
+
+        assert 'payload' in request_frame, "payload not in request_frame"
+        assert 'target' in request_frame['payload'], "target not in request_frame['payload']"
+        assert 'sender' in request_frame['payload'], "sender not in request_frame['payload']"
+
+        if self.user.seek_dht is False:
+            return dict(
+                success=False,
+                error='not in the dht'
+            )
+
         return dict(
-            success=True
+            success=True,
+            nodes=self.user.answer_dht_find_node(request_frame['payload'])
         )
 
     def process_request(
@@ -725,6 +985,35 @@ class IncomingFrameThread(threading.Thread):
         try:
             assert 'action' in request, 'request has no action'
 
+            # frames from older clients don't say who they are for
+            if request.get('to') not in (None, str2hashed_hexstr(self.user.username)):
+                return dict(
+                    success=False,
+                    error="{} is not here".format(request['to'])
+                )
+
+            # drop copies of gossip frames we've already seen, before anything else happens
+            repeat = False
+            if request['action'] in GOSSIP_ACTIONS:
+                payload = request.get('payload') or dict()
+                origin_id = payload.get('origin_id')
+                duplicates = DuplicateFilter.for_user(self.user.username)
+
+                # seeks, and measuring pulses, are handled again if they have come a shorter
+                # way, see DuplicateFilter
+                hops = None
+                if request['action'] == 'seek_user' or (
+                    request['action'] == 'pulse_network' and payload.get('max_hops') is not None
+                ):
+                    hops = CustodyChain.from_payload(payload['custody_chain']).hops
+
+                repeat = origin_id is not None and origin_id in duplicates
+                if origin_id is not None and duplicates.check(origin_id, hops=hops):
+                    return dict(
+                        success=True,
+                        message="already seen {}".format(origin_id)
+                    )
+
             # TODO JHILL: wire up frames here, and use them throughout, this
             # doesn't look great when you run it through the linter
             # also rename it to frame instead of request before you hand it over
@@ -736,6 +1025,10 @@ class IncomingFrameThread(threading.Thread):
                 return self._receive_send_message_key(request)
             elif request['action'] == 'send_message_term':
                 return self._receive_send_message_term(request)
+            elif request['action'] == 'swarm_have':
+                return self._receive_swarm_have(request)
+            elif request['action'] == 'swarm_chunk':
+                return self._receive_swarm_chunk(request)
             elif request['action'] == 'request_public_key':
                 return self._receive_request_public_key(request)
             elif request['action'] == 'public_key_response':
@@ -745,7 +1038,7 @@ class IncomingFrameThread(threading.Thread):
             elif request['action'] == 'challenge_user_pk':
                 return self._receive_challenge_user_pk(request)
             elif request['action'] == 'seek_user':
-                return self._receive_seek_user(request)
+                return self._receive_seek_user(request, answer=repeat is False)
             elif request['action'] == 'seek_user_response':
                 return self._receive_seek_user_response(request)
             elif request['action'] == 'surface_user':
@@ -756,6 +1049,8 @@ class IncomingFrameThread(threading.Thread):
                 return self._receive_check_net_topo(request)
             elif request['action'] == 'net_topo_damaged':
                 return self._receive_net_topo_damaged(request)
+            elif request['action'] == 'dht_find_node':
+                return self._receive_dht_find_node(request)
             else:
                 return dict(
                     success=False,
@@ -771,41 +1066,172 @@ class IncomingFrameThread(threading.Thread):
             )
 
     def run(self) -> bool:
-        request_text = self.clientsocket.recv(int(65536 / 2)).decode()
+        self.holds_connection = True
         try:
-            request = json.loads(request_text)
-            response = self.process_request(request)
-        except json.decoder.JSONDecodeError as e:
-            print(request_text)
-            print(e)
-            return dict(
-                success=False,
-                error=str(e)
-            )
+            return self._run()
+        finally:
+            self.release_connection()
+
+    def respond(self, request: dict) -> dict:
+        """
+        process a request and return the response to it.
+
+        this is everything but the socket, so frames from a surface in this same process
+        can be handed straight to it.
+
+        Parameters
+        ----------
+        request: dict
+            the frame, as it came off the wire
+
+        Returns
+        -------
+        dict
+            the response
+        """
+
+        response = self.process_request(request)
 
         assert 'frame_id' in request
         response.update(response_to_frame=request['frame_id'])
 
-        if type(response) == dict:
-            response = json.dumps(response)
-        else:
+        if type(response) != dict:
             print(colored("passing anything but dicts is deprecated", "red"))
             assert False
 
         print("\n")
-        print("response", colored(response, "green"))
+        print("response", colored(json.dumps(response), "green"))
         print("\n")
         print(colored("*" * 100, "blue"))
         print(colored("* end request", "blue"))
         print(colored("*" * 100, "blue"))
         print("\n")
 
-        self.clientsocket.sendall(response.encode())
+        return response
+
+    def _run(self) -> bool:
+        try:
+            request_text = recv_all(self.clientsocket).decode()
+        except socket.timeout:
+            # they never finished sending, don't hold on to the thread waiting for them
+            print(colored("timed out reading a request", "red"))
+            self.clientsocket.close()
+            return dict(
+                success=False,
+                error="timed out"
+            )
+
+        try:
+            request = json.loads(request_text)
+            response = self.respond(request)
+        except json.decoder.JSONDecodeError as e:
+            print(request_text)
+            print(e)
+            return dict(
+                success=False,
+                error=str(e)
+            )
+
+        try:
+            self.clientsocket.sendall(json.dumps(response).encode())
+        except socket.timeout:
+            print(colored("timed out sending a response", "red"))
         self.clientsocket.close()
 
         return True
 
 
+class SwarmFetchThread(threading.Thread):
+    """
+    this class fetches the chunks of a swarm message that the origin didn't send us.
+
+    every round we ask the other recipients (the ones in our ipcache) which chunks they
+    hold, and spread our requests over them. the origin is only asked for chunks that
+    nobody else has. every chunk is checked against the origin's hash list before it is
+    written.
+    """
+
+    user = None  # type: User
+    key = None
+    missing = None
+    rounds = 10
+
+    def __init__(self, user: User, key: dict, missing: list):
+        super(SwarmFetchThread, self).__init__()
+        self.user = user
+        self.key = key
+        self.missing = missing
+
+    def _haves(self) -> dict:
+        """ ask every reachable peer which chunks they hold. """
+
+        peers = [p for p in self.key['swarm']['peers'] if p != self.user.username]
+        peers.append(self.key['swarm']['origin'])
+
+        haves = dict()
+        for peer in peers:
+            ip, _ = self.user.get_contact_ip_port(peer)
+            if ip is None:
+                continue
+
+            frame = Frame(
+                action='swarm_have',
+                payload=dict(message_id=self.key['message_id'])
+            )
+            response = send_frame_users(frame, self.user, peer)
+            if response.get('success') is True:
+                haves[peer] = response['have']
+
+        return haves
+
+    def _fetch_from(self, peer: str, indexes: list) -> None:
+        """ fetch indexes from peer, one chunk at a time. """
+
+        for index in indexes:
+            frame = Frame(
+                action='swarm_chunk',
+                payload=dict(
+                    message_id=self.key['message_id'],
+                    index=index
+                )
+            )
+
+            response = send_frame_users(frame, self.user, peer)
+            if response.get('success') is True:
+                data = decrypt_chunk(self.key, index, response['content'])
+                if not self.user.write_message_chunk(self.key, index, data):
+                    assert_logger.error("{} sent chunk {} of {} that doesn't match its hash".format(
+                        peer,
+                        index,
+                        self.key['message_id']
+                    ))
+
+    def run(self) -> None:
+        for _ in range(self.rounds):
+            plan = plan_swarm_fetch(self.missing, self._haves(), fallback=self.key['swarm']['origin'])
+
+            threads = [threading.Thread(
+                target=self._fetch_from,
+                args=(peer, indexes)
+            ) for peer, indexes in plan.items()]
+
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+            self.missing = self.user.missing_message_chunks(self.key)
+            if len(self.missing) == 0:
+                finish_message(self.user, self.key)
+                return
+
+            # some of the other recipients might still be getting their share from
+            # the origin, give them a moment
+            time.sleep(1)
+
+        print(colored("gave up on {} chunks of {}".format(len(self.missing), self.key['message_id']), "red"))
+
+
 class SeekUsersThread(threading.Thread):
     user = None  # type: User
 
@@ -833,12 +1259,13 @@ class SeekUsersThread(threading.Thread):
 
         # TODO JHILL: we should also seek out all of the users that we have public_keys for, that
         # we don't have in our ipcache.... makes sense to be connected if we can
+        ipcache = self.user.ipcache
         for u in self.user.public_keys:
-            if u['username'] not in self.user.ipcache.keys():
+            if u['username'] not in ipcache:
                 print(colored("*" * 100, "cyan"))
                 print(colored("* nope", "cyan"))
                 debug_logger.debug(u['username'], u)
-                self.user.seek_user(u['username'])
+                self.user.schedule_seek(u['username'])
                 print(colored("*" * 100, "cyan"))
 
         # iterate through all of the cached ips that we have, and check if the users are still there
@@ -853,7 +1280,7 @@ class SeekUsersThread(threading.Thread):
 
             if ping is False:
                 print(colored("* seeking them because they failed the ping", "cyan"))
-                self.user.seek_user(k)
+                self.user.schedule_seek(k)
             else:
                 public_key_text = self.user.get_contact_public_key(k)
                 if public_key_text:
@@ -867,11 +1294,38 @@ class SeekUsersThread(threading.Thread):
                     else:
                         print(colored("* removing and seeking them because they failed the challenge", "cyan"))
                         self.user.remove_contact_ip_port(k)
-                        self.user.seek_user(k)
+                        self.user.schedule_seek(k)
                 else:
                     print(colored("* we don't have their public_key", "cyan"))
             print(colored("*" * 100, "cyan"))
 
+        duplicates = DuplicateFilter.for_user(self.user.username)
+        print(colored("* {} duplicate frames: {} checked, {} dropped, {} came a shorter way, {} remembered".format(
+            self.user.username,
+            duplicates.stats['checked'],
+            duplicates.stats['dropped'],
+            duplicates.stats['shorter'],
+            len(duplicates.seen)
+        ), "cyan"))
+
+        seeks = self.user.seek_scheduler
+        print(colored("* {} seeks: {} asked for, {} sent, {} merged with one already out, {} found".format(
+            self.user.username,
+            seeks.stats['requested'],
+            seeks.stats['sent'],
+            seeks.stats['coalesced'],
+            seeks.stats['found']
+        ), "cyan"))
+
+        damage = self.user.damage_queue
+        print(colored("* {} damaged users: {} reported, {} flushed, {} waiting, {} suppressed".format(
+            self.user.username,
+            damage.stats['reported'],
+            damage.stats['flushed'],
+            len(damage.pending),
+            damage.stats['suppressed']
+        ), "cyan"))
+
         return True
 
 
@@ -891,6 +1345,8 @@ class SurfaceUserThread(threading.Thread):
         """
 
         self.user.surface()
+        if self.user.seek_dht is True:
+            self.user.dht_join()
 
 
 class Surface(threading.Thread):
@@ -904,11 +1360,23 @@ class Surface(threading.Thread):
     serversocket = None  # type: socket.socket
     hostname = None
     username = None
+    user = None  # type: User
+    assemblers = None  # type: MessageAssemblers
+    connections = None  # type: threading.BoundedSemaphore
+    accept_public_keys = 'none'
 
-    def __init__(self, username: str, port: int):
+    def __init__(self, username: str, port: int, max_connections: int = 64, accept_public_keys: str = 'none'):
         super(Surface, self).__init__()
         self.port = port
         self.username = username
+        self.accept_public_keys = accept_public_keys
+
+        # one User shared by every connection, rather than one per connection
+        self.user = User(username)
+        self.assemblers = MessageAssemblers(self.user)
+
+        # every connection is a thread and a socket, so don't take on more than this at once
+        self.connections = threading.BoundedSemaphore(max_connections)
 
         while True:
             try:
@@ -924,13 +1392,34 @@ class Surface(threading.Thread):
 
         self.hostname = socket.gethostname()
 
+        register_local_surface(self.serversocket.getsockname()[0], self.port, self.dispatch)
+
+    def dispatch(self, request: dict) -> dict:
+        """ respond to a request from a user in this process, on one of our LocalSurface threads, without a socket. """
+
+        return IncomingFrameThread(
+            None,
+            self.user,
+            self.assemblers,
+            self.connections,
+            self.accept_public_keys
+        ).respond(request)
+
     def run(self) -> None:
         while True:
             try:
                 # listen for incoming socket connections
                 # if we get one, then we spin up an IncomingFrameThread to handle it
+                self.connections.acquire()
                 (clientsocket, address) = self.serversocket.accept()
-                st = IncomingFrameThread(clientsocket, self.username)
+                clientsocket.settimeout(SOCKET_TIMEOUT)
+                st = IncomingFrameThread(
+                    clientsocket,
+                    self.user,
+                    self.assemblers,
+                    self.connections,
+                    self.accept_public_keys
+                )
                 st.start()
             except ConnectionAbortedError:
-                pass
+                self.connections.release()
@@ -1,5 +1,18 @@
 """ __init__.py for this module. """
 
-from .user import User
+from .user import User, PUBLIC_KEY_POLICIES, SEEK_HOPS
+from .routing import RoutingTable
+from .damage import DamageQueue
+from .seek_scheduler import SeekScheduler, SeekRequest
+from .storage import DirectoryStorage, SQLiteStorage, migrate_to_sqlite
 
 assert User
+assert PUBLIC_KEY_POLICIES
+assert SEEK_HOPS
+assert DirectoryStorage
+assert SQLiteStorage
+assert migrate_to_sqlite
+assert SeekScheduler
+assert SeekRequest
+assert RoutingTable
+assert DamageQueue
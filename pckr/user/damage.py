@@ -0,0 +1,187 @@
+"""
+
+this file contains the queue that net_topo_damaged reports go through, for every User in
+this process.
+
+a check_net_topo that finds a user someone has a different ip:port for tells all of its
+contacts, and each of them flushes that user and seeks them. that used to be a frame for
+every contact for every damaged user, from everyone who noticed, and every one of them
+was flushed and sought right away, and the seeks went all the way through the network.
+one stale entry could set the whole network seeking, over and over.
+
+now a user tells their contacts about every damaged user they found in one frame each,
+and doesn't tell them about the same one again for a while. a user who is told flushes
+each damaged user only once in that while as well, and not straight away: the flushes
+are queued, and a background worker works through them at a steady rate. the seeks go
+through the seek scheduler, so there is only ever one out for each user.
+
+"""
+
+from collections import OrderedDict
+import threading
+import time
+
+from ..frame import DuplicateFilter
+
+
+class DamageQueue:
+    """ this class is one user's net_topo_damaged reports, both ways. """
+
+    # a damaged user is only reported, and only flushed, once in this many seconds
+    window = 300.0
+
+    # how many flushes a second, with bursts of up to this many
+    rate = 1.0
+    burst = 5
+
+    # how many flushes can wait at once, the rest are dropped
+    max_pending = 1024
+
+    _instances = dict()
+    _instances_lock = threading.Lock()
+
+    @classmethod
+    def for_user(cls, username: str) -> 'DamageQueue':
+        """
+        return the DamageQueue for username, creating it the first time it is asked for.
+
+        Parameters
+        ----------
+        username: str
+            the user
+
+        Returns
+        -------
+        DamageQueue
+            the one DamageQueue for that user in this process
+        """
+
+        with cls._instances_lock:
+            if username not in cls._instances:
+                cls._instances[username] = cls()
+            return cls._instances[username]
+
+    def __init__(self, window: float = None, rate: float = None, burst: int = None):
+        if window is not None:
+            self.window = window
+        if rate is not None:
+            self.rate = rate
+        if burst is not None:
+            self.burst = burst
+
+        self.reported = DuplicateFilter(ttl=self.window)
+        self.flushed = DuplicateFilter(ttl=self.window)
+
+        # hashed username -> what flushes them, oldest first
+        self.pending = OrderedDict()
+
+        self.lock = threading.Lock()
+        self.condition = threading.Condition(self.lock)
+        self.worker = None
+        self.tokens = float(self.burst)
+        self.refilled_at = time.time()
+        self.stats = dict(reported=0, suppressed=0, queued=0, dropped=0, flushed=0, failed=0)
+
+    def to_report(self, hashed_usernames: list) -> list:
+        """
+        return the damaged users that haven't been reported lately, and remember they have been now.
+
+        Parameters
+        ----------
+        hashed_usernames: list
+            the hashed usernames of the damaged users that were found
+
+        Returns
+        -------
+        list
+            the ones to report
+        """
+
+        report = [h for h in dict.fromkeys(hashed_usernames) if self.reported.check(h) is False]
+
+        with self.lock:
+            self.stats['reported'] = self.stats['reported'] + len(report)
+            self.stats['suppressed'] = self.stats['suppressed'] + len(hashed_usernames) - len(report)
+
+        return report
+
+    def enqueue(self, hashed_usernames: list, flush) -> int:
+        """
+        queue damaged users to be flushed, unless they were flushed lately or are already queued.
+
+        Parameters
+        ----------
+        hashed_usernames: list
+            the hashed usernames of the damaged users
+
+        flush: callable
+            flushes one of them, given their hashed username
+
+        Returns
+        -------
+        int
+            how many were queued
+        """
+
+        queued = 0
+        with self.condition:
+            for h in dict.fromkeys(hashed_usernames):
+                if h in self.pending:
+                    self.stats['suppressed'] = self.stats['suppressed'] + 1
+                elif len(self.pending) >= self.max_pending:
+                    self.stats['dropped'] = self.stats['dropped'] + 1
+                elif self.flushed.check(h) is True:
+                    self.stats['suppressed'] = self.stats['suppressed'] + 1
+                else:
+                    self.pending[h] = flush
+                    queued = queued + 1
+
+            self.stats['queued'] = self.stats['queued'] + queued
+
+            if queued > 0:
+                if self.worker is None:
+                    self.worker = threading.Thread(target=self._work)
+                    self.worker.daemon = True
+                    self.worker.start()
+                self.condition.notify_all()
+
+        return queued
+
+    def _take(self) -> tuple:
+        """ wait for a flush, and for the rate to allow it, and take it off the queue. """
+
+        with self.condition:
+            while len(self.pending) == 0:
+                self.condition.wait()
+
+            now = time.time()
+            self.tokens = min(float(self.burst), self.tokens + (now - self.refilled_at) * self.rate)
+            self.refilled_at = now
+
+            if self.tokens < 1:
+                wait = (1 - self.tokens) / self.rate
+            else:
+                self.tokens = self.tokens - 1
+                return self.pending.popitem(last=False)
+
+        time.sleep(wait)
+        return None
+
+    def _work(self) -> None:
+        """ the background worker: flush queued users, no faster than the rate. """
+
+        while True:
+            taken = self._take()
+            if taken is None:
+                continue
+
+            h, flush = taken
+            try:
+                flush(h)
+                outcome = 'flushed'
+            except Exception:
+                # one bad flush shouldn't stop the rest
+                outcome = 'failed'
+
+            with self.lock:
+                self.stats[outcome] = self.stats[outcome] + 1
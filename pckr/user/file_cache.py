@@ -0,0 +1,81 @@
+"""
+
+this file contains a small cache for files that are read far more often than they change.
+
+the private key is read for every rsa decryption, current_ip_port.json for every frame that
+tells someone where we are, and contact public keys for every frame we encrypt to them.
+FileCache keeps what it read, and only reads a file again when its mtime, size or inode
+changed, so another process (or a person) changing the file is still noticed.
+
+"""
+
+from collections import OrderedDict
+import os
+import threading
+
+
+class FileCache:
+    """ this class keeps the contents of recently read files, parsed, for as long as they don't change. """
+
+    def __init__(self, max_files: int = 1024):
+        self.max_files = max_files
+        self.files = OrderedDict()
+        self.lock = threading.Lock()
+
+    def read(self, path: str, parse=None):
+        """
+        return the contents of path, read again only if the file changed.
+
+        Parameters
+        ----------
+        path: str
+            the path to the file
+
+        parse: callable
+            what to turn the text into, ie: json.loads. the parsed value is what is cached,
+            so don't change it
+
+        Returns
+        -------
+        str or whatever parse returns
+            the contents, or None if there is no such file
+        """
+
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            with self.lock:
+                self.files.pop(path, None)
+            return None
+
+        stamp = (st.st_ino, st.st_mtime_ns, st.st_size)
+        with self.lock:
+            cached = self.files.get(path)
+            if cached is not None and cached[0] == stamp:
+                self.files.move_to_end(path)
+                return cached[1]
+
+        try:
+            text = open(path).read()
+        except FileNotFoundError:
+            return None
+
+        value = parse(text) if parse is not None else text
+
+        with self.lock:
+            self.files[path] = (stamp, value)
+            self.files.move_to_end(path)
+            while len(self.files) > self.max_files:
+                self.files.popitem(last=False)
+
+        return value
+
+    def forget(self, path: str) -> None:
+        """ drop path from the cache, ie: right after writing it. """
+
+        with self.lock:
+            self.files.pop(path, None)
+
+
+# one for the whole process, shared by every User
+file_cache = FileCache()
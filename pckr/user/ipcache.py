@@ -0,0 +1,422 @@
+"""
+
+this file contains the in-memory ipcache that every User in this process shares.
+
+the ipcache used to be read and parsed from cache.json on every access, and every User
+instance kept its own copy of it to write back, so two threads could easily write over
+each other's changes. now there is one IPCache per cache.json per process. reads come
+from memory, and if the files change underneath us (another process, like the command
+line client, wrote to them) we notice by their mtime and size and load them again.
+
+changes don't rewrite cache.json anymore. they are appended to a small journal next to
+it (cache.journal, one json line per change) by a background writer, which waits a
+moment first so that everything that changes in the meantime goes out in one append, and
+the last change to a contact wins. once the journal is long enough it is compacted into
+cache.json, which is written to a temp file and moved into place, so readers never see
+half of it. the journal is locked while it is appended to or compacted, so that more
+than one process can share it.
+
+check_net_topo and net_topo_damaged work on the hashed ipcache, the hashed usernames
+mapped to the hash of their ip:port, which used to be worked out from scratch, a sha256
+and a json dump for every contact, every time it was needed. the ipcache keeps it up to
+date as contacts change instead, along with which username each hash belongs to.
+
+"""
+
+from collections import OrderedDict
+import atexit
+import fcntl
+import json
+import os
+import threading
+import time
+
+from ..utilities import str2hashed_hexstr
+
+
+def hash_ipcache_entry(entry: dict) -> str:
+    """ return the hash of an ipcache entry, as it goes into the hashed ipcache. """
+
+    return str2hashed_hexstr(json.dumps(entry))
+
+
+class HashedIndex:
+    """ this class is the hashed view of an ipcache, kept up to date one change at a time. """
+
+    def __init__(self):
+        # hashed username -> hashed ip:port
+        self.hashed = dict()
+
+        # hashed username -> username, and back
+        self.usernames = dict()
+        self.hashed_usernames = dict()
+
+        # the entries that were hashed, so they aren't hashed again if they come back the same
+        self.entries = dict()
+
+    def apply(self, username: str, entry: dict) -> None:
+        """ update the index for a change to username, entry is None if they were removed. """
+
+        if entry is None:
+            hashed_username = self.hashed_usernames.pop(username, None)
+            if hashed_username is not None:
+                self.usernames.pop(hashed_username, None)
+                self.hashed.pop(hashed_username, None)
+            self.entries.pop(username, None)
+            return
+
+        hashed_username = self.hashed_usernames.get(username)
+        if hashed_username is None:
+            hashed_username = str2hashed_hexstr(username)
+            self.hashed_usernames[username] = hashed_username
+            self.usernames[hashed_username] = username
+
+        if self.entries.get(username) != entry:
+            self.entries[username] = dict(entry)
+            self.hashed[hashed_username] = hash_ipcache_entry(entry)
+
+    def reset(self, data: dict) -> None:
+        """ bring the index in line with all of data, only hashing what changed. """
+
+        for username in list(self.hashed_usernames.keys()):
+            if username not in data:
+                self.apply(username, None)
+
+        for username, entry in data.items():
+            self.apply(username, entry)
+
+
+class IPCache:
+    """ this class holds one user's ipcache in memory, and keeps it in sync with disk. """
+
+    path = None
+    journal_path = None
+    data = None
+
+    # how long the writer waits for more changes before it appends them
+    coalesce_window = 0.1
+
+    # how many journal entries there can be before they are compacted into cache.json. a big
+    # ipcache is allowed a journal as long as itself, so rewriting it stays cheap per change
+    compact_after = 256
+
+    _instances = dict()
+    _instances_lock = threading.Lock()
+
+    @classmethod
+    def for_path(cls, path: str) -> 'IPCache':
+        """
+        return the IPCache for path, creating it the first time it is asked for.
+
+        Parameters
+        ----------
+        path: str
+            the path to cache.json
+
+        Returns
+        -------
+        IPCache
+            the one IPCache for that path in this process
+        """
+
+        with cls._instances_lock:
+            if path not in cls._instances:
+                cls._instances[path] = cls(path)
+                atexit.register(cls._instances[path].flush)
+            return cls._instances[path]
+
+    def __init__(self, path: str):
+        self.path = path
+        self.journal_path = "{}.journal".format(os.path.splitext(path)[0])
+        self.data = dict()
+
+        self.snapshot_stamp = None
+        self.journal_offset = 0
+        self.journal_entries = 0
+
+        # changes that are in memory but not in the journal yet, username -> entry or None
+        self.pending = OrderedDict()
+
+        self.stats = dict(changes=0, appends=0, compactions=0)
+
+        self.lock = threading.RLock()
+        self.condition = threading.Condition(self.lock)
+        self.writer = None
+
+        self.index = HashedIndex()
+
+    def _stat(self, path: str) -> tuple:
+        try:
+            st = os.stat(path)
+            return (st.st_mtime_ns, st.st_size)
+        except FileNotFoundError:
+            return None
+
+    def _apply(self, username: str, entry: dict) -> None:
+        if entry is None:
+            self.data.pop(username, None)
+        else:
+            self.data[username] = entry
+        self.index.apply(username, entry)
+
+    def _load(self) -> None:
+        """ load cache.json from scratch, and replay the whole journal on top of it. """
+
+        self.snapshot_stamp = self._stat(self.path)
+        self.journal_offset = 0
+        self.journal_entries = 0
+
+        data = dict()
+        if self.snapshot_stamp is not None:
+            try:
+                data = json.loads(open(self.path).read())
+            except json.decoder.JSONDecodeError:
+                pass
+            except FileNotFoundError:
+                self.snapshot_stamp = None
+        self.data = data
+        self.index.reset(data)
+
+    def _replay(self) -> None:
+        """ apply whatever was appended to the journal since we last looked at it. """
+
+        try:
+            with open(self.journal_path, "rb") as f:
+                f.seek(self.journal_offset)
+                tail = f.read()
+        except FileNotFoundError:
+            return
+
+        # somebody might be half way through appending, leave that for next time
+        end = tail.rfind(b"\n") + 1
+        for line in tail[:end].splitlines():
+            try:
+                change = json.loads(line.decode())
+            except (json.decoder.JSONDecodeError, UnicodeDecodeError):
+                continue
+            self._apply(change['username'], change['entry'])
+            self.journal_entries = self.journal_entries + 1
+
+        self.journal_offset = self.journal_offset + end
+
+    def _refresh(self) -> None:
+        """ catch up with the disk, but only read what changed since we last looked. """
+
+        journal_stamp = self._stat(self.journal_path)
+        journal_size = journal_stamp[1] if journal_stamp is not None else 0
+
+        if self._stat(self.path) != self.snapshot_stamp or journal_size < self.journal_offset:
+            # cache.json was replaced, or the journal was compacted, so start over
+            self._load()
+        elif journal_size == self.journal_offset:
+            return
+
+        self._replay()
+
+        # and our own changes still win over what is on disk
+        for username, entry in self.pending.items():
+            self._apply(username, entry)
+
+    def _lock_journal(self):
+        directory = os.path.dirname(self.journal_path)
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+        f = open(self.journal_path, "ab")
+        fcntl.flock(f, fcntl.LOCK_EX)
+        return f
+
+    def _compact(self, journal) -> None:
+        """ write everything to cache.json and empty the journal. journal must be locked. """
+
+        tmp_path = "{}.{}.{}.tmp".format(self.path, os.getpid(), threading.get_ident())
+        with open(tmp_path, "w+") as f:
+            f.write(json.dumps(self.data))
+        os.replace(tmp_path, self.path)
+
+        journal.truncate(0)
+
+        self.snapshot_stamp = self._stat(self.path)
+        self.journal_offset = 0
+        self.journal_entries = 0
+        self.stats['compactions'] = self.stats['compactions'] + 1
+
+    def _write(self) -> None:
+        """ the background writer: wait for changes, let them pile up a little, append them. """
+
+        while True:
+            with self.condition:
+                while len(self.pending) == 0:
+                    self.condition.wait()
+
+            time.sleep(self.coalesce_window)
+            self.flush()
+
+    def _changed(self, username: str, entry: dict) -> None:
+        self._apply(username, entry)
+        self.pending[username] = entry
+        self.pending.move_to_end(username)
+        self.stats['changes'] = self.stats['changes'] + 1
+
+        if self.writer is None:
+            self.writer = threading.Thread(target=self._write)
+            self.writer.daemon = True
+            self.writer.start()
+
+        self.condition.notify_all()
+
+    def flush(self) -> bool:
+        """
+        append every pending change to the journal right now, compacting it if it is time.
+
+        the background writer calls this, and it is called when the process exits.
+
+        Returns
+        -------
+        bool
+            True if anything was written
+        """
+
+        with self.lock:
+            if len(self.pending) == 0:
+                return False
+
+            journal = self._lock_journal()
+            try:
+                # pick up what other processes appended first, so the order stays right
+                pending = self.pending
+                self.pending = OrderedDict()
+                self._refresh()
+
+                journal.write(b"".join(
+                    (json.dumps(dict(username=username, entry=entry)) + "\n").encode()
+                    for username, entry in pending.items()
+                ))
+                journal.flush()
+                self.stats['appends'] = self.stats['appends'] + 1
+
+                for username, entry in pending.items():
+                    self._apply(username, entry)
+                self._replay()
+
+                if self.journal_entries >= max(self.compact_after, len(self.data)):
+                    self._compact(journal)
+            finally:
+                fcntl.flock(journal, fcntl.LOCK_UN)
+                journal.close()
+
+        return True
+
+    def snapshot(self) -> dict:
+        """
+        return a copy of the cache, safe to loop over while other threads change it.
+
+        Returns
+        -------
+        dict
+            usernames mapped to dict(ip=..., port=...)
+        """
+
+        with self.lock:
+            self._refresh()
+            return dict(self.data)
+
+    def hashed(self) -> dict:
+        """
+        return the hashed ipcache.
+
+        Returns
+        -------
+        dict
+            the hashed usernames mapped to the hash of their entries
+        """
+
+        with self.lock:
+            self._refresh()
+            return dict(self.index.hashed)
+
+    def hashed_usernames(self) -> dict:
+        """
+        return every username in the cache mapped to its hash.
+
+        Returns
+        -------
+        dict
+            usernames mapped to hashed usernames
+        """
+
+        with self.lock:
+            self._refresh()
+            return dict(self.index.hashed_usernames)
+
+    def username_for_hash(self, hashed_username: str) -> str:
+        """
+        return the username in the cache that hashes to hashed_username.
+
+        Returns
+        -------
+        str
+            the username, or None if nobody in the cache does
+        """
+
+        with self.lock:
+            self._refresh()
+            return self.index.usernames.get(hashed_username)
+
+    def get(self, username: str) -> dict:
+        """
+        return the entry for username.
+
+        Parameters
+        ----------
+        username: str
+            the username of the contact
+
+        Returns
+        -------
+        dict
+            dict(ip=..., port=...), or None if we don't have them
+        """
+
+        with self.lock:
+            self._refresh()
+            return self.data.get(username)
+
+    def set(self, username: str, ip: str, port: int) -> bool:
+        """
+        set the ip:port for username. it is written out by the background writer.
+
+        Returns
+        -------
+        bool
+            True if anything changed
+        """
+
+        entry = dict(ip=ip, port=port)
+        with self.lock:
+            self._refresh()
+            if self.data.get(username) == entry:
+                return False
+
+            self._changed(username, entry)
+
+        return True
+
+    def remove(self, username: str) -> bool:
+        """
+        forget about username. it is written out by the background writer.
+
+        Returns
+        -------
+        bool
+            True if anything changed
+        """
+
+        with self.lock:
+            self._refresh()
+            if username not in self.data:
+                return False
+
+            self._changed(username, None)
+
+        return True
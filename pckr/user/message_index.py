@@ -0,0 +1,216 @@
+"""
+
+this file contains the index of messages a user has received, for the directory layout.
+
+listing messages used to mean os.listdir on messages/ and then an os.walk through every
+message in it. now the receiver adds a line to message_index.jsonl when a message is
+complete (who sent it, its filename, size, chunk count and when it arrived), and listings
+are served from that, in memory. the file is only read again when it changes. it can be
+rebuilt from what is under messages/ with `pckr rebuild_message_index`.
+
+"""
+
+from collections import OrderedDict
+import fcntl
+import json
+import os
+import threading
+
+
+def filter_messages(
+    entries: list,
+    offset: int = 0,
+    limit: int = None,
+    sender: str = None,
+    filename: str = None,
+    since: float = None
+) -> list:
+    """
+    filter index entries and return one page of them, newest first.
+
+    Parameters
+    ----------
+    entries: list
+        the index entries
+
+    offset: int
+        how many matching entries to skip
+
+    limit: int
+        how many to return at most, None for all of them
+
+    sender: str
+        only messages from this user
+
+    filename: str
+        only messages with this in their filename
+
+    since: float
+        only messages completed at or after this timestamp
+
+    Returns
+    -------
+    list
+        the page of entries
+    """
+
+    matching = [e for e in entries if (
+        (sender is None or e.get('sender') == sender) and
+        (filename is None or filename in (e.get('filename') or '')) and
+        (since is None or e.get('completed_at', 0) >= since)
+    )]
+    matching.sort(key=lambda e: e.get('completed_at', 0), reverse=True)
+
+    if limit is None:
+        return matching[offset:]
+    return matching[offset:offset + limit]
+
+
+class MessageIndex:
+    """ this class holds one user's message index in memory, and keeps it in sync with disk. """
+
+    path = None
+
+    _instances = dict()
+    _instances_lock = threading.Lock()
+
+    @classmethod
+    def for_path(cls, path: str) -> 'MessageIndex':
+        """
+        return the MessageIndex for path, creating it the first time it is asked for.
+
+        Parameters
+        ----------
+        path: str
+            the path to message_index.jsonl
+
+        Returns
+        -------
+        MessageIndex
+            the one MessageIndex for that path in this process
+        """
+
+        with cls._instances_lock:
+            if path not in cls._instances:
+                cls._instances[path] = cls(path)
+            return cls._instances[path]
+
+    def __init__(self, path: str):
+        self.path = path
+        self.entries = OrderedDict()
+        self.stamp = None
+        self.offset = 0
+        self.lock = threading.Lock()
+
+    def _stat(self) -> tuple:
+        try:
+            st = os.stat(self.path)
+            return (st.st_ino, st.st_size)
+        except FileNotFoundError:
+            return None
+
+    def _refresh(self) -> None:
+        """ read whatever was added to the index since we last looked, or all of it if it was rebuilt. """
+
+        stamp = self._stat()
+        if stamp == self.stamp:
+            return
+
+        if stamp is None or self.stamp is None or stamp[0] != self.stamp[0] or stamp[1] < self.offset:
+            self.entries = OrderedDict()
+            self.offset = 0
+
+        try:
+            with open(self.path, "rb") as f:
+                f.seek(self.offset)
+                tail = f.read()
+        except FileNotFoundError:
+            tail = b""
+
+        end = tail.rfind(b"\n") + 1
+        for line in tail[:end].splitlines():
+            try:
+                entry = json.loads(line.decode())
+            except (json.decoder.JSONDecodeError, UnicodeDecodeError):
+                continue
+            self.entries.pop(entry['message_id'], None)
+            self.entries[entry['message_id']] = entry
+
+        self.offset = self.offset + end
+        self.stamp = (stamp[0], self.offset) if stamp is not None else None
+
+    def _locked(self):
+        """ open the index for appending and lock it, making sure it wasn't replaced in the meantime. """
+
+        while True:
+            f = open(self.path, "ab")
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                if os.fstat(f.fileno()).st_ino == os.stat(self.path).st_ino:
+                    return f
+            except FileNotFoundError:
+                pass
+            fcntl.flock(f, fcntl.LOCK_UN)
+            f.close()
+
+    def add(self, entry: dict) -> bool:
+        """
+        add a completed message to the index.
+
+        Returns
+        -------
+        bool
+            usually True
+        """
+
+        with self.lock:
+            f = self._locked()
+            try:
+                f.write((json.dumps(entry) + "\n").encode())
+                f.flush()
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+                f.close()
+
+            self._refresh()
+
+        return True
+
+    def replace(self, entries: list) -> bool:
+        """
+        replace the whole index, ie: after rebuilding it from disk.
+
+        Returns
+        -------
+        bool
+            usually True
+        """
+
+        with self.lock:
+            f = self._locked()
+            try:
+                tmp_path = "{}.{}.{}.tmp".format(self.path, os.getpid(), threading.get_ident())
+                with open(tmp_path, "w+") as tmp:
+                    tmp.write("".join(json.dumps(entry) + "\n" for entry in entries))
+                os.replace(tmp_path, self.path)
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+                f.close()
+
+            self._refresh()
+
+        return True
+
+    def list(self, **filters) -> list:
+        """ return one page of entries, newest first. takes the same filters as filter_messages. """
+
+        with self.lock:
+            self._refresh()
+            entries = list(self.entries.values())
+
+        return filter_messages(entries, **filters)
+
+    def count(self, **filters) -> int:
+        """ return how many entries match the filters. """
+
+        return len(self.list(**filters))
@@ -0,0 +1,203 @@
+"""
+
+this file contains the routing table for the dht that users can find each other through.
+
+a seek_user frame is flooded (or gossiped) through everyone within a few hops, which
+costs a frame for most of the users in that neighbourhood, and never finds anyone further
+away. with the dht every user also keeps a kademlia routing table: the hashed usernames
+of users they have heard from, and where they are, sorted into k-buckets by how far (xor)
+each hashed username is from their own. to find someone you ask the users you know of
+closest to their hashed username for the users they know of closest to it, and ask those,
+until you hear about the hashed username itself or nobody knows of anyone closer. that takes
+on the order of log(n) rounds of alpha frames each.
+
+what the dht hands out is just where a hashed username was last heard from. the seek_user
+frame then goes straight there, encrypted the same as ever, and only the real user can
+answer it with the seek token, so a wrong or stale address costs a frame and nothing
+more. scripts/dht_simulation.py compares it with the flood.
+
+"""
+
+import threading
+
+# every id is a sha256, as a hex string
+ID_BITS = 256
+
+
+def distance(id1: str, id2: str) -> int:
+    """ return the xor distance between two hashed usernames. """
+
+    return int(id1, 16) ^ int(id2, 16)
+
+
+class RoutingTable:
+    """ this class holds the k-buckets of the users one user can route dht lookups through. """
+
+    # how many users each bucket holds, and how many a lookup ends up with
+    k = 20
+
+    # how many users are asked at once in each round of a lookup
+    alpha = 3
+
+    _instances = dict()
+    _instances_lock = threading.Lock()
+
+    @classmethod
+    def for_user(cls, username: str, node_id: str) -> 'RoutingTable':
+        """
+        return the RoutingTable for username, creating it the first time it is asked for.
+
+        Parameters
+        ----------
+        username: str
+            the user
+
+        node_id: str
+            their hashed username
+
+        Returns
+        -------
+        RoutingTable
+            the one RoutingTable for that user in this process
+        """
+
+        with cls._instances_lock:
+            if username not in cls._instances:
+                cls._instances[username] = cls(node_id)
+            return cls._instances[username]
+
+    def __init__(self, node_id: str, k: int = None, alpha: int = None):
+        if k is not None:
+            self.k = k
+        if alpha is not None:
+            self.alpha = alpha
+
+        self.node_id = node_id
+
+        # bucket i holds the ids that are between 2 ** i and 2 ** (i + 1) away, each of them
+        # mapped to (ip, port), the least recently heard from first
+        self.buckets = [dict() for _ in range(ID_BITS)]
+        self.lock = threading.Lock()
+
+    def _bucket(self, node_id: str) -> dict:
+        return self.buckets[distance(self.node_id, node_id).bit_length() - 1]
+
+    def add(self, node_id: str, ip: str, port: int) -> bool:
+        """
+        remember that node_id was heard from at ip:port.
+
+        a full bucket keeps the users it already has, they've been around longer, and users
+        who stay around tend to stay around. the ones that stop answering are removed.
+
+        Returns
+        -------
+        bool
+            True if node_id is in the table now
+        """
+
+        if node_id == self.node_id:
+            return False
+
+        with self.lock:
+            bucket = self._bucket(node_id)
+            if node_id in bucket:
+                # move them to the back, as the most recently heard from
+                del bucket[node_id]
+            elif len(bucket) >= self.k:
+                return False
+
+            bucket[node_id] = (ip, int(port))
+
+        return True
+
+    def remove(self, node_id: str) -> bool:
+        """ forget node_id, because they didn't answer. """
+
+        if node_id == self.node_id:
+            return False
+
+        with self.lock:
+            return self._bucket(node_id).pop(node_id, None) is not None
+
+    def __len__(self) -> int:
+        return sum(len(bucket) for bucket in self.buckets)
+
+    def __contains__(self, node_id: str) -> bool:
+        return node_id != self.node_id and node_id in self._bucket(node_id)
+
+    def closest(self, target: str, count: int = None) -> list:
+        """
+        return the users in the table closest to target.
+
+        Parameters
+        ----------
+        target: str
+            the hashed username being looked for
+
+        count: int
+            how many, k if None
+
+        Returns
+        -------
+        list
+            dicts of id, ip and port, closest first
+        """
+
+        with self.lock:
+            nodes = [
+                dict(id=node_id, ip=ip, port=port)
+                for bucket in self.buckets
+                for node_id, (ip, port) in bucket.items()
+            ]
+
+        nodes.sort(key=lambda node: distance(node['id'], target))
+        return nodes[:count or self.k]
+
+    def lookup(self, target: str, query) -> dict:
+        """
+        find target by asking the users closest to it who they know of that is closer.
+
+        Parameters
+        ----------
+        target: str
+            the hashed username being looked for
+
+        query: callable
+            takes the alpha users to ask in a round, and returns what each of them said:
+            a list of users (dicts of id, ip and port), or None if they didn't answer
+
+        Returns
+        -------
+        dict
+            found (the dict for target, or None), how many users were asked, and in how
+            many rounds
+        """
+
+        shortlist = dict((node['id'], node) for node in self.closest(target))
+        asked = set()
+        frames = 0
+        rounds = 0
+
+        while target not in shortlist:
+            closest = sorted(shortlist.values(), key=lambda node: distance(node['id'], target))[:self.k]
+            to_ask = [node for node in closest if node['id'] not in asked][:self.alpha]
+            if len(to_ask) == 0:
+                break
+
+            for node in to_ask:
+                asked.add(node['id'])
+            frames = frames + len(to_ask)
+            rounds = rounds + 1
+
+            for node, nodes in zip(to_ask, query(to_ask)):
+                if nodes is None:
+                    self.remove(node['id'])
+                    shortlist.pop(node['id'], None)
+                    continue
+
+                self.add(node['id'], node['ip'], node['port'])
+                for n in nodes:
+                    if n['id'] != self.node_id and n['id'] not in asked:
+                        shortlist.setdefault(n['id'], n)
+
+        return dict(found=shortlist.get(target), frames=frames, rounds=rounds)
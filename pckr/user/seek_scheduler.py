@@ -0,0 +1,190 @@
+"""
+
+this file contains the seek scheduler that every User in this process shares.
+
+every seek_user starts a frame that goes through most of the network. the surface seeks
+everyone it can't ping, or who fails a challenge, on every sweep, and flushes and seeks
+again on every net_topo_damaged frame, so in a network where users come and go the same
+user could be sought many times over before the first seek has had a chance to come back.
+the scheduler makes sure there is only ever one seek out for each user: asking for another
+while one is out, or too soon after the last, gets the one that is already out. the time
+between seeks for a user doubles every time one goes unanswered, up to max_interval, and
+goes back to min_interval once they are found.
+
+"""
+
+import threading
+import time
+
+
+class SeekRequest:
+    """ this class is one seek for a user, that every caller asking for it while it is out shares. """
+
+    def __init__(self, user2: str):
+        self.user2 = user2
+        self.started_at = time.time()
+        self.sent = None
+        self.found = None
+        self.event = threading.Event()
+
+    @property
+    def done(self) -> bool:
+        return self.event.is_set()
+
+    def resolve(self, found: dict = None) -> None:
+        """ mark the seek as answered, with where user2 was found, or None if it never went out. """
+
+        self.found = found
+        self.event.set()
+
+    def wait(self, timeout: float = None) -> dict:
+        """
+        wait for the seek to be answered.
+
+        Parameters
+        ----------
+        timeout: float
+            how long to wait, in seconds. None to wait until it is answered
+
+        Returns
+        -------
+        dict
+            the ip and port user2 was found at, or None if they weren't found in time
+        """
+
+        self.event.wait(timeout)
+        return self.found
+
+
+class SeekScheduler:
+    """ this class keeps one user's seeks down to one at a time for each user they look for. """
+
+    # the shortest time between two seeks for the same user, in seconds
+    min_interval = 30.0
+
+    # the longest, after many have gone unanswered
+    max_interval = 900.0
+
+    _instances = dict()
+    _instances_lock = threading.Lock()
+
+    @classmethod
+    def for_user(cls, username: str) -> 'SeekScheduler':
+        """
+        return the SeekScheduler for username, creating it the first time it is asked for.
+
+        Parameters
+        ----------
+        username: str
+            the user doing the seeking
+
+        Returns
+        -------
+        SeekScheduler
+            the one SeekScheduler for that user in this process
+        """
+
+        with cls._instances_lock:
+            if username not in cls._instances:
+                cls._instances[username] = cls()
+            return cls._instances[username]
+
+    def __init__(self, min_interval: float = None, max_interval: float = None):
+        if min_interval is not None:
+            self.min_interval = min_interval
+        if max_interval is not None:
+            self.max_interval = max_interval
+
+        # user2 -> the last SeekRequest for them
+        self.requests = dict()
+
+        # user2 -> when the next seek for them can go out
+        self.next_at = dict()
+
+        # user2 -> how many seeks in a row went unanswered
+        self.failures = dict()
+
+        self.lock = threading.Lock()
+        self.stats = dict(requested=0, sent=0, coalesced=0, found=0)
+
+    def interval(self, user2: str) -> float:
+        """ return how long after the next seek for user2 the one after it can go out. """
+
+        return min(self.min_interval * (2 ** self.failures.get(user2, 0)), self.max_interval)
+
+    def schedule(self, user2: str, seek) -> SeekRequest:
+        """
+        seek user2, unless there is already a seek out for them.
+
+        Parameters
+        ----------
+        user2: str
+            who we're looking for
+
+        seek: callable
+            sends the seek_user frames, and returns False if it couldn't
+
+        Returns
+        -------
+        SeekRequest
+            the seek that is out for user2, whether it was started now or earlier
+        """
+
+        now = time.time()
+        with self.lock:
+            self.stats['requested'] = self.stats['requested'] + 1
+
+            request = self.requests.get(user2)
+            if request is not None and now < self.next_at.get(user2, 0):
+                self.stats['coalesced'] = self.stats['coalesced'] + 1
+                return request
+
+            # the last one ran its course without an answer, so back off further
+            if request is not None and request.found is None:
+                self.failures[user2] = self.failures.get(user2, 0) + 1
+
+            request = SeekRequest(user2)
+            self.requests[user2] = request
+            self.next_at[user2] = now + self.interval(user2)
+
+        request.sent = seek()
+
+        if request.sent is False:
+            request.resolve(None)
+        else:
+            with self.lock:
+                self.stats['sent'] = self.stats['sent'] + 1
+
+        return request
+
+    def resolve(self, user2: str, ip: str, port: int) -> bool:
+        """
+        let anyone waiting on the seek for user2 know where they were found.
+
+        Parameters
+        ----------
+        user2: str
+            who was found
+
+        ip: str
+            their ip
+
+        port: int
+            their port
+
+        Returns
+        -------
+        bool
+            True if there was a seek out for them
+        """
+
+        with self.lock:
+            request = self.requests.get(user2)
+            if request is None or request.done:
+                return False
+
+            self.failures.pop(user2, None)
+            self.stats['found'] = self.stats['found'] + 1
+
+        request.resolve(dict(ip=ip, port=port))
+        return True
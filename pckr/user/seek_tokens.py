@@ -0,0 +1,231 @@
+"""
+
+this file contains the seek token store that every User in this process shares.
+
+every seek_user sends out a new seek token, and the seek_user_response that comes back
+has to carry one of them. tokens used to be appended to seek_tokens/<user2>.json forever
+and scanned one by one. now every token expires after a while, and is only good for one
+response. a user's tokens are kept in memory, mapped to when they expire so that looking
+one up doesn't mean scanning them all, and on disk in one small file
+(seek_tokens/tokens.json) that is written to a temp file and moved into place.
+expired tokens are collected every so often, so a node that seeks on every sweep only
+ever holds the tokens from the last few minutes.
+
+"""
+
+import json
+import os
+import threading
+import time
+
+
+class SeekTokenStore:
+    """ this class holds one user's outstanding seek tokens, and when each of them expires. """
+
+    path = None
+    ttl = 300.0
+    gc_interval = 60.0
+
+    _instances = dict()
+    _instances_lock = threading.Lock()
+
+    @classmethod
+    def for_path(cls, path: str) -> 'SeekTokenStore':
+        """
+        return the SeekTokenStore for path, creating it the first time it is asked for.
+
+        Parameters
+        ----------
+        path: str
+            the path to tokens.json
+
+        Returns
+        -------
+        SeekTokenStore
+            the one SeekTokenStore for that path in this process
+        """
+
+        with cls._instances_lock:
+            if path not in cls._instances:
+                cls._instances[path] = cls(path)
+            return cls._instances[path]
+
+    def __init__(self, path: str):
+        self.path = path
+        self.tokens = dict()
+        self.stamp = None
+        self.loaded = False
+        self.collected_at = 0
+        self.lock = threading.Lock()
+
+    def _stat(self) -> tuple:
+        try:
+            st = os.stat(self.path)
+            return (st.st_mtime_ns, st.st_size)
+        except FileNotFoundError:
+            return None
+
+    def _import_legacy(self) -> bool:
+        """ fold the old seek_tokens/<user2>.json files in, they expire ttl after they were written. """
+
+        directory = os.path.dirname(self.path)
+        if not os.path.exists(directory):
+            return False
+
+        changed = False
+        for f in os.listdir(directory):
+            legacy_path = os.path.join(directory, f)
+            if legacy_path == self.path or not f.endswith('.json'):
+                continue
+
+            try:
+                seek_tokens = json.loads(open(legacy_path).read() or '[]')
+                expires_at = os.path.getmtime(legacy_path) + self.ttl
+            except (json.decoder.JSONDecodeError, FileNotFoundError):
+                continue
+
+            if type(seek_tokens) == list:
+                user_tokens = self.tokens.setdefault(f[:-len('.json')], dict())
+                for seek_token in seek_tokens:
+                    user_tokens[seek_token] = expires_at
+
+            os.remove(legacy_path)
+            changed = True
+
+        return changed
+
+    def _refresh(self) -> None:
+        """ load tokens.json again if another process changed it. """
+
+        stamp = self._stat()
+        if self.loaded and stamp == self.stamp:
+            return
+
+        tokens = dict()
+        if stamp is not None:
+            try:
+                tokens = json.loads(open(self.path).read())
+            except (json.decoder.JSONDecodeError, FileNotFoundError):
+                pass
+
+        self.tokens = tokens
+        self.stamp = stamp
+        self.loaded = True
+
+        if self._import_legacy():
+            self._write()
+
+    def _write(self) -> None:
+        directory = os.path.dirname(self.path)
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+        tmp_path = "{}.{}.{}.tmp".format(self.path, os.getpid(), threading.get_ident())
+        with open(tmp_path, "w+") as f:
+            f.write(json.dumps(self.tokens))
+        os.replace(tmp_path, self.path)
+
+        self.stamp = self._stat()
+
+    def _collect(self, now: float) -> bool:
+        """ drop every expired token, if it's been a while since we last did. """
+
+        if now - self.collected_at < self.gc_interval:
+            return False
+        self.collected_at = now
+
+        changed = False
+        for user2 in list(self.tokens.keys()):
+            user_tokens = self.tokens[user2]
+            for seek_token in [t for t, expires_at in user_tokens.items() if expires_at <= now]:
+                del user_tokens[seek_token]
+                changed = True
+            if len(user_tokens) == 0:
+                del self.tokens[user2]
+                changed = True
+
+        return changed
+
+    def add(self, user2: str, seek_token: str) -> bool:
+        """
+        remember a seek token we are about to send out looking for user2.
+
+        Returns
+        -------
+        bool
+            usually True
+        """
+
+        now = time.time()
+        with self.lock:
+            self._refresh()
+            self._collect(now)
+            self.tokens.setdefault(user2, dict())[seek_token] = now + self.ttl
+            self._write()
+
+        return True
+
+    def consume(self, user2: str, seek_token: str) -> bool:
+        """
+        use up a seek token that came back from user2.
+
+        Returns
+        -------
+        bool
+            True if it was one of ours, for user2, and hadn't expired or been used yet
+        """
+
+        now = time.time()
+        with self.lock:
+            self._refresh()
+            collected = self._collect(now)
+
+            user_tokens = self.tokens.get(user2, dict())
+            expires_at = user_tokens.pop(seek_token, None)
+            if len(user_tokens) == 0:
+                self.tokens.pop(user2, None)
+
+            if expires_at is not None or collected:
+                self._write()
+
+        return expires_at is not None and expires_at > now
+
+    def users(self) -> list:
+        """
+        return everyone we are waiting to hear back from.
+
+        Returns
+        -------
+        list
+            (user2, created_at, count) for each of them, where created_at is when the
+            last token for them was created and count is how many haven't expired
+        """
+
+        now = time.time()
+        with self.lock:
+            self._refresh()
+            return [(
+                user2,
+                max(user_tokens.values()) - self.ttl,
+                len([t for t, expires_at in user_tokens.items() if expires_at > now])
+            ) for user2, user_tokens in sorted(self.tokens.items()) if len(user_tokens) > 0]
+
+    def items(self) -> list:
+        """
+        return every token that hasn't expired yet.
+
+        Returns
+        -------
+        list
+            (user2, seek_token, expires_at) for each of them
+        """
+
+        now = time.time()
+        with self.lock:
+            self._refresh()
+            return [
+                (user2, seek_token, expires_at)
+                for user2, user_tokens in self.tokens.items()
+                for seek_token, expires_at in user_tokens.items()
+                if expires_at > now
+            ]
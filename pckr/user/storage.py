@@ -0,0 +1,664 @@
+"""
+
+this file contains the storage backends behind User.
+
+DirectoryStorage is the original layout, a directory per kind of record and a file per
+record (public_keys/<user2>/public.key, seek_tokens/<user2>.json, ...). listing anything
+means walking a directory and opening one file per record.
+
+SQLiteStorage keeps the same records in one sqlite database, store.sqlite3 in the user's
+directory, with indexes on username and on public key fingerprint. it runs in WAL mode so
+the threads of a surface can read while one of them writes. every thread gets its own
+connection.
+
+a user is on sqlite if store.sqlite3 exists, either because they were created with
+`pckr init_user --storage sqlite` or because they were moved over with
+`pckr migrate_storage`. message contents, seeds and the chunk index stay on disk either way.
+
+"""
+
+import datetime
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from ..utilities import str2hashed_hexstr
+from .ipcache import IPCache, hash_ipcache_entry
+from .seek_tokens import SeekTokenStore
+from .message_index import MessageIndex
+from .file_cache import file_cache
+
+
+SQLITE_FILENAME = "store.sqlite3"
+
+
+def public_key_fingerprint(public_key_text: str) -> str:
+    """ return the fingerprint of a public key, the hash of its text. """
+
+    return str2hashed_hexstr(public_key_text.strip())
+
+
+class DirectoryStorage:
+    """ this class stores a user's records as files under their directory. """
+
+    path = None
+
+    def __init__(self, path: str):
+        self.path = path
+        self.ipcache = IPCache.for_path(os.path.join(self.path, "ipcache", "cache.json"))
+        self.seek_token_store = SeekTokenStore.for_path(os.path.join(self.path, "seek_tokens", "tokens.json"))
+        self.message_index = MessageIndex.for_path(os.path.join(self.path, "message_index.jsonl"))
+
+    def _read_json_records(self, directory: str, filename: str) -> list:
+        records = []
+        for d, sds, files in os.walk(os.path.join(self.path, directory)):
+            for f in files:
+                if f == filename:
+                    record_path = os.path.join(d, f)
+                    with open(record_path) as f:
+                        record = json.loads(f.read())
+                        record.update(modified_at=datetime.datetime.fromtimestamp(os.path.getmtime(record_path)))
+                        records.append(record)
+        return records
+
+    def _write_json_record(self, directory: str, user2: str, filename: str, record: dict) -> bool:
+        record_path = os.path.join(self.path, directory, user2)
+        if not os.path.exists(record_path):
+            os.makedirs(record_path)
+
+        with open(os.path.join(record_path, filename), "w+") as f:
+            f.write(json.dumps(record))
+
+        return True
+
+    def _remove_json_record(self, directory: str, user2: str, filename: str) -> bool:
+        record_path = os.path.join(self.path, directory, user2, filename)
+        if os.path.exists(record_path):
+            os.remove(record_path)
+            return True
+
+        return False
+
+    # public_keys
+    def get_public_key(self, username: str) -> str:
+        return file_cache.read(os.path.join(self.path, "public_keys", username, "public.key"))
+
+    def store_public_key(self, username: str, public_key_text: str) -> bool:
+        public_keys_path = os.path.join(self.path, "public_keys", username)
+        if not os.path.exists(public_keys_path):
+            os.makedirs(public_keys_path)
+
+        with open(os.path.join(public_keys_path, "public.key"), "w+") as pkf:
+            pkf.write(public_key_text)
+        file_cache.forget(os.path.join(public_keys_path, "public.key"))
+
+        return True
+
+    def public_keys(self) -> list:
+        public_keys_path = os.path.join(self.path, "public_keys")
+        return [dict(
+            username=sd,
+            modified_at=datetime.datetime.fromtimestamp(
+                os.path.getmtime(os.path.join(public_keys_path, sd, 'public.key'))
+            )
+        ) for sd in os.listdir(public_keys_path)]
+
+    def find_public_key(self, fingerprint: str) -> str:
+        public_keys_path = os.path.join(self.path, "public_keys")
+        for sd in os.listdir(public_keys_path):
+            public_key_text = self.get_public_key(sd)
+            if public_key_text is not None and public_key_fingerprint(public_key_text) == fingerprint:
+                return sd
+        return None
+
+    # public_key_requests
+    def public_key_requests(self) -> list:
+        return self._read_json_records("public_key_requests", "request.json")
+
+    def store_public_key_request(self, user2: str, request: dict) -> bool:
+        return self._write_json_record("public_key_requests", user2, "request.json", request)
+
+    def remove_public_key_request(self, user2: str) -> bool:
+        return self._remove_json_record("public_key_requests", user2, "request.json")
+
+    # public_key_responses
+    def public_key_responses(self) -> list:
+        return self._read_json_records("public_key_responses", "response.json")
+
+    def store_public_key_response(self, user2: str, response: dict) -> bool:
+        return self._write_json_record("public_key_responses", user2, "response.json", response)
+
+    def remove_public_key_response(self, user2: str) -> bool:
+        return self._remove_json_record("public_key_responses", user2, "response.json")
+
+    # seek_tokens
+    def seek_tokens(self) -> list:
+        return [dict(
+            username=user2,
+            modified_at=datetime.datetime.fromtimestamp(created_at),
+            count=count
+        ) for user2, created_at, count in self.seek_token_store.users()]
+
+    def add_seek_token(self, user2: str, seek_token: str) -> bool:
+        return self.seek_token_store.add(user2, seek_token)
+
+    def consume_seek_token(self, user2: str, seek_token: str) -> bool:
+        return self.seek_token_store.consume(user2, seek_token)
+
+    # message_keys
+    def get_message_key(self, message_id: str) -> dict:
+        try:
+            return json.loads(open(os.path.join(self.path, "message_keys", message_id, "key.json")).read())
+        except FileNotFoundError:
+            return None
+
+    def store_message_key(self, key: dict) -> bool:
+        return self._write_json_record("message_keys", key['message_id'], "key.json", key)
+
+    def message_keys(self) -> list:
+        message_keys_path = os.path.join(self.path, "message_keys")
+        return [
+            key for key in (self.get_message_key(sd) for sd in os.listdir(message_keys_path))
+            if key is not None
+        ]
+
+    # message index
+    def index_message(self, entry: dict) -> bool:
+        return self.message_index.add(entry)
+
+    def replace_message_index(self, entries: list) -> bool:
+        return self.message_index.replace(entries)
+
+    def list_messages(self, **filters) -> list:
+        return self.message_index.list(**filters)
+
+    def count_messages(self, **filters) -> int:
+        return self.message_index.count(**filters)
+
+
+def _message_rows(entries: list) -> list:
+    """ turn message index entries into rows for the messages table. """
+
+    return [(
+        entry['message_id'],
+        entry.get('sender'),
+        entry.get('filename'),
+        entry.get('completed_at', 0),
+        json.dumps(entry)
+    ) for entry in entries]
+
+
+class SQLiteIPCache:
+    """ the ipcache, as a table. it has the same methods as IPCache. """
+
+    def __init__(self, storage: 'SQLiteStorage'):
+        self.storage = storage
+
+    def snapshot(self) -> dict:
+        rows = self.storage.connection.execute("SELECT username, ip, port FROM ipcache").fetchall()
+        return {username: dict(ip=ip, port=port) for username, ip, port in rows}
+
+    def get(self, username: str) -> dict:
+        row = self.storage.connection.execute(
+            "SELECT ip, port FROM ipcache WHERE username = ?",
+            (username,)
+        ).fetchone()
+        if row is None:
+            return None
+        return dict(ip=row[0], port=row[1])
+
+    def set(self, username: str, ip: str, port: int) -> bool:
+        with self.storage.connection as connection:
+            cursor = connection.execute(
+                "INSERT INTO ipcache (username, ip, port) VALUES (?, ?, ?) "
+                "ON CONFLICT(username) DO UPDATE SET ip = excluded.ip, port = excluded.port "
+                "WHERE ip IS NOT excluded.ip OR port IS NOT excluded.port",
+                (username, ip, port)
+            )
+            changed = cursor.rowcount > 0
+            if changed:
+                index_ipcache(connection, [username])
+        return changed
+
+    def remove(self, username: str) -> bool:
+        with self.storage.connection as connection:
+            cursor = connection.execute("DELETE FROM ipcache WHERE username = ?", (username,))
+        return cursor.rowcount > 0
+
+    def hashed(self) -> dict:
+        return dict(self.storage.connection.execute("SELECT hashed_username, hashed_ip_port FROM ipcache").fetchall())
+
+    def hashed_usernames(self) -> dict:
+        return dict(self.storage.connection.execute("SELECT username, hashed_username FROM ipcache").fetchall())
+
+    def username_for_hash(self, hashed_username: str) -> str:
+        row = self.storage.connection.execute(
+            "SELECT username FROM ipcache WHERE hashed_username = ?",
+            (hashed_username,)
+        ).fetchone()
+        return row[0] if row is not None else None
+
+    def flush(self) -> bool:
+        return False
+
+
+def index_ipcache(connection: sqlite3.Connection, usernames: list = None) -> int:
+    """
+    fill in the hashed username and hashed entry of ipcache rows, from what is in the row.
+
+    Parameters
+    ----------
+    connection: sqlite3.Connection
+        the connection, in a transaction
+
+    usernames: list
+        the rows to fill in, or None for every row that doesn't have them yet
+
+    Returns
+    -------
+    int
+        how many rows were filled in
+    """
+
+    if usernames is None:
+        rows = connection.execute("SELECT username, ip, port FROM ipcache WHERE hashed_ip_port IS NULL").fetchall()
+    else:
+        rows = connection.execute(
+            "SELECT username, ip, port FROM ipcache WHERE username IN ({})".format(", ".join("?" * len(usernames))),
+            usernames
+        ).fetchall()
+
+    connection.executemany(
+        "UPDATE ipcache SET hashed_username = ?, hashed_ip_port = ? WHERE username = ?",
+        [
+            (str2hashed_hexstr(username), hash_ipcache_entry(dict(ip=ip, port=port)), username)
+            for username, ip, port in rows
+        ]
+    )
+    return len(rows)
+
+
+class SQLiteStorage:
+    """ this class stores a user's records in one sqlite database. """
+
+    path = None
+    database_path = None
+
+    SCHEMA = [
+        "CREATE TABLE IF NOT EXISTS ipcache ("
+        "username TEXT PRIMARY KEY, ip TEXT, port INTEGER, hashed_username TEXT, hashed_ip_port TEXT)",
+
+        "CREATE TABLE IF NOT EXISTS public_keys ("
+        "username TEXT PRIMARY KEY, public_key TEXT NOT NULL, fingerprint TEXT NOT NULL, modified_at REAL NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS public_keys_fingerprint ON public_keys (fingerprint)",
+
+        "CREATE TABLE IF NOT EXISTS public_key_requests ("
+        "username TEXT PRIMARY KEY, request TEXT NOT NULL, modified_at REAL NOT NULL)",
+
+        "CREATE TABLE IF NOT EXISTS public_key_responses ("
+        "username TEXT PRIMARY KEY, response TEXT NOT NULL, modified_at REAL NOT NULL)",
+
+        "CREATE TABLE IF NOT EXISTS seek_tokens ("
+        "username TEXT NOT NULL, seek_token TEXT NOT NULL, created_at REAL NOT NULL)",
+        "DROP INDEX IF EXISTS seek_tokens_username",
+        "CREATE UNIQUE INDEX IF NOT EXISTS seek_tokens_username_token ON seek_tokens (username, seek_token)",
+        "CREATE INDEX IF NOT EXISTS seek_tokens_created_at ON seek_tokens (created_at)",
+
+        "CREATE TABLE IF NOT EXISTS message_keys ("
+        "message_id TEXT PRIMARY KEY, key TEXT NOT NULL)",
+
+        "CREATE TABLE IF NOT EXISTS messages ("
+        "message_id TEXT PRIMARY KEY, sender TEXT, filename TEXT, completed_at REAL NOT NULL, entry TEXT NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS messages_completed_at ON messages (completed_at)",
+        "CREATE INDEX IF NOT EXISTS messages_sender_completed_at ON messages (sender, completed_at)"
+    ]
+
+    def __init__(self, path: str, database_path: str = None):
+        self.path = path
+        self.database_path = database_path or os.path.join(path, SQLITE_FILENAME)
+        self.local = threading.local()
+        self.ipcache = SQLiteIPCache(self)
+        self.seek_tokens_collected_at = 0
+
+        with self.connection as connection:
+            for statement in self.SCHEMA:
+                connection.execute(statement)
+
+            # databases from before the ipcache was hashed as it changed
+            columns = [row[1] for row in connection.execute("PRAGMA table_info(ipcache)")]
+            for column in ["hashed_username", "hashed_ip_port"]:
+                if column not in columns:
+                    connection.execute("ALTER TABLE ipcache ADD COLUMN {} TEXT".format(column))
+            connection.execute("CREATE INDEX IF NOT EXISTS ipcache_hashed_username ON ipcache (hashed_username)")
+            index_ipcache(connection)
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        """ the connection for the calling thread, opened the first time it is needed. """
+
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.database_path, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self.local.connection = connection
+        return connection
+
+    def _upsert(self, table: str, column: str, username: str, record: dict) -> bool:
+        with self.connection as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO {} (username, {}, modified_at) VALUES (?, ?, ?)".format(table, column),
+                (username, json.dumps(record), time.time())
+            )
+        return True
+
+    def _records(self, table: str, column: str) -> list:
+        records = []
+        for record, modified_at in self.connection.execute(
+            "SELECT {}, modified_at FROM {} ORDER BY username".format(column, table)
+        ):
+            record = json.loads(record)
+            record.update(modified_at=datetime.datetime.fromtimestamp(modified_at))
+            records.append(record)
+        return records
+
+    def _delete(self, table: str, username: str) -> bool:
+        with self.connection as connection:
+            cursor = connection.execute("DELETE FROM {} WHERE username = ?".format(table), (username,))
+        return cursor.rowcount > 0
+
+    # public_keys
+    def get_public_key(self, username: str) -> str:
+        row = self.connection.execute(
+            "SELECT public_key FROM public_keys WHERE username = ?",
+            (username,)
+        ).fetchone()
+        return row[0] if row is not None else None
+
+    def store_public_key(self, username: str, public_key_text: str) -> bool:
+        with self.connection as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO public_keys (username, public_key, fingerprint, modified_at) "
+                "VALUES (?, ?, ?, ?)",
+                (username, public_key_text, public_key_fingerprint(public_key_text), time.time())
+            )
+        return True
+
+    def public_keys(self) -> list:
+        return [dict(
+            username=username,
+            modified_at=datetime.datetime.fromtimestamp(modified_at)
+        ) for username, modified_at in self.connection.execute(
+            "SELECT username, modified_at FROM public_keys ORDER BY username"
+        )]
+
+    def find_public_key(self, fingerprint: str) -> str:
+        row = self.connection.execute(
+            "SELECT username FROM public_keys WHERE fingerprint = ?",
+            (fingerprint,)
+        ).fetchone()
+        return row[0] if row is not None else None
+
+    # public_key_requests
+    def public_key_requests(self) -> list:
+        return self._records("public_key_requests", "request")
+
+    def store_public_key_request(self, user2: str, request: dict) -> bool:
+        return self._upsert("public_key_requests", "request", user2, request)
+
+    def remove_public_key_request(self, user2: str) -> bool:
+        return self._delete("public_key_requests", user2)
+
+    # public_key_responses
+    def public_key_responses(self) -> list:
+        return self._records("public_key_responses", "response")
+
+    def store_public_key_response(self, user2: str, response: dict) -> bool:
+        return self._upsert("public_key_responses", "response", user2, response)
+
+    def remove_public_key_response(self, user2: str) -> bool:
+        return self._delete("public_key_responses", user2)
+
+    # seek_tokens, they expire SeekTokenStore.ttl after they are created
+    def _collect_seek_tokens(self, now: float) -> None:
+        if now - self.seek_tokens_collected_at < SeekTokenStore.gc_interval:
+            return
+        self.seek_tokens_collected_at = now
+
+        with self.connection as connection:
+            connection.execute("DELETE FROM seek_tokens WHERE created_at <= ?", (now - SeekTokenStore.ttl,))
+
+    def seek_tokens(self) -> list:
+        now = time.time()
+        return [dict(
+            username=username,
+            modified_at=datetime.datetime.fromtimestamp(modified_at),
+            count=count
+        ) for username, modified_at, count in self.connection.execute(
+            "SELECT username, MAX(created_at), COUNT(*) FROM seek_tokens WHERE created_at > ? "
+            "GROUP BY username ORDER BY username",
+            (now - SeekTokenStore.ttl,)
+        )]
+
+    def add_seek_token(self, user2: str, seek_token: str) -> bool:
+        now = time.time()
+        self._collect_seek_tokens(now)
+        with self.connection as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO seek_tokens (username, seek_token, created_at) VALUES (?, ?, ?)",
+                (user2, seek_token, now)
+            )
+        return True
+
+    def consume_seek_token(self, user2: str, seek_token: str) -> bool:
+        now = time.time()
+        self._collect_seek_tokens(now)
+        with self.connection as connection:
+            cursor = connection.execute(
+                "DELETE FROM seek_tokens WHERE username = ? AND seek_token = ? AND created_at > ?",
+                (user2, seek_token, now - SeekTokenStore.ttl)
+            )
+        return cursor.rowcount > 0
+
+    # message_keys
+    def get_message_key(self, message_id: str) -> dict:
+        row = self.connection.execute(
+            "SELECT key FROM message_keys WHERE message_id = ?",
+            (message_id,)
+        ).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def store_message_key(self, key: dict) -> bool:
+        with self.connection as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO message_keys (message_id, key) VALUES (?, ?)",
+                (key['message_id'], json.dumps(key))
+            )
+        return True
+
+    def message_keys(self) -> list:
+        return [json.loads(key) for key, in self.connection.execute("SELECT key FROM message_keys")]
+
+    # message index
+    def _message_filters(self, sender: str = None, filename: str = None, since: float = None) -> tuple:
+        clauses = []
+        params = []
+        if sender is not None:
+            clauses.append("sender = ?")
+            params.append(sender)
+        if filename is not None:
+            clauses.append("instr(filename, ?) > 0")
+            params.append(filename)
+        if since is not None:
+            clauses.append("completed_at >= ?")
+            params.append(since)
+
+        where = " WHERE {}".format(" AND ".join(clauses)) if len(clauses) else ""
+        return where, params
+
+    def index_message(self, entry: dict) -> bool:
+        with self.connection as connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO messages (message_id, sender, filename, completed_at, entry) "
+                "VALUES (?, ?, ?, ?, ?)",
+                _message_rows([entry])
+            )
+        return True
+
+    def replace_message_index(self, entries: list) -> bool:
+        with self.connection as connection:
+            connection.execute("DELETE FROM messages")
+            connection.executemany(
+                "INSERT OR REPLACE INTO messages (message_id, sender, filename, completed_at, entry) "
+                "VALUES (?, ?, ?, ?, ?)",
+                _message_rows(entries)
+            )
+        return True
+
+    def list_messages(self, offset: int = 0, limit: int = None, **filters) -> list:
+        where, params = self._message_filters(**filters)
+        return [json.loads(entry) for entry, in self.connection.execute(
+            "SELECT entry FROM messages{} ORDER BY completed_at DESC LIMIT ? OFFSET ?".format(where),
+            params + [limit if limit is not None else -1, offset]
+        )]
+
+    def count_messages(self, **filters) -> int:
+        where, params = self._message_filters(**filters)
+        return self.connection.execute("SELECT COUNT(*) FROM messages{}".format(where), params).fetchone()[0]
+
+
+_storages = dict()
+_storages_lock = threading.Lock()
+
+
+def open_storage(path: str):
+    """
+    return the storage for the user at path, sqlite if they have a database, directories if not.
+
+    there is one storage per user per process, shared by every User for them.
+
+    Parameters
+    ----------
+    path: str
+        the user's directory
+
+    Returns
+    -------
+    DirectoryStorage or SQLiteStorage
+        the storage
+    """
+
+    kind = SQLiteStorage if os.path.exists(os.path.join(path, SQLITE_FILENAME)) else DirectoryStorage
+
+    with _storages_lock:
+        storage = _storages.get(path)
+        if type(storage) != kind:
+            storage = kind(path)
+            _storages[path] = storage
+        return storage
+
+
+def migrate_to_sqlite(path: str) -> dict:
+    """
+    copy everything a user has in the directory layout into a new sqlite database.
+
+    the files are left where they are, so nothing is lost if this goes wrong. from
+    the moment the database exists the user is on sqlite, so don't run this while
+    their surface is up.
+
+    Parameters
+    ----------
+    path: str
+        the user's directory
+
+    Returns
+    -------
+    dict
+        the number of records copied, by kind
+    """
+
+    directory = DirectoryStorage(path)
+    directory.ipcache.flush()
+
+    tmp_path = os.path.join(path, "{}.tmp".format(SQLITE_FILENAME))
+    for suffix in ["", "-wal", "-shm"]:
+        if os.path.exists(tmp_path + suffix):
+            os.remove(tmp_path + suffix)
+
+    # build the database under another name, so a half-finished migration doesn't count
+    connection = SQLiteStorage(path, database_path=tmp_path).connection
+
+    counts = dict()
+    with connection:
+        ipcache = directory.ipcache.snapshot()
+        connection.executemany(
+            "INSERT OR REPLACE INTO ipcache (username, ip, port) VALUES (?, ?, ?)",
+            [(username, v['ip'], v['port']) for username, v in ipcache.items()]
+        )
+        index_ipcache(connection)
+        counts['ipcache'] = len(ipcache)
+
+        public_keys = directory.public_keys()
+        rows = []
+        for pk in public_keys:
+            public_key_text = directory.get_public_key(pk['username'])
+            rows.append((
+                pk['username'],
+                public_key_text,
+                public_key_fingerprint(public_key_text),
+                pk['modified_at'].timestamp()
+            ))
+        connection.executemany(
+            "INSERT OR REPLACE INTO public_keys (username, public_key, fingerprint, modified_at) VALUES (?, ?, ?, ?)",
+            rows
+        )
+        counts['public_keys'] = len(rows)
+
+        for table, column, records in [
+            ("public_key_requests", "request", directory.public_key_requests()),
+            ("public_key_responses", "response", directory.public_key_responses())
+        ]:
+            rows = []
+            for record in records:
+                modified_at = record.pop('modified_at')
+                rows.append((record['user2'], json.dumps(record), modified_at.timestamp()))
+            connection.executemany(
+                "INSERT OR REPLACE INTO {} (username, {}, modified_at) VALUES (?, ?, ?)".format(table, column),
+                rows
+            )
+            counts[table] = len(rows)
+
+        rows = [
+            (user2, seek_token, expires_at - SeekTokenStore.ttl)
+            for user2, seek_token, expires_at in directory.seek_token_store.items()
+        ]
+        connection.executemany(
+            "INSERT OR REPLACE INTO seek_tokens (username, seek_token, created_at) VALUES (?, ?, ?)",
+            rows
+        )
+        counts['seek_tokens'] = len(rows)
+
+        message_keys = directory.message_keys()
+        connection.executemany(
+            "INSERT OR REPLACE INTO message_keys (message_id, key) VALUES (?, ?)",
+            [(key['message_id'], json.dumps(key)) for key in message_keys]
+        )
+        counts['message_keys'] = len(message_keys)
+
+        messages = directory.list_messages()
+        connection.executemany(
+            "INSERT OR REPLACE INTO messages (message_id, sender, filename, completed_at, entry) VALUES (?, ?, ?, ?, ?)",
+            _message_rows(messages)
+        )
+        counts['messages'] = len(messages)
+
+    connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    connection.close()
+    os.replace(tmp_path, os.path.join(path, SQLITE_FILENAME))
+    for suffix in ["-wal", "-shm"]:
+        if os.path.exists(tmp_path + suffix):
+            os.remove(tmp_path + suffix)
+
+    return counts
@@ -1,37 +1,82 @@
-import datetime
 import json
 import os
 import uuid
-import pprint
+import threading
+import time
 
-from ..frame import Frame
-from ..utilities import send_frame_users, normalize_path, flatten
+from ..frame import Frame, CustodyChain, GossipPolicy, DuplicateFilter, TopologyDigest, PulseSummary
+from ..utilities import send_frame_users, send_frame_ip_port, normalize_path, flatten, map_concurrently
 from ..utilities import encrypt_symmetric, encrypt_rsa, decrypt_symmetric, decrypt_rsa, generate_rsa_pub_priv
-from ..utilities import hexstr2bytes, bytes2hexstr, str2hashed_hexstr
+from ..utilities import hexstr2bytes, bytes2hexstr, str2hashed_hexstr, recipient_tag
+from ..utilities import read_stream_range, write_stream_range, is_message_id
+from .ipcache import IPCache
+from .storage import open_storage, public_key_fingerprint, SQLiteStorage
+from .file_cache import file_cache
+from .seek_scheduler import SeekScheduler, SeekRequest
+from .routing import RoutingTable
+from .damage import DamageQueue
 
 
 USER_ROOT = "~/pckr/"
 
+# who public key requests and responses are accepted from without asking: anyone, only
+# contacts that are in the ipcache, or nobody (they wait for process_public_key_requests)
+PUBLIC_KEY_POLICIES = ['all', 'contacts', 'none']
+
+# how many users a seek_user frame goes through before it is dropped
+SEEK_HOPS = 4
+
+# the chunk index is sharded by this many characters of the chunk hash: 256 shards
+CHUNK_INDEX_SHARD_CHARS = 2
+
 
 class User:
+    """
+    this class is everything a user knows and can do.
+
+    one User can be shared by every thread of a surface. it only holds on to things that
+    don't change (the username, the path), and everything else goes through the storage,
+    which is shared by every User for the same user in this process, or through the file
+    cache, which notices when files change.
+    """
+
     username = None
-    ipcache_data = None
+
+    # the chunk index is read, changed and written back as a whole
+    _chunk_index_lock = threading.Lock()
+
+    # how quickly each user's contacts answered their last pings, for this process
+    _rtts = dict()
 
     def __init__(self, username):
         self.username = username
+        self._path = None
+        self._storage = None
 
-        ipcache_path = os.path.join(self.ipcache_path, "cache.json")
-        ipcache_data = dict()
-        if os.path.exists(ipcache_path):
-            try:
-                ipcache_data = json.loads(open(ipcache_path).read())
-            except json.decoder.JSONDecodeError:
-                pass
-        self.ipcache_data = ipcache_data
+        # how seek_user frames we send out are passed on, None floods them
+        self.seek_gossip = None
+
+        # whether seek_user looks users up in the dht first, and the surface answers dht lookups
+        self.seek_dht = False
 
     def __str__(self):
         return self.username
 
+    @property
+    def storage(self):
+        """
+        return where this user's records are kept, shared by every User for them in this process.
+
+        Returns
+        -------
+        DirectoryStorage or SQLiteStorage
+            sqlite if the user has a store.sqlite3, the directory layout if not
+        """
+
+        if self._storage is None:
+            self._storage = open_storage(self.path)
+        return self._storage
+
     @property
     def exists(self):
         """
@@ -56,7 +101,9 @@ class User:
             the path
         """
 
-        return normalize_path(os.path.join(USER_ROOT, self.username))
+        if self._path is None:
+            self._path = normalize_path(os.path.join(USER_ROOT, self.username))
+        return self._path
 
     @property
     def private_key_path(self):
@@ -72,12 +119,35 @@ class User:
 
     @property
     def current_ip_port(self):
-        # TODO JHILL: memoize
-        try:
-            return json.loads(open(
-                os.path.join(self.path, "current_ip_port.json")).read())
-        except FileNotFoundError:
-            return None
+        """
+        return where our surface is listening, read again only if it changed.
+
+        Returns
+        -------
+        dict
+            dict(ip=..., port=...), or None if we haven't surfaced
+        """
+
+        return file_cache.read(os.path.join(self.path, "current_ip_port.json"), json.loads)
+
+    def set_current_ip_port(self, ip: str, port: int) -> bool:
+        """
+        remember where our surface is listening.
+
+        Returns
+        -------
+        bool
+            usually True
+        """
+
+        path = os.path.join(self.path, "current_ip_port.json")
+        tmp_path = "{}.{}.{}.tmp".format(path, os.getpid(), threading.get_ident())
+        with open(tmp_path, "w+") as f:
+            f.write(json.dumps(dict(ip=ip, port=port)))
+        os.replace(tmp_path, path)
+        file_cache.forget(path)
+
+        return True
 
     @property
     def private_key_text(self):
@@ -90,7 +160,7 @@ class User:
             the path
         """
 
-        return open(self.private_key_path).read()
+        return file_cache.read(self.private_key_path)
 
     @property
     def message_keys_path(self):
@@ -107,33 +177,77 @@ class User:
 
         return os.path.join(self.path, "message_keys")
 
-    def pulse_network(self, custody_chain=[]):
+    def _origin_id(self, origin_id: str = None) -> str:
+        """
+        return the origin_id for a gossip frame, making a new one if we are starting it.
+
+        we remember the ones we make, so copies of our own frames that come back are dropped.
+        """
+
+        if origin_id is None:
+            origin_id = uuid.uuid4().hex
+            DuplicateFilter.for_user(self.username).check(origin_id, hops=0)
+
+        return origin_id
+
+    def pulse_network(self, custody_chain=None, origin_id=None, max_hops=None):
         """
         pulse the user's network.
 
+        with max_hops, the pulse measures the network as well: everyone it reaches answers
+        with a PulseSummary of themselves and everyone they passed it on to, see PulseSummary.
+
         Parameters
         ----------
-        custody_chain: list
-             a list of who has already seen this message
+        custody_chain: CustodyChain
+             who has already seen this message
+
+        origin_id: str
+             the id of the pulse, that every copy of it keeps. None to start a new one
+
+        max_hops: int
+             how many hops a measuring pulse goes. None for a pulse that doesn't measure
 
         Returns
         -------
-        bool
-            true or false
+        PulseSummary or bool
+            the summary of everyone the pulse reached from us, if it is measuring, otherwise True
         """
 
-        custody_chain.append(str2hashed_hexstr(self.username))
+        if custody_chain is None:
+            custody_chain = CustodyChain()
+        hops = len(custody_chain)
+        custody_chain.add(self.username)
+        origin_id = self._origin_id(origin_id)
 
-        for k in self.ipcache.keys():
-            hashed_username = str2hashed_hexstr(k)
+        summary = None
+        if max_hops is not None:
+            hashed = str2hashed_hexstr(self.username)
+            summary = PulseSummary(max_hops=max_hops)
+            summary.add_user(hashed, hops)
+            for user2, seconds in list(self.rtts.items()):
+                summary.add_rtt(hashed, str2hashed_hexstr(user2), seconds)
+
+            if hops >= max_hops:
+                return summary
+
+        for k, hashed_username in self.ipcache_store.hashed_usernames().items():
             if hashed_username not in custody_chain:
-                frame = Frame(payload=dict(
-                    custody_chain=custody_chain
-                ), action='pulse_network')
+                payload = dict(
+                    custody_chain=custody_chain.to_payload(),
+                    origin_id=origin_id
+                )
+                if summary is not None:
+                    payload['max_hops'] = max_hops
 
-                send_frame_users(frame, self, k)
+                response = send_frame_users(Frame(payload=payload, action='pulse_network'), self, k)
 
-        return True
+                if summary is not None:
+                    summary.frames = summary.frames + 1
+                    if response.get('summary') is not None:
+                        summary.union(PulseSummary.from_payload(response['summary']))
+
+        return True if summary is None else summary
 
     def surface(self):
         for k in self.ipcache.keys():
@@ -181,156 +295,1098 @@ class User:
 
     @property
     def messages(self):
-        messages = [dict(
-            message_id=sd,
-            created_at=datetime.datetime.fromtimestamp(
-                os.path.getmtime(os.path.join(self.messages_path, sd))
-            ),
-            files=flatten([
-                [os.path.join(d, f) for f in files] for d, sds, files in os.walk(os.path.join(self.messages_path, sd))
+        """
+        return every message we have received, newest first, from the message index.
+
+        Returns
+        -------
+        list
+            the index entry of every message
+        """
+
+        return self.list_messages()
+
+    def list_messages(
+        self,
+        offset: int = 0,
+        limit: int = None,
+        sender: str = None,
+        filename: str = None,
+        since: float = None
+    ) -> list:
+        """
+        return one page of the messages we have received, newest first, from the message index.
+
+        Parameters
+        ----------
+        offset: int
+            how many matching messages to skip
+
+        limit: int
+            how many to return at most, None for all of them
+
+        sender: str
+            only messages from this user
+
+        filename: str
+            only messages with this in their filename
+
+        since: float
+            only messages completed at or after this timestamp
+
+        Returns
+        -------
+        list
+            the index entries: message_id, sender, filename, mime_type, size, chunks, files,
+            packed, received_at, completed_at and path
+        """
+
+        return self.storage.list_messages(
+            offset=offset,
+            limit=limit,
+            sender=sender,
+            filename=filename,
+            since=since
+        )
+
+    def count_messages(self, sender: str = None, filename: str = None, since: float = None) -> int:
+        """ return how many messages match, see list_messages. """
+
+        return self.storage.count_messages(sender=sender, filename=filename, since=since)
+
+    def _message_index_entry(self, key: dict, path: str, completed_at: float) -> dict:
+        return dict(
+            message_id=key['message_id'],
+            sender=key.get('sender', key.get('swarm', dict()).get('origin')),
+            filename=os.path.basename(key['filename'].rstrip(os.sep)),
+            mime_type=key.get('mime_type'),
+            size=key['length'],
+            chunks=len(key.get('chunks', [])),
+            files=len(key.get('files', [None])),
+            packed=key.get('packed', False),
+            received_at=key.get('received_at'),
+            completed_at=completed_at,
+            path=path
+        )
+
+    def rebuild_message_index(self) -> int:
+        """
+        recreate the message index from what is under messages/.
+
+        the keys we still have fill in everything. for messages without one, we do what
+        we can with the files themselves.
+
+        Returns
+        -------
+        int
+            the number of messages in the new index
+        """
+
+        entries = []
+        for sd in sorted(os.listdir(self.messages_path)):
+            message_path = os.path.join(self.messages_path, sd)
+            if not os.path.isdir(message_path):
+                continue
+
+            files = flatten([
+                [os.path.join(d, f) for f in fs] for d, sds, fs in os.walk(message_path)
             ])
-        ) for sd in os.listdir(self.messages_path)]
-        return messages
+            completed_at = max([os.path.getmtime(f) for f in files] + [os.path.getmtime(message_path)])
+
+            key = self.get_message_key(sd)
+            if key is not None:
+                path = message_path if key.get('packed', False) else self.message_files(key)[0][0]
+                entries.append(self._message_index_entry(key, path, completed_at))
+            else:
+                entries.append(dict(
+                    message_id=sd,
+                    sender=None,
+                    filename=os.path.relpath(files[0], message_path) if len(files) == 1 else sd,
+                    mime_type=None,
+                    size=sum(os.path.getsize(f) for f in files),
+                    chunks=None,
+                    files=len(files),
+                    packed=len(files) > 1,
+                    received_at=None,
+                    completed_at=completed_at,
+                    path=files[0] if len(files) == 1 else message_path
+                ))
+
+        self.storage.replace_message_index(entries)
+        return len(entries)
 
-    # ----------------------------------------------------------------------------------------
-    #
-    # public_keys
-    #
-    # -----------------------------------------------------------------------------------------
     @property
-    def public_key_path(self):
+    def chunk_index_path(self) -> str:
         """
-        return the path to this user's public key file.
+        return the path to the index of message chunks we already have on disk.
+
+        the index is sharded by the first characters of the chunk hash, one json file per
+        shard under this directory, so adding a message's chunks only rewrites the shards
+        they fall in, and looking chunks up only reads the shards they are in.
+
+        Returns
+        -------
+        str
+            the path
+        """
+
+        return os.path.join(self.path, "chunk_index")
+
+    def _chunk_index_shard_path(self, chunk_hash: str) -> str:
+        return os.path.join(self.chunk_index_path, "{}.json".format(chunk_hash[:CHUNK_INDEX_SHARD_CHARS]))
+
+    def _read_chunk_index_shard(self, path: str) -> dict:
+        try:
+            shard = file_cache.read(path, json.loads)
+        except json.decoder.JSONDecodeError:
+            return dict()
+
+        return shard if shard is not None else dict()
+
+    def _write_chunk_index_shard(self, path: str, shard: dict) -> None:
+        tmp_path = "{}.{}.{}.tmp".format(path, os.getpid(), threading.get_ident())
+        with open(tmp_path, "w+") as f:
+            f.write(json.dumps(shard))
+        os.replace(tmp_path, path)
+        file_cache.forget(path)
+
+    def _add_to_chunk_index(self, locations: dict) -> None:
+        """ add chunk hashes mapped to where they are to the index, rewriting only the shards they are in. """
+
+        os.makedirs(self.chunk_index_path, exist_ok=True)
+
+        shards = dict()
+        for chunk_hash, location in locations.items():
+            shards.setdefault(self._chunk_index_shard_path(chunk_hash), dict())[chunk_hash] = location
+
+        for path, added in shards.items():
+            shard = dict(self._read_chunk_index_shard(path))
+            shard.update(added)
+            self._write_chunk_index_shard(path, shard)
+
+    def _migrate_chunk_index(self) -> None:
+        """ split up the chunk index from older clients, which was one json file, into shards. """
+
+        legacy_path = os.path.join(self.path, "chunk_index.json")
+        if not os.path.exists(legacy_path):
+            return
+
+        with self._chunk_index_lock:
+            if not os.path.exists(legacy_path):
+                return
+
+            try:
+                legacy = json.loads(open(legacy_path).read())
+            except json.decoder.JSONDecodeError:
+                legacy = dict()
+
+            self._add_to_chunk_index(legacy)
+            os.remove(legacy_path)
+            file_cache.forget(legacy_path)
+
+    def chunk_locations(self, chunk_hashes: list) -> dict:
+        """
+        look chunks up in the chunk index.
+
+        the chunk index maps the hash of every chunk of every message we have received
+        to where it lives under messages/, so a sender re-sending similar content can skip it.
+
+        Parameters
+        ----------
+        chunk_hashes: list
+            the hashes of the chunks
+
+        Returns
+        -------
+        dict
+            the hashes that are in the index mapped to a dict of message_id, offset and length
+        """
+
+        self._migrate_chunk_index()
+
+        locations = dict()
+        for chunk_hash in chunk_hashes:
+            location = self._read_chunk_index_shard(self._chunk_index_shard_path(chunk_hash)).get(chunk_hash)
+            if location is not None:
+                locations[chunk_hash] = location
+
+        return locations
+
+    def message_file_path(self, message_id: str, filename: str, packed: bool = False) -> str:
+        """
+        return the path that a received message's file is written to.
+
+        Parameters
+        ----------
+        message_id: str
+            the id of the message
+
+        filename: str
+            the filename as the sender named it. only the basename is used, unless
+            the file is part of a packed directory
+
+        packed: bool
+            keep the directories in filename, they are relative to the packed directory
+
+        Returns
+        -------
+        str
+            the path
+        """
+
+        assert is_message_id(message_id), "bad message_id {}".format(message_id)
+
+        filename = os.path.normpath(filename)
+        if packed is False:
+            filename = os.path.basename(filename)
+
+        # whatever the sender says, nothing gets written outside of the message's directory
+        parts = [p for p in filename.split(os.sep) if p not in ('', '.', '..')]
+        assert len(parts) > 0, "empty filename in message {}".format(message_id)
+
+        return os.path.join(self.messages_path, message_id, *parts)
+
+    def message_files(self, key: dict, root: str = None) -> list:
+        """
+        return where each of the files of a message lives on disk.
+
+        the content of a message is one stream. a single file is the whole stream, a
+        packed directory is all of its files one after the other.
+
+        Parameters
+        ----------
+        key: dict
+            the key for the message, or the seed if we are the one sending it
+
+        root: str
+            where the files of a seed are, only for seeds we stored ourselves. keys come
+            from other users, so their files always go under messages/, whatever they say
+
+        Returns
+        -------
+        list
+            (path, offset, length) tuples, in stream order
+        """
+
+        if root is not None:
+            return [(os.path.join(root, f['filename']), f['offset'], f['length']) for f in key['files']]
+
+        if 'files' not in key:
+            return [(self.message_file_path(key['message_id'], key['filename']), 0, key['length'])]
+
+        return [(
+            self.message_file_path(key['message_id'], f['filename'], packed=key.get('packed', False)),
+            f['offset'],
+            f['length']
+        ) for f in key['files']]
+
+    def _read_chunk(self, files: list, chunk: dict) -> bytes:
+        """ read a chunk from files, or None if it isn't there or doesn't match its hash. """
+
+        try:
+            data = read_stream_range(files, chunk['offset'], chunk['length'])
+        except FileNotFoundError:
+            return None
+
+        if str2hashed_hexstr(data) != chunk['hash']:
+            return None
+
+        return data
+
+    def read_local_chunks(self, chunks: list) -> dict:
+        """
+        find chunks we already have on disk by their hash and read them back.
+
+        the bytes are hashed again before they are returned so an edited or truncated
+        file under messages/ can't end up inside somebody else's message.
+
+        Parameters
+        ----------
+        chunks: list
+            chunks from a message key, with a hash and a length
+
+        Returns
+        -------
+        dict
+            the indexes (into chunks) of the chunks we have, mapped to their contents
+        """
+
+        chunk_index = self.chunk_locations([chunk['hash'] for chunk in chunks])
+        files = dict()
+
+        found = dict()
+        for index, chunk in enumerate(chunks):
+            location = chunk_index.get(chunk['hash'])
+            if location is None or location['length'] != chunk['length']:
+                continue
+
+            if location['message_id'] not in files:
+                key = self.get_message_key(location['message_id'])
+                files[location['message_id']] = self.message_files(key) if key else None
+            if files[location['message_id']] is None:
+                continue
+
+            data = self._read_chunk(files[location['message_id']], dict(location, hash=chunk['hash']))
+            if data is not None:
+                found[index] = data
+
+        return found
+
+    def index_message_chunks(self, message_id: str, chunks: list) -> bool:
+        """
+        add all of the chunks of a completed message to the chunk index.
+
+        Parameters
+        ----------
+        message_id: str
+            the id of the message
+
+        chunks: list
+            the chunks from the message key
+
+        Returns
+        -------
+        bool
+            usually True
+        """
+
+        self._migrate_chunk_index()
+
+        with self._chunk_index_lock:
+            self._add_to_chunk_index({
+                chunk['hash']: dict(
+                    message_id=message_id,
+                    offset=chunk['offset'],
+                    length=chunk['length']
+                ) for chunk in chunks
+            })
+
+        return True
+
+    def get_message_key(self, message_id: str) -> dict:
+        """
+        load the key that was sent to us for a message.
+
+        Parameters
+        ----------
+        message_id: str
+            the id of the message
+
+        Returns
+        -------
+        dict
+            the key, or None if we never got one
+        """
+
+        if not is_message_id(message_id):
+            return None
+
+        return self.storage.get_message_key(message_id)
+
+    def store_message_key(self, key: dict) -> bool:
+        """
+        store the key for a message that is on its way to us.
+
+        Parameters
+        ----------
+        key: dict
+            the decrypted key
+
+        Returns
+        -------
+        bool
+            usually True
+        """
+
+        return self.storage.store_message_key(key)
+
+    def prepare_message(self, key: dict) -> list:
+        """
+        get ready to receive a message and work out which chunks have to be sent.
+
+        all of the files of the message are created at their full size so chunks can
+        be written into them as they arrive, in any order. chunks we already have from
+        earlier messages are filled in straight away.
+
+        Parameters
+        ----------
+        key: dict
+            the decrypted key
+
+        Returns
+        -------
+        list
+            the indexes of the chunks the sender still has to send us
+        """
+
+        assert is_message_id(key.get('message_id')), "bad message_id {}".format(key.get('message_id'))
+
+        # only a seed we stored ourselves says where its files are
+        key.pop('root', None)
+
+        files = self.message_files(key)
+        for path, _, length in files:
+            if not os.path.exists(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+
+            with open(path, "wb") as f:
+                f.truncate(length)
+
+        # chunks that show up more than once in the message only have to be sent once
+        first_seen = dict()
+        duplicates = []
+        unique = []
+        for index, chunk in enumerate(key['chunks']):
+            if chunk['hash'] in first_seen:
+                duplicates.append((index, first_seen[chunk['hash']]))
+            else:
+                first_seen[chunk['hash']] = index
+                unique.append(index)
+
+        local = self.read_local_chunks([key['chunks'][index] for index in unique])
+        missing = []
+        for position, index in enumerate(unique):
+            if position in local:
+                write_stream_range(files, key['chunks'][index]['offset'], local[position])
+            else:
+                missing.append(index)
+
+        key.update(duplicates=duplicates, received_at=time.time())
+        self.store_message_key(key)
+
+        return missing
+
+    @property
+    def message_seeds_path(self) -> str:
+        """
+        return the path to the messages we are seeding to a swarm.
+
+        Returns
+        -------
+        str
+            the path
+        """
+
+        return os.path.join(self.path, "message_seeds")
+
+    def get_message_seed(self, message_id: str) -> dict:
+        """
+        load what we need to serve chunks of a message that we sent to a swarm.
+
+        Parameters
+        ----------
+        message_id: str
+            the id of the message
+
+        Returns
+        -------
+        dict
+            the seed, or None if we aren't seeding that message
+        """
+
+        if not is_message_id(message_id):
+            return None
+
+        try:
+            path = os.path.join(self.message_seeds_path, "{}.json".format(message_id))
+            return json.loads(open(path).read())
+        except FileNotFoundError:
+            return None
+
+    def store_message_seed(self, seed: dict) -> bool:
+        """
+        remember a message we sent to a swarm so our surface can hand out its chunks.
+
+        Parameters
+        ----------
+        seed: dict
+            the message_id, password, chunks and files of the message, and the
+            absolute root the files are relative to
+
+        Returns
+        -------
+        bool
+            usually True
+        """
+
+        if not os.path.exists(self.message_seeds_path):
+            os.makedirs(self.message_seeds_path)
+
+        with open(os.path.join(self.message_seeds_path, "{}.json".format(seed['message_id'])), "w+") as f:
+            f.write(json.dumps(seed))
+
+        return True
+
+    @property
+    def sent_messages_path(self) -> str:
+        """
+        return the path to the summaries of messages we have sent.
+
+        Returns
+        -------
+        str
+            the path
+        """
+
+        return os.path.join(self.path, "sent_messages")
+
+    def store_sent_message_summary(self, summary: dict) -> bool:
+        """
+        store the progress summary of a message we sent, once it is done.
+
+        Parameters
+        ----------
+        summary: dict
+            the summary, as returned by TransferProgress.summary
+
+        Returns
+        -------
+        bool
+            usually True
+        """
+
+        if not os.path.exists(self.sent_messages_path):
+            os.makedirs(self.sent_messages_path)
+
+        with open(os.path.join(self.sent_messages_path, "{}.json".format(summary['message_id'])), "w+") as f:
+            f.write(json.dumps(summary))
+
+        return True
+
+    def _read_message_chunks(self, message_id: str, indexes: list) -> dict:
+        """
+        read chunks of a message, whether it was sent to us or we are seeding it.
+
+        chunks that aren't on disk yet, or that don't match their hash, are left out.
+
+        Returns
+        -------
+        dict
+            chunk indexes mapped to their contents
+        """
+
+        key = self.get_message_key(message_id)
+        root = None
+        if key is None:
+            key = self.get_message_seed(message_id)
+            if key is None:
+                return dict()
+            root = key['root']
+
+        files = self.message_files(key, root=root)
+
+        chunks = dict()
+        for index in indexes:
+            data = self._read_chunk(files, key['chunks'][index])
+            if data is not None:
+                chunks[index] = data
+
+        return chunks
+
+    def read_message_chunk(self, message_id: str, index: int) -> bytes:
+        """
+        read one chunk of a message, checked against its hash.
+
+        Parameters
+        ----------
+        message_id: str
+            the id of the message
+
+        index: int
+            the index of the chunk
+
+        Returns
+        -------
+        bytes
+            the chunk, or None if we don't have it
+        """
+
+        return self._read_message_chunks(message_id, [index]).get(index)
+
+    def held_message_chunks(self, message_id: str) -> list:
+        """
+        return the indexes of the chunks of a message that we hold.
+
+        Parameters
+        ----------
+        message_id: str
+            the id of the message
+
+        Returns
+        -------
+        list
+            the indexes
+        """
+
+        key = self.get_message_key(message_id) or self.get_message_seed(message_id)
+        if key is None:
+            return []
+
+        return sorted(self._read_message_chunks(message_id, range(len(key['chunks']))).keys())
+
+    def missing_message_chunks(self, key: dict) -> list:
+        """
+        return the indexes of the chunks of a message that still have to come over the network.
+
+        repeated chunks are filled in by complete_message, so they never count as missing.
+
+        Parameters
+        ----------
+        key: dict
+            the key for the message
+
+        Returns
+        -------
+        list
+            the indexes
+        """
+
+        repeats = set([index for index, _ in key['duplicates']])
+        wanted = [index for index in range(len(key['chunks'])) if index not in repeats]
+        held = self._read_message_chunks(key['message_id'], wanted)
+
+        return [index for index in wanted if index not in held]
+
+    def write_message_chunk(self, key: dict, index: int, data: bytes) -> bool:
+        """
+        write one chunk of a message that came over the network into place.
+
+        Parameters
+        ----------
+        key: dict
+            the key for the message
+
+        index: int
+            the index of the chunk
+
+        data: bytes
+            the decrypted chunk
+
+        Returns
+        -------
+        bool
+            False if the chunk doesn't match the hash it was announced with
+        """
+
+        chunk = key['chunks'][index]
+        if str2hashed_hexstr(data) != chunk['hash']:
+            return False
+
+        write_stream_range(self.message_files(key), chunk['offset'], data)
+
+        return True
+
+    def complete_message(self, key: dict) -> str:
+        """
+        finish off a message once all of its chunks have arrived.
+
+        chunks that showed up more than once in the message were only sent once, so the
+        repeats are filled in here, then everything is added to the chunk index, and the
+        message to the message index.
+
+        Parameters
+        ----------
+        key: dict
+            the key for the message
+
+        Returns
+        -------
+        str
+            the path to the completed file, or to the directory of a packed message
+        """
+
+        files = self.message_files(key)
+        for index, source_index in key['duplicates']:
+            source = key['chunks'][source_index]
+            write_stream_range(
+                files,
+                key['chunks'][index]['offset'],
+                read_stream_range(files, source['offset'], source['length'])
+            )
+
+        self.index_message_chunks(key['message_id'], key['chunks'])
+
+        if key.get('packed', False):
+            path = os.path.join(self.messages_path, key['message_id'])
+        else:
+            path = files[0][0]
+
+        self.storage.index_message(self._message_index_entry(key, path, time.time()))
+
+        return path
+
+    # ----------------------------------------------------------------------------------------
+    #
+    # public_keys
+    #
+    # -----------------------------------------------------------------------------------------
+    @property
+    def public_key_path(self):
+        """
+        return the path to this user's public key file.
+
+        Returns
+        -------
+        str
+            the path
+        """
+
+        return os.path.join(self.path, "public.key")
+
+    @property
+    def public_key_text(self):
+        """
+        open the public key file, read it, and return it.
+
+        Returns
+        -------
+        str
+            the contents of the public_key_path
+        """
+
+        return file_cache.read(self.public_key_path)
+
+    @property
+    def public_keys_path(self):
+        """
+        return the path to this users store of other users' public keys.
+
+        Returns
+        -------
+        str
+            the contents of the public_key_path
+        """
+
+        return os.path.join(self.path, "public_keys")
+
+    @property
+    def public_keys(self):
+        """
+        return a representation of this user's store of other users' public keys.
+
+        Returns
+        -------
+        str
+            the contents of the public_key_path
+        """
+
+        return self.storage.public_keys()
+
+    def find_contact_by_public_key(self, public_key_text: str) -> str:
+        """
+        find which of our contacts a public key belongs to, by its fingerprint.
+
+        Parameters
+        ----------
+        public_key_text: str
+            the public key
+
+        Returns
+        -------
+        str
+            the username of the contact, or None if we don't have that key
+        """
+
+        return self.storage.find_public_key(public_key_fingerprint(public_key_text))
+
+    # ----------------------------------------------------------------------------------------
+    #
+    # seek
+    #
+    # -----------------------------------------------------------------------------------------
+    @property
+    def seek_tokens_path(self):
+        return os.path.join(self.path, "seek_tokens")
+
+    @property
+    def seek_tokens(self) -> list:
+        return self.storage.seek_tokens()
+
+    def consume_seek_token(self, user2: str, seek_token: str) -> bool:
+        """
+        use up a seek token that came back in a seek_user_response from user2.
+
+        every token expires a while after it is sent out, and is only good once.
+
+        Returns
+        -------
+        bool
+            True if we sent the token out looking for user2, and it is still good
+        """
+
+        return self.storage.consume_seek_token(user2, seek_token.strip())
+
+    @property
+    def rtts(self) -> dict:
+        """
+        return how long our contacts took to answer a ping, smoothed over the last few.
+
+        Returns
+        -------
+        dict
+            usernames mapped to seconds
+        """
+
+        return User._rtts.setdefault(self.username, dict())
+
+    def record_rtt(self, user2: str, seconds: float) -> None:
+        rtts = self.rtts
+        previous = rtts.get(user2)
+        rtts[user2] = seconds if previous is None else 0.8 * previous + 0.2 * seconds
+
+    def seek_user(self, user2: str, gossip: GossipPolicy = None, dht: bool = None) -> bool:
+        """
+        send a seek_user frame out through the network, looking for user2.
+
+        Parameters
+        ----------
+        user2: str
+            who we're looking for
+
+        gossip: GossipPolicy
+            how the frame is passed on, self.seek_gossip if None. with neither, it is flooded
+
+        dht: bool
+            look user2 up in the dht first, and send the frame straight to them if they're
+            found, self.seek_dht if None
+
+        Returns
+        -------
+        bool
+            False if we don't have their public key
+        """
+
+        public_key_text = self.get_contact_public_key(user2)
+        if public_key_text is None:
+            return False
+
+        if gossip is None:
+            gossip = self.seek_gossip
+        if dht is None:
+            dht = self.seek_dht
+
+        seek_token = str(uuid.uuid4())
+        self.storage.add_seek_token(user2, seek_token)
+
+        host_info = dict(
+            ip=self.current_ip_port['ip'],
+            port=self.current_ip_port['port'],
+            public_key=self.public_key_text,
+            user2=self.username,
+            seek_token=seek_token
+        )
+
+        password = str(uuid.uuid4())
+        password_encrypted = bytes2hexstr(encrypt_rsa(password, public_key_text))
+
+        encrypted_host_info = bytes2hexstr(encrypt_symmetric(
+            json.dumps(host_info).encode(),
+            password.encode()
+        ))
+
+        # so everyone it isn't for can tell without trying to decrypt it
+        tag_nonce = uuid.uuid4().hex
+
+        def seek_frame(custody_chain, gossip, origin_id):
+            return Frame(payload=dict(
+                host_info=encrypted_host_info,
+                password=password_encrypted,
+                tag_nonce=tag_nonce,
+                recipient_tag=recipient_tag(public_key_fingerprint(public_key_text), tag_nonce),
+                custody_chain=custody_chain.to_payload(),
+                origin_id=origin_id,
+                gossip=gossip.to_payload() if gossip is not None else None
+            ), action='seek_user')
+
+        if dht is True:
+            node = self.dht_find_node(str2hashed_hexstr(user2))['found']
+            if node is not None:
+                # it's going straight to them, so whoever is there doesn't pass it on
+                custody_chain = CustodyChain.for_capacity(2, 0.001)
+                custody_chain.add(self.username)
+                frame = seek_frame(custody_chain, GossipPolicy(fanout=1, ttl=1), self._origin_id())
+                frame.to = node['id']
+
+                if self._dht_send(node, frame).get('recipient') is True:
+                    return True
+
+                # they aren't there anymore, so look for them the old way
+                self.routing_table.remove(node['id'])
+
+        # it only ever goes through a few users, so it can carry a much smaller chain
+        ttl = gossip.ttl if gossip is not None else SEEK_HOPS
+        custody_chain = CustodyChain.for_capacity(ttl + 1, 0.001)
+        custody_chain.add(self.username)
+        origin_id = self._origin_id()
+
+        # send the message out to everyone we know, or as many as the gossip policy says
+        contacts = list(self.ipcache.keys())
+        if gossip is not None:
+            contacts = gossip.choose(contacts, self.rtts)
+
+        for k in contacts:
+            send_frame_users(seek_frame(custody_chain, gossip, origin_id), self, k)
+
+        return True
+
+    # ----------------------------------------------------------------------------------------
+    #
+    # dht
+    #
+    # -----------------------------------------------------------------------------------------
+    @property
+    def routing_table(self) -> RoutingTable:
+        return RoutingTable.for_user(self.username, str2hashed_hexstr(self.username))
+
+    @property
+    def dht_node(self) -> dict:
+        """ return how this user appears in other users' routing tables. """
+
+        current_ip_port = self.current_ip_port
+        return dict(
+            id=str2hashed_hexstr(self.username),
+            ip=current_ip_port['ip'],
+            port=current_ip_port['port']
+        )
+
+    def _dht_send(self, node: dict, frame: Frame) -> dict:
+        try:
+            return send_frame_ip_port(frame, node['ip'], node['port'])
+        except OSError as e:
+            return dict(
+                success=False,
+                error=str(e)
+            )
 
-        Returns
-        -------
-        str
-            the path
+    def dht_find_node(self, target: str) -> dict:
         """
+        look a hashed username up in the dht.
 
-        return os.path.join(self.path, "public.key")
+        our contacts are always in our routing table, so a user who has never joined the dht
+        can still start a lookup through them.
 
-    @property
-    def public_key_text(self):
-        """
-        open the public key file, read it, and return it.
+        Parameters
+        ----------
+        target: str
+            the hashed username
 
         Returns
         -------
-        str
-            the contents of the public_key_path
+        dict
+            found (a dict of id, ip and port, or None), and how many users were asked, and
+            in how many rounds
         """
 
-        return open(self.public_key_path).read()
+        table = self.routing_table
+        ipcache = self.ipcache
+        for k, hashed_username in self.ipcache_store.hashed_usernames().items():
+            if k in ipcache:
+                table.add(hashed_username, ipcache[k]['ip'], ipcache[k]['port'])
 
-    @property
-    def public_keys_path(self):
+        sender = self.dht_node
+
+        def ask(node):
+            frame = Frame(
+                action='dht_find_node',
+                payload=dict(target=target, sender=sender),
+                to=node['id']
+            )
+
+            response = self._dht_send(node, frame)
+            if response.get('success') is not True:
+                return None
+
+            return response['nodes']
+
+        return table.lookup(target, lambda nodes: map_concurrently(ask, nodes, workers=table.alpha))
+
+    def dht_join(self) -> dict:
         """
-        return the path to this users store of other users' public keys.
+        look ourselves up in the dht, so the users closest to us hear where we are.
 
         Returns
         -------
-        str
-            the contents of the public_key_path
+        dict
+            the lookup, see dht_find_node
         """
 
-        return os.path.join(self.path, "public_keys")
+        return self.dht_find_node(str2hashed_hexstr(self.username))
 
-    @property
-    def public_keys(self):
+    def answer_dht_find_node(self, payload: dict) -> list:
         """
-        return a representation of this user's store of other users' public keys.
+        answer a dht lookup, and remember the user who asked.
+
+        Parameters
+        ----------
+        payload: dict
+            the dht_find_node frame's payload
 
         Returns
         -------
-        str
-            the contents of the public_key_path
+        list
+            the users we know of closest to the hashed username they're looking for
         """
 
-        pks = [dict(
-            username=sd,
-            modified_at=datetime.datetime.fromtimestamp(
-                os.path.getmtime(os.path.join(self.public_keys_path, sd, 'public.key'))
-            )
-        ) for sd in os.listdir(self.public_keys_path)]
-        return pks
+        table = self.routing_table
+        sender = payload['sender']
+        table.add(sender['id'], sender['ip'], sender['port'])
 
-    # ----------------------------------------------------------------------------------------
-    #
-    # seek
-    #
-    # -----------------------------------------------------------------------------------------
-    @property
-    def seek_tokens_path(self):
-        return os.path.join(self.path, "seek_tokens")
+        return table.closest(payload['target'])
 
     @property
-    def seek_tokens(self) -> list:
-        sts = []
-        for sd in os.listdir(self.seek_tokens_path):
-            path = os.path.join(self.seek_tokens_path, sd)
-            sts.append(dict(
-                username=sd.split('.')[0],
-                modified_at=datetime.datetime.fromtimestamp(os.path.getmtime(path)))
-            )
-        return sts
+    def seek_scheduler(self) -> SeekScheduler:
+        return SeekScheduler.for_user(self.username)
 
-    def seek_user(self, user2: str) -> bool:
-        public_key_text = self.get_contact_public_key(user2)
-        if public_key_text is None:
-            return False
+    def schedule_seek(self, user2: str, gossip: GossipPolicy = None) -> SeekRequest:
+        """
+        seek user2 through the seek scheduler, unless there is already a seek out for them.
 
-        seek_token = str(uuid.uuid4())
-        seek_token_path = os.path.join(self.seek_tokens_path, "{}.json".format(user2))
+        the surface seeks the same users over and over when the network is churning, this
+        keeps it to one seek at a time for each of them, further apart the longer they stay lost.
 
-        current_seek_tokens = []
-        if os.path.exists(seek_token_path):
-            txt = open(seek_token_path).read()
-            if txt != '':
-                current_seek_tokens = json.loads(txt)
-                if type(current_seek_tokens) == dict:
-                    current_seek_tokens = []
+        Parameters
+        ----------
+        user2: str
+            who we're looking for
 
-        with open(seek_token_path, "w+") as f:
-            current_seek_tokens.append(seek_token)
-            f.write(json.dumps(current_seek_tokens))
+        gossip: GossipPolicy
+            how the frame is passed on, if it is sent
 
-        host_info = dict(
-            ip=self.current_ip_port['ip'],
-            port=self.current_ip_port['port'],
-            public_key=self.public_key_text,
-            user2=self.username,
-            seek_token=seek_token
-        )
+        Returns
+        -------
+        SeekRequest
+            the seek that is out for user2, which can be waited on for where they were found
+        """
 
-        password = str(uuid.uuid4())
-        password_encrypted = bytes2hexstr(encrypt_rsa(password, public_key_text))
+        return self.seek_scheduler.schedule(user2, lambda: self.seek_user(user2, gossip=gossip))
 
-        encrypted_host_info = bytes2hexstr(encrypt_symmetric(
-            json.dumps(host_info).encode(),
-            password.encode()
-        ))
+    def may_be_recipient(self, payload: dict) -> bool:
+        """
+        return whether a frame could be for us, going by its recipient tag.
 
-        # send the message out to everyone we know
-        for k in self.ipcache.keys():
-            response_frame = Frame(payload=dict(
-                host_info=encrypted_host_info,
-                password=password_encrypted,
-                custody_chain=[str2hashed_hexstr(self.username)]
-            ), action='seek_user')
+        Parameters
+        ----------
+        payload: dict
+            the frame's payload
 
-            send_frame_users(response_frame, self, k)
+        Returns
+        -------
+        bool
+            False if it certainly isn't for us. frames without a tag could be for anyone
+        """
 
-        return True
+        if 'recipient_tag' not in payload:
+            return True
+
+        # older clients sent longer tags
+        tag = payload['recipient_tag']
+        fingerprint = public_key_fingerprint(self.public_key_text)
+        return recipient_tag(fingerprint, payload['tag_nonce'], length=len(tag) // 2) == tag
 
     def get_contact_public_key(self, contact: str) -> str:
-        try:
-            path = os.path.join(self.public_keys_path, contact, "public.key")
-            return open(path).read()
-        except FileNotFoundError:
-            return None
+        return self.storage.get_public_key(contact)
 
-    def init_directory_structure(self) -> bool:
+    def init_directory_structure(self, storage: str = 'directory') -> bool:
         assert os.path.exists(self.path) is False
         os.makedirs(self.path)
 
@@ -355,6 +1411,9 @@ class User:
         assert os.path.exists(self.seek_tokens_path) is False
         os.makedirs(self.seek_tokens_path)
 
+        if storage == 'sqlite':
+            SQLiteStorage(self.path)
+
         return True
 
     def init_rsa(self) -> bool:
@@ -369,7 +1428,12 @@ class User:
 
     def ping_user(self, user2) -> bool:
         frame = Frame(action="ping", payload=dict())
+
+        st = time.time()
         response = send_frame_users(frame, self, user2)
+        if response['success'] is True:
+            self.record_rtt(user2, time.time() - st)
+
         return response['success']
 
     # ----------------------------------------------------------------------------------------
@@ -433,51 +1497,121 @@ class User:
     # public_key_requests
     #
     # -----------------------------------------------------------------------------------------
+    def request_public_key(self, user2: str) -> dict:
+        """
+        ask user2 for their public key, volunteering ours.
+
+        Returns
+        -------
+        dict
+            their response, with skipped=True if we already had their public key
+        """
+
+        if self.get_contact_public_key(user2) is not None:
+            return dict(success=True, skipped=True)
+
+        frame = Frame(
+            action="request_public_key",
+            payload=dict(
+                user2=self.username,
+                public_key=self.public_key_text
+            )
+        )
+
+        return send_frame_users(frame, self, user2)
+
+    def request_public_keys(self, users: list, workers: int = 16) -> dict:
+        """
+        ask everyone in users for their public key, a few of them at a time.
+
+        Parameters
+        ----------
+        users: list
+            the usernames to ask
+
+        workers: int
+            how many to ask at once
+
+        Returns
+        -------
+        dict
+            each username mapped to their response
+        """
+
+        users = list(dict.fromkeys(users))
+        return dict(zip(users, map_concurrently(self._safely(self.request_public_key), users, workers)))
+
+    def accepts_public_key_from(self, user2: str, policy: str) -> bool:
+        """
+        return whether a public key request or response from user2 should be processed.
+
+        Parameters
+        ----------
+        user2: str
+            who it came from
+
+        policy: str
+            one of PUBLIC_KEY_POLICIES
+
+        Returns
+        -------
+        bool
+            True if it should be
+        """
+
+        assert policy in PUBLIC_KEY_POLICIES, "unknown public key policy '{}'".format(policy)
+
+        if policy == 'all':
+            return True
+        elif policy == 'contacts':
+            return self.ipcache_store.get(user2) is not None
+        return False
+
+    def _safely(self, f):
+        """ wrap f so a failure for one contact becomes their result instead of stopping everyone else. """
+
+        def wrapped(*args):
+            try:
+                return f(*args)
+            except Exception as e:
+                return dict(success=False, error=str(e))
+
+        return wrapped
+
+    def _process_all(self, process, remove, records: list, policy: str, workers: int) -> dict:
+        accepted = [r for r in records if self.accepts_public_key_from(r['user2'], policy)]
+
+        def process_and_remove(record):
+            if process(record) is not True:
+                return dict(success=False, error="couldn't process it, it was kept")
+            remove(record)
+            return dict(success=True)
+
+        results = dict(zip(
+            [r['user2'] for r in accepted],
+            map_concurrently(self._safely(process_and_remove), accepted, workers)
+        ))
+
+        for record in records:
+            results.setdefault(record['user2'], dict(success=False, error="not accepted by policy '{}'".format(policy)))
+
+        return results
+
     @property
     def public_key_requests_path(self) -> str:
         return os.path.join(self.path, "public_key_requests")
 
     @property
     def public_key_requests(self):
-        requests = []
-        for d, sds, files in os.walk(self.public_key_requests_path):
-            for f in files:
-                if f[-5:] == '.json':
-                    request_path = os.path.join(d, f)
-                    with open(request_path) as f:
-                        request = json.loads(f.read())
-                        request.update(modified_at=datetime.datetime.fromtimestamp(os.path.getmtime(request_path)))
-                        requests.append(request)
-        return requests
+        return self.storage.public_key_requests()
 
     def store_volunteered_public_key(self, request: dict) -> bool:
-        public_keys_path = os.path.join(self.public_keys_path, request['payload']['user2'])
-        if not os.path.exists(public_keys_path):
-            os.makedirs(public_keys_path)
-
-        public_key_path = os.path.join(public_keys_path, 'public.key')
-        with open(public_key_path, "w+") as pkf:
-            pkf.write(request['payload']['public_key'])
-
-        return True
+        return self.storage.store_public_key(request['payload']['user2'], request['payload']['public_key'])
 
     def store_public_key_request(self, request: dict) -> bool:
-        request_path = os.path.join(
-            self.public_key_requests_path,
-            request['payload']['user2']
-        )
-        if not os.path.exists(request_path):
-            os.makedirs(request_path)
-
-        with open(os.path.join(request_path, "request.json"), "w+") as f:
-            f.write(json.dumps(request['payload']))
-
-        return True
+        return self.storage.store_public_key_request(request['payload']['user2'], request['payload'])
 
     def process_public_key_request(self, request: dict) -> bool:
-        print("request_public_key message from: {}".format(request['user2']))
-        print(request)
-
         password = str(uuid.uuid4())
         password_rsaed = bytes2hexstr(encrypt_rsa(password, request['public_key']))
 
@@ -493,14 +1627,30 @@ class User:
         )
 
         frame_response = send_frame_users(frame, self, request['user2'])
-        pprint.pprint(frame_response)
 
-        return True
+        return frame_response.get('success') is True
+
+    def process_public_key_requests(self, policy: str = 'all', workers: int = 16) -> dict:
+        """
+        answer every stored public key request that policy accepts, a few at a time.
+
+        Returns
+        -------
+        dict
+            each requesting username mapped to dict(success=..., error=...). requests that
+            weren't accepted or couldn't be answered are kept for later
+        """
+
+        return self._process_all(
+            self.process_public_key_request,
+            self.remove_public_key_request,
+            self.public_key_requests,
+            policy,
+            workers
+        )
 
     def remove_public_key_request(self, request: dict) -> bool:
-        request_path = os.path.join(self.public_key_requests_path, request['user2'], 'request.json')
-        if os.path.exists(request_path):
-            os.remove(request_path)
+        if self.storage.remove_public_key_request(request['user2']):
             return True
         else:
             print("PATH NOT FOUND")
@@ -518,58 +1668,42 @@ class User:
 
     @property
     def public_key_responses(self):
-        responses = []
-        for d, sds, files in os.walk(self.public_key_responses_path):
-            for f in files:
-                if f[-5:] == '.json':
-                    response_path = os.path.join(d, f)
-                    with open(response_path) as f:
-                        response = json.loads(f.read())
-                        response.update(modified_at=datetime.datetime.fromtimestamp(os.path.getmtime(response_path)))
-                        responses.append(response)
-
-        return responses
+        return self.storage.public_key_responses()
 
     def store_public_key_response(self, frame):
-        response_path = os.path.join(
-            self.public_key_responses_path,
-            frame['payload']['user2']
-        )
+        return self.storage.store_public_key_response(frame['payload']['user2'], frame['payload'])
 
-        if not os.path.exists(response_path):
-            os.makedirs(response_path)
-
-        with open(os.path.join(response_path, "response.json"), "w+") as f:
-            f.write(json.dumps(frame['payload']))
+    def process_public_key_response(self, response):
+        password = decrypt_rsa(
+            hexstr2bytes(response['password']),
+            self.private_key_text
+        )
+        decrypted_text = decrypt_symmetric(hexstr2bytes(response['public_key']), password)
 
-        return True
+        return self.storage.store_public_key(response['user2'], decrypted_text)
 
-    def process_public_key_response(self, response):
-        print(response)
-        public_keys_path = os.path.join(self.public_keys_path, response['user2'])
-        if not os.path.exists(public_keys_path):
-            os.makedirs(public_keys_path)
-
-        public_key_path = os.path.join(public_keys_path, 'public.key')
-        with open(public_key_path, "w+") as pkf:
-            password = decrypt_rsa(
-                hexstr2bytes(response['password']),
-                self.private_key_text
-            )
-            decrypted_text = decrypt_symmetric(hexstr2bytes(response['public_key']), password)
-            pkf.write(decrypted_text)
+    def remove_public_key_response(self, response):
+        assert self.storage.remove_public_key_response(response['user2'])
 
         return True
 
-    def remove_public_key_response(self, response):
-        response_path = os.path.join(self.public_key_responses_path, response['user2'], 'response.json')
-        if os.path.exists(response_path):
-            os.remove(response_path)
+    def process_public_key_responses(self, policy: str = 'all', workers: int = 16) -> dict:
+        """
+        store the public key from every stored public key response that policy accepts.
 
-        else:
-            assert False
+        Returns
+        -------
+        dict
+            each responding username mapped to dict(success=..., error=...)
+        """
 
-        return True
+        return self._process_all(
+            self.process_public_key_response,
+            self.remove_public_key_response,
+            self.public_key_responses,
+            policy,
+            workers
+        )
 
     # ----------------------------------------------------------------------------------------
     #
@@ -590,10 +1724,26 @@ class User:
 
         return os.path.join(self.path, "ipcache")
 
+    @property
+    def ipcache_store(self) -> IPCache:
+        """
+        the ipcache for this user, from their storage.
+
+        Returns
+        -------
+        IPCache
+            the in-memory ipcache, or the ipcache table if the user is on sqlite
+        """
+
+        return self.storage.ipcache
+
     @property
     def ipcache(self) -> dict:
         """
-        load the ipcache from disk and return it as a dict.
+        return the ipcache as a dict.
+
+        it comes from memory, and is only read from disk again if cache.json changed.
+        it is a copy, so it is safe to loop over while it changes.
 
         Returns
         -------
@@ -601,13 +1751,7 @@ class User:
             the entire ipcache for this user
         """
 
-        try:
-            path = os.path.join(self.ipcache_path, "cache.json")
-            return json.loads(open(path).read())
-        except json.decoder.JSONDecodeError:
-            return dict()
-        except FileNotFoundError:
-            return dict()
+        return self.ipcache_store.snapshot()
 
     def remove_contact_ip_port(self, username: str) -> bool:
         """
@@ -624,15 +1768,7 @@ class User:
             true or false for success or failure
         """
 
-        try:
-            del self.ipcache_data[username]
-        except KeyError:
-            pass
-
-        path = os.path.join(self.ipcache_path, "cache.json")
-        with open(path, "w+") as f:
-            f.write(json.dumps(self.ipcache_data))
-
+        self.ipcache_store.remove(username)
         return True
 
     def get_contact_ip_port(self, username: str) -> bool:
@@ -650,11 +1786,12 @@ class User:
             the ip port combo for the requested user
         """
 
-        try:
-            return (self.ipcache[username]['ip'], self.ipcache[username]['port'])
-        except KeyError:
+        entry = self.ipcache_store.get(username)
+        if entry is None:
             return None, None
 
+        return (entry['ip'], entry['port'])
+
     def set_contact_ip_port(self, username: str, ip : str, port: int) -> bool:
         """
         cache the ip:port for username, and write it to disk for later user.
@@ -662,15 +1799,7 @@ class User:
         TODO JHILL: better docstring
         """
 
-        self.ipcache_data[username] = dict(
-            ip=ip,
-            port=port
-        )
-
-        path = os.path.join(self.ipcache_path, "cache.json")
-        with open(path, "w+") as f:
-            f.write(json.dumps(self.ipcache_data))
-
+        self.ipcache_store.set(username, ip, port)
         return True
 
     # ----------------------------------------------------------------------------------------
@@ -686,7 +1815,8 @@ class User:
         then we can pass them around without revealing much
         about the users we have contact with.
 
-        this will be used in the check_net_topo call
+        this will be used in the check_net_topo call. the ipcache keeps it up to date as
+        contacts change, so it isn't hashed again every time.
 
         Returns
         -------
@@ -694,12 +1824,7 @@ class User:
             the user's usernames hashed to a dump of their ip/port
         """
 
-        hips = dict()
-
-        for k, v in self.ipcache.items():
-            hips[str2hashed_hexstr(k)] = str2hashed_hexstr(json.dumps(v))
-
-        return hips
+        return self.ipcache_store.hashed()
 
     def flush_inconsistent_user(
         self, 
@@ -711,7 +1836,7 @@ class User:
         Parameters
         ----------
         user2: str
-            the user to flush
+            the hashed username of the user to flush
 
         Returns
         -------
@@ -719,74 +1844,159 @@ class User:
             usually True
         """
 
-        for k in self.ipcache.keys():
-            # TODO JHILL: maybe challenge that user first? and if they fail the challenge
-            # then flush them?
-            hashed_username = str2hashed_hexstr(k)
-            if hashed_username.strip() == user2.strip():
-                self.remove_contact_ip_port(user2)
-                self.seek_user(user2)
+        # TODO JHILL: maybe challenge that user first? and if they fail the challenge
+        # then flush them?
+        k = self.ipcache_store.username_for_hash(user2.strip())
+        if k is not None:
+            self.remove_contact_ip_port(k)
+            self.schedule_seek(k)
 
         return True
 
     def check_net_topo(
         self,
-        custody_chain=[],
-        hashed_ipcaches=dict()
-    ) -> bool:
+        custody_chain=None,
+        digest=None,
+        origin_id=None,
+        capacity=None
+    ) -> TopologyDigest:
         """
         see what everyone says about the state of the network togography.
 
-        anyone receiving this can hash their users and their ip:ports and put it in the dictionary
-        if someone tries to insert a different value for a particular key, they should alert
+        anyone receiving this can hash their users and their ip:ports and add them to the digest
+        if someone already added a different value for a particular key, they should alert
         the network that there is an inconsistent user 'net_topo_damaged'
 
         clients receiving 'net_topo_damaged' can choose to flush that user from their cache
         and seek them out again if they care too, or have their public key
 
+        Parameters
+        ----------
+        custody_chain: CustodyChain
+            who has already seen this check
+
+        digest: TopologyDigest
+            what everyone along the way has in their ipcaches, see TopologyDigest
+
+        origin_id: str
+            the id of the check, that every copy of it keeps. None to start a new one
+
+        capacity: int
+            how many users the first layer of the digest is sized for, when starting a new one
 
+        Returns
+        -------
+        TopologyDigest
+            the digest, with everything we and everyone we passed it on to added
         """
 
+        if custody_chain is None:
+            custody_chain = CustodyChain()
+        if digest is None:
+            digest = TopologyDigest.for_capacity(capacity or TopologyDigest.capacity)
+
         # use the custody chain to ensure you don't forward this to anyone
         # who has already seen it
-        custody_chain.append(str2hashed_hexstr(self.username))
+        custody_chain.add(self.username)
+        origin_id = self._origin_id(origin_id)
 
-        # iterate through your hashed_ipcache and try to insert
-        # the items into the dictionary that is getting handed around
-        # if it is already there, send out net_topo_damaged
-        for k, v in self.hashed_ipcache().items():
+        # iterate through your hashed_ipcache and try to add
+        # the items to the digest that is getting handed around
+        # if someone added something else for them, send out net_topo_damaged
+        # they're all reported together once we're done
+        hashed_ipcache = self.hashed_ipcache()
+        damaged = dict()
 
-            # did someone put something else in it already?
-            if k in hashed_ipcaches and hashed_ipcaches[k] != v:
-
-                # if so then notify everyone about the inconsistent_user
-                for notification_user in self.ipcache.keys():
-                    frame = Frame(
-                        action='net_topo_damaged',
-                        payload=dict(
-                            inconsistent_user=k
-                        )
-                    )
+        for k, v in hashed_ipcache.items():
 
-                    send_frame_users(frame, self, notification_user)
+            # did someone put something else in it already?
+            if digest.conflicts(k, v):
+                damaged[k] = True
             else:
-                hashed_ipcaches[k] = v
+                digest.add(k, v)
 
         # now send the original check_net_topo message to everyone in your
         # ipcache so they can do the above with it
         # hopefully this will shake out all inconsistent users from the
         # network
-        for k in self.ipcache.keys():
-            hashed_username = str2hashed_hexstr(k)
+        for k, hashed_username in self.ipcache_store.hashed_usernames().items():
             if hashed_username not in custody_chain:
                 response_frame = Frame(
                     action='check_net_topo',
                     payload=dict(
-                        custody_chain=custody_chain,
-                        hashed_ipcaches=hashed_ipcaches
+                        custody_chain=custody_chain.to_payload(),
+                        digest=digest.to_payload(),
+                        origin_id=origin_id
                     )
                 )
 
-                send_frame_users(response_frame, self, k)
+                response = send_frame_users(response_frame, self, k)
 
-        return True
+                # they send back everything they and everyone after them added, so check
+                # ours against that, and pass it on to the rest of our contacts as well
+                if response.get('digest') is not None:
+                    returned = TopologyDigest.from_payload(response['digest'])
+                    for k2, v2 in hashed_ipcache.items():
+                        if returned.conflicts(k2, v2):
+                            damaged[k2] = True
+                    digest.union(returned)
+
+        if len(damaged) > 0:
+            self.report_damaged(list(damaged.keys()))
+
+        return digest
+
+    @property
+    def damage_queue(self) -> DamageQueue:
+        return DamageQueue.for_user(self.username)
+
+    def report_damaged(self, hashed_usernames: list) -> int:
+        """
+        tell all of our contacts about inconsistent users, in one net_topo_damaged frame each.
+
+        users we've told them about lately are left out, see DamageQueue.
+
+        Parameters
+        ----------
+        hashed_usernames: list
+            the hashed usernames of the inconsistent users
+
+        Returns
+        -------
+        int
+            how many were reported
+        """
+
+        report = self.damage_queue.to_report(hashed_usernames)
+        if len(report) == 0:
+            return 0
+
+        for notification_user in self.ipcache.keys():
+            frame = Frame(
+                action='net_topo_damaged',
+                payload=dict(
+                    inconsistent_users=report
+                )
+            )
+
+            send_frame_users(frame, self, notification_user)
+
+        return len(report)
+
+    def queue_inconsistent_users(self, hashed_usernames: list) -> int:
+        """
+        queue inconsistent users we were told about to be flushed, at the damage queue's pace.
+
+        Parameters
+        ----------
+        hashed_usernames: list
+            the hashed usernames of the inconsistent users, only the ones in our ipcache are queued
+
+        Returns
+        -------
+        int
+            how many were queued
+        """
+
+        ours = [h.strip() for h in hashed_usernames if self.ipcache_store.username_for_hash(h.strip()) is not None]
+        return self.damage_queue.enqueue(ours, self.flush_inconsistent_user)
@@ -11,10 +11,16 @@ contains numerous utility functions
 
 from argparse import Namespace
 import binascii
+import bisect
+import collections
+import functools
 import hashlib
 import json
 import os
+import random
 import socket
+import threading
+import uuid
 
 from Crypto.Cipher import PKCS1_OAEP
 from Crypto.PublicKey import RSA
@@ -41,6 +47,53 @@ def flatten(data_list: list) -> list:
     return [item for sublist in data_list for item in sublist]
 
 
+def map_concurrently(f, items: list, workers: int = 16) -> list:
+    """
+    call f on every item, on up to workers threads at once.
+
+    Parameters
+    ----------
+    f : callable
+        what to call on each item
+
+    items : list
+        the items
+
+    workers : int
+        how many threads to use at most
+
+    Returns
+    -------
+    list
+        what f returned for each item, in the same order as items. if f raised, the
+        exception is there instead
+    """
+
+    items = list(items)
+    results = [None] * len(items)
+    indexes = iter(range(len(items)))
+    lock = threading.Lock()
+
+    def work():
+        while True:
+            with lock:
+                i = next(indexes, None)
+            if i is None:
+                return
+            try:
+                results[i] = f(items[i])
+            except Exception as e:
+                results[i] = e
+
+    threads = [threading.Thread(target=work) for _ in range(max(1, min(workers, len(items))))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return results
+
+
 def command_header(
     action: str,
     args: Namespace
@@ -86,6 +139,174 @@ def split_contents(
     return splits
 
 
+# the gear table for the rolling hash used by chunk_contents. it is seeded so that every
+# client cuts the same content at the same boundaries, otherwise nobody could reuse anything
+_GEAR_RANDOM = random.Random(0x70636b72)
+GEAR_TABLE = [_GEAR_RANDOM.getrandbits(64) for _ in range(256)]
+GEAR_HASH_MASK = 0xFFFFFFFFFFFFFFFF
+
+# the rolling hash is an interpreted step for every byte it looks at, a few MB a second.
+# it never looks at the first min_size bytes of a chunk, so contents bigger than this get
+# longer chunks, with a longer min_size, which keeps how much of them it looks at to about
+# this much. see chunk_contents
+CHUNK_CONTENTS_LIMIT = 32 * 1024 * 1024
+
+
+def chunk_contents(
+    contents: bytes,
+    min_size: int = 2048,
+    avg_size: int = 8192,
+    max_size: int = 65536,
+    limit: int = CHUNK_CONTENTS_LIMIT
+) -> list:
+    """
+    split contents up into content-defined chunks using a gear rolling hash.
+
+    unlike split_contents, the boundaries depend on the bytes themselves, so inserting or
+    removing something near the start of a file only changes the chunks around the edit.
+
+    Parameters
+    ----------
+    contents: bytes
+        the contents to chunk
+
+    min_size: int
+        no chunk (except the last) will be smaller than this
+
+    avg_size: int
+        the desired average distance past min_size to a boundary, must be a power of 2
+
+    max_size: int
+        no chunk will be bigger than this
+
+    limit: int
+        contents bigger than this get chunks twice, four times, ... as long, min_size and
+        max_size included, the least that keeps the bytes the rolling hash looks at under
+        about limit. None to never make them longer
+
+    Returns
+    -------
+    list
+        a list of (offset, length) tuples covering all of contents in order
+    """
+
+    length = len(contents)
+
+    # the boundaries still only depend on the bytes, there are just fewer of them to pick
+    # from, so after an edit they can take a chunk or two longer to line up again. the
+    # scale only changes at powers of two, so contents that grow a little are still cut
+    # the same way
+    if limit is not None and length > limit:
+        scale = 1 << ((length - 1) // limit).bit_length()
+        slack = max_size - min_size
+        min_size = scale * (min_size + avg_size) - avg_size
+        max_size = min_size + slack
+
+    bits = avg_size.bit_length() - 1
+    mask = ((1 << bits) - 1) << (64 - bits)
+
+    # locals, and iterating over a view, rather than indexing, make it about 1.4x faster
+    table = GEAR_TABLE
+    full = GEAR_HASH_MASK
+    view = memoryview(contents)
+
+    chunks = []
+    start = 0
+    while start < length:
+        end = min(start + max_size, length)
+        index = min(start + min_size, end)
+        h = 0
+        for b in view[index:end]:
+            h = ((h << 1) + table[b]) & full
+            index = index + 1
+            if not h & mask:
+                break
+
+        chunks.append((start, index - start))
+        start = index
+
+    return chunks
+
+
+def read_stream_range(files: list, offset: int, length: int) -> bytes:
+    """
+    read part of a stream that is spread over several files, one after the other.
+
+    Parameters
+    ----------
+    files: list
+        (path, offset, length) tuples, in stream order
+
+    offset: int
+        where in the stream to start reading
+
+    length: int
+        how much to read
+
+    Returns
+    -------
+    bytes
+        what was read, which is short if the files are
+    """
+
+    data = []
+    index = max(bisect.bisect_right([f[1] for f in files], offset) - 1, 0)
+    while length > 0 and index < len(files):
+        path, file_offset, file_length = files[index]
+        start = offset - file_offset
+        if 0 <= start < file_length:
+            with open(path, "rb") as f:
+                f.seek(start)
+                read = f.read(min(length, file_length - start))
+            if len(read) == 0:
+                break
+            data.append(read)
+            offset = offset + len(read)
+            length = length - len(read)
+        index = index + 1
+
+    return b"".join(data)
+
+
+def write_stream_range(files: list, offset: int, data: bytes, open_file=None) -> None:
+    """
+    write part of a stream that is spread over several files, one after the other.
+
+    Parameters
+    ----------
+    files: list
+        (path, offset, length) tuples, in stream order
+
+    offset: int
+        where in the stream to start writing
+
+    data: bytes
+        what to write
+
+    open_file: callable
+        returns an already open file for a path. the file is left open. without
+        it every file is opened and closed again
+    """
+
+    index = max(bisect.bisect_right([f[1] for f in files], offset) - 1, 0)
+    while len(data) > 0 and index < len(files):
+        path, file_offset, file_length = files[index]
+        start = offset - file_offset
+        if 0 <= start < file_length:
+            written = data[:file_length - start]
+            if open_file is None:
+                with open(path, "r+b") as f:
+                    f.seek(start)
+                    f.write(written)
+            else:
+                f = open_file(path)
+                f.seek(start)
+                f.write(written)
+            offset = offset + len(written)
+            data = data[len(written):]
+        index = index + 1
+
+
 def hexstr2bytes(hs: str) -> bytes:
     """ convert hs to bytes. """
 
@@ -109,6 +330,41 @@ def str2hashed_hexstr(s: Any) -> str:
     return bytes2hexstr(m.digest())
 
 
+# how much of the hash a recipient tag keeps. anyone with the recipient's public key can
+# work the tag out, relays included, so it is kept short enough that one key in 256 matches
+# any tag. a relay checking a frame against a public key it has only learns that the frame
+# may be for that user, or for any of the others that match. that is all it hides: over
+# many frames, a user that keeps matching is probably being looked for
+RECIPIENT_TAG_BYTES = 1
+
+
+def recipient_tag(fingerprint: str, nonce: str, length: int = RECIPIENT_TAG_BYTES) -> str:
+    """
+    return the tag that marks a frame as possibly for whoever has fingerprint.
+
+    checking a tag costs a hash, instead of an rsa decryption that fails, for all but
+    about one in 256 of the frames that aren't for us.
+
+    Parameters
+    ----------
+    fingerprint: str
+        the fingerprint of the recipient's public key
+
+    nonce: str
+        the frame's nonce
+
+    length: int
+        how many bytes of the hash to keep
+
+    Returns
+    -------
+    str
+        the tag, as a hex str
+    """
+
+    return str2hashed_hexstr(nonce + fingerprint)[:length * 2]
+
+
 def pad_content(content: Any) -> str:
     """ pad content out to 16 bytes. """
 
@@ -123,18 +379,62 @@ def generate_rsa_pub_priv():
     return RSA.generate(2048, e=65537)
 
 
+@functools.lru_cache(maxsize=1024)
+def rsa_key(key_text):
+    """
+    import an rsa key from its PEM text, remembering the last few.
+
+    importing a private key checks it thoroughly, which costs far more than decrypting
+    with it, and we decrypt with the same private key over and over.
+
+    Parameters
+    ----------
+    key_text: str
+        the PEM text of the public or private key
+
+    Returns
+    -------
+    RSA.RsaKey
+        the key
+    """
+
+    return RSA.importKey(key_text)
+
+
 def encrypt_rsa(content, public_key_text):
     if type(content) == str:
         content = content.encode()
 
-    return PKCS1_OAEP.new(RSA.importKey(public_key_text)).encrypt(content)
+    return PKCS1_OAEP.new(rsa_key(public_key_text)).encrypt(content)
 
 
 def decrypt_rsa(content, private_key_text):
     if type(content) == str:
         content = content.encode()
 
-    return PKCS1_OAEP.new(RSA.importKey(private_key_text)).decrypt(content)
+    return PKCS1_OAEP.new(rsa_key(private_key_text)).decrypt(content)
+
+
+@functools.lru_cache(maxsize=64)
+def blowfish_cipher(password: bytes) -> blowfish.Cipher:
+    """
+    build the blowfish cipher for password, remembering the last few.
+
+    setting up the key schedule costs about as much as encrypting a few KB, and every
+    chunk of a message is encrypted with the same password, so it's worth keeping around.
+
+    Parameters
+    ----------
+    password: bytes
+        the password to use
+
+    Returns
+    -------
+    blowfish.Cipher
+        the cipher
+    """
+
+    return blowfish.Cipher(password)
 
 
 def encrypt_symmetric(content, password, callback=None):
@@ -162,7 +462,7 @@ def encrypt_symmetric(content, password, callback=None):
     if type(content) is not bytes:
         content = content.encode()
 
-    cipher = blowfish.Cipher(password)
+    cipher = blowfish_cipher(password)
     data_encrypted = b"".join(cipher.encrypt_ecb(content))
 
     # data_decrypted = b"".join(cipher.decrypt_ecb(data_encrypted))
@@ -198,7 +498,7 @@ def decrypt_symmetric(content, password, decode=True):
     if type(content) is not bytes:
         content = content.encode()
 
-    cipher = blowfish.Cipher(password)
+    cipher = blowfish_cipher(password)
     data_decrypted = b"".join(cipher.decrypt_ecb(content))
 
     if decode:
@@ -243,10 +543,264 @@ def is_binary(mt):
     return mt in ['image/png', 'image/jpg']
 
 
+def is_message_id(message_id: Any) -> bool:
+    """
+    determine if a message_id is one that Message would have made, a uuid.
+
+    message ids come in from other users and end up in paths, so anything else is refused.
+
+    Parameters
+    ----------
+    message_id : Any
+        the message id
+
+    Returns
+    -------
+    bool
+        true if message_id is a uuid, with or without its dashes
+    """
+
+    if not isinstance(message_id, str):
+        return False
+
+    try:
+        parsed = uuid.UUID(message_id)
+    except ValueError:
+        return False
+
+    return message_id in (str(parsed), parsed.hex)
+
+
+# how long a socket waits for the other side, in seconds. frames are answered after
+# everything they set off (ie: a seek_user going through the network), so this is long,
+# but a peer that never finishes writing, or never answers, can't hold a thread forever
+SOCKET_TIMEOUT = 120.0
+
+
+def recv_all(sock: socket.socket, buffer_size: int = 65536) -> bytes:
+    """
+    read from sock until the other side is done writing.
+
+    frames carrying chunk manifests can be much bigger than one recv, so we can't
+    count on getting everything in one go. raises socket.timeout if the other side
+    stops sending for longer than the socket's timeout without being done.
+
+    Parameters
+    ----------
+    sock : socket.socket
+        the socket to read from
+
+    buffer_size : int
+        how much to ask for on each recv
+
+    Returns
+    -------
+    bytes
+        everything that was sent
+    """
+
+    data = []
+    while True:
+        received = sock.recv(buffer_size)
+        if not received:
+            break
+        data.append(received)
+    return b"".join(data)
+
+
+# the surfaces listening in this process, (ip, port) -> their LocalSurface
+LOCAL_SURFACES = dict()
+
+
+class LocalSurface:
+    """
+    this class hands frames to a surface in this process, for its own threads to handle.
+
+    a frame is put on the surface's queue and handled by one of its threads, like a frame
+    that came in over a socket, while the sender waits for the response. a handler can
+    be waiting on a frame it sent to another surface, which can be waiting on one sent
+    back to us, so when every thread is busy another one is started. threads that have
+    had nothing to do for idle seconds go away again.
+    """
+
+    # how long a thread waits for another frame before it goes away, in seconds
+    idle = 10.0
+
+    def __init__(self, dispatch):
+        self.dispatch = dispatch
+        self.requests = collections.deque()
+        self.condition = threading.Condition()
+        self.idle_threads = 0
+
+    def send(self, request: dict) -> dict:
+        """
+        put a request on the queue and wait for the response to it.
+
+        Parameters
+        ----------
+        request : dict
+            the frame, as it would come off the wire
+
+        Returns
+        -------
+        dict
+            the response, or a timed out error if it took longer than SOCKET_TIMEOUT
+        """
+
+        entry = dict(request=request, done=threading.Event(), response=None)
+
+        with self.condition:
+            self.requests.append(entry)
+
+            # every idle thread takes one of the requests when it wakes up
+            if len(self.requests) > self.idle_threads:
+                threading.Thread(target=self._work, daemon=True).start()
+            else:
+                self.condition.notify()
+
+        if entry['done'].wait(SOCKET_TIMEOUT) is False:
+            return dict(
+                success=False,
+                error="timed out"
+            )
+
+        return entry['response']
+
+    def _work(self) -> None:
+        while True:
+            with self.condition:
+                if len(self.requests) == 0:
+                    self.idle_threads = self.idle_threads + 1
+                    self.condition.wait(self.idle)
+                    self.idle_threads = self.idle_threads - 1
+
+                if len(self.requests) == 0:
+                    return
+
+                entry = self.requests.popleft()
+
+            try:
+                entry['response'] = self.dispatch(entry['request'])
+            except Exception as e:
+                # over a socket the connection would just close, here the sender would wait
+                entry['response'] = dict(
+                    success=False,
+                    error="couldn't handle the frame: {}".format(e)
+                )
+
+            entry['done'].set()
+
+
+def register_local_surface(ip: str, port: int, dispatch) -> None:
+    """
+    let send_frame_users hand frames for ip:port to dispatch, on the surface's own threads, instead of connecting.
+
+    Parameters
+    ----------
+    ip : str
+        the ip the surface is listening on
+
+    port : int
+        the port the surface is listening on
+
+    dispatch : callable
+        takes the request dict and returns the response dict
+    """
+
+    LOCAL_SURFACES[(ip, int(port))] = LocalSurface(dispatch)
+
+
+def unregister_local_surface(ip: str, port: int) -> None:
+    """ stop delivering frames for ip:port locally. """
+
+    LOCAL_SURFACES.pop((ip, int(port)), None)
+
+
+def send_frame_local(frame, local: LocalSurface) -> dict:
+    """
+    deliver a frame to a surface in this process, without a socket.
+
+    the frame and the response are still copied through json, so neither side ever
+    sees the other's objects, and both see exactly what they would have over the wire.
+
+    Parameters
+    ----------
+    frame : frame
+        the frame to send
+
+    local : LocalSurface
+        the surface
+
+    Returns
+    -------
+    dict
+        the response
+    """
+
+    response = local.send(json.loads(str(frame)))
+
+    return json.loads(json.dumps(response))
+
+
+def send_frame_ip_port(frame, ip: str, port: int) -> dict:
+    """
+    send a frame to whoever is listening at ip:port.
+
+    if they are listening in this process, the frame is handed to their surface directly.
+
+    Parameters
+    ----------
+    frame : frame
+        the frame to send, with frame.to set if the surface may be hosting many users
+
+    ip : str
+        where to send it
+
+    port: int
+        where to send it
+
+    Returns
+    -------
+    dict
+        a dict with a success and error flag
+    """
+
+    local = LOCAL_SURFACES.get((ip.strip(), int(port)))
+    if local is not None:
+        return send_frame_local(frame, local)
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.settimeout(SOCKET_TIMEOUT)
+
+    try:
+        sock.connect((ip.strip(), int(port)))
+        frame_str = str(frame).encode()
+        sock.sendall(frame_str)
+
+        # let the surface know we're done so it can stop reading
+        sock.shutdown(socket.SHUT_WR)
+        response = json.loads(recv_all(sock).decode())
+        sock.close()
+        return response
+    except ConnectionRefusedError:
+        return dict(
+            success=False,
+            error="connection refused"
+        )
+    except socket.timeout:
+        sock.close()
+        return dict(
+            success=False,
+            error="timed out"
+        )
+
+
 def send_frame_users(frame, user1, user2):
     """
     send a frame from user1 to user2.
 
+    if user2 is listening in this process, the frame is handed to their surface directly.
+
     Parameters
     ----------
     frame : frame
@@ -267,21 +821,8 @@ def send_frame_users(frame, user1, user2):
     ip, port = user1.get_contact_ip_port(user2)
 
     if ip and port:
-        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-
-        try:
-            sock.connect((ip.strip(), int(port)))
-            frame_str = str(frame).encode()
-            len_sent = sock.send(frame_str)
-            assert len_sent == len(frame_str)
-            response = json.loads(sock.recv(4096).decode())
-            sock.close()
-            return response
-        except ConnectionRefusedError:
-            return dict(
-                success=False,
-                error="connection refused"
-            )
+        frame.to = str2hashed_hexstr(user2)
+        return send_frame_ip_port(frame, ip, port)
     else:
         # TODO JHILL: remove them from the cache
         # and then send out a seek user for them
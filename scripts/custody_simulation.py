@@ -0,0 +1,123 @@
+"""
+
+simulate seek_user frames spreading through a network, with list and bloom custody chains.
+
+every node has a few random contacts, and forwards a frame exactly like the surface does:
+to every contact the custody chain doesn't have, until the chain has been through --hops
+users. a bloom filter can mistake someone for having seen a frame already, so they miss
+it from that forwarder. this shows how much that costs in reach, for the default chain
+and for smaller ones, and how big the chain makes every frame.
+
+usage: python scripts/custody_simulation.py --nodes 1000 --degree 8 --hops 4
+
+"""
+
+from argparse import ArgumentParser
+import json
+import random
+
+from pckr.frame import CustodyChain
+from pckr.user import SEEK_HOPS
+from pckr.utilities import str2hashed_hexstr
+from utils import make_network
+
+
+class ListCustodyChain:
+    """ the custody chain the way it used to be, a list of hashed usernames. """
+
+    def __init__(self, chain: list = None):
+        self.chain = chain or []
+
+    @property
+    def hops(self) -> int:
+        return len(self.chain)
+
+    def add(self, username: str) -> None:
+        self.chain.append(str2hashed_hexstr(username))
+
+    def __contains__(self, hashed_username: str) -> bool:
+        return hashed_username in self.chain
+
+    def copy(self) -> 'ListCustodyChain':
+        return ListCustodyChain(list(self.chain))
+
+    def to_payload(self) -> list:
+        return self.chain
+
+
+def simulate_seek(network: dict, origin: str, make_chain, hops: int) -> dict:
+    """
+    send one seek_user frame out from origin and follow every copy of it.
+
+    Returns
+    -------
+    dict
+        how many nodes it reached, how many frames were sent, and the biggest custody chain
+        any of them carried, in bytes
+    """
+
+    hashed = {u: str2hashed_hexstr(u) for u in network.keys()}
+
+    chain = make_chain()
+    chain.add(origin)
+    queue = [(contact, chain) for contact in network[origin]]
+
+    reached = set([origin])
+    frames = len(queue)
+    largest = len(json.dumps(chain.to_payload()))
+
+    while len(queue) > 0:
+        node, chain = queue.pop()
+        reached.add(node)
+
+        if chain.hops >= hops:
+            continue
+
+        chain = chain.copy()
+        chain.add(node)
+        largest = max(largest, len(json.dumps(chain.to_payload())))
+
+        for contact in network[node]:
+            if hashed[contact] not in chain:
+                queue.append((contact, chain))
+                frames = frames + 1
+
+    return dict(reached=len(reached), frames=frames, largest=largest)
+
+
+def main():
+    """ the main handler function for this script. """
+
+    argparser = ArgumentParser()
+    argparser.add_argument("--nodes", type=int, default=1000)
+    argparser.add_argument("--degree", type=int, default=8)
+    argparser.add_argument("--hops", type=int, default=SEEK_HOPS)
+    argparser.add_argument("--seeks", type=int, default=20)
+    argparser.add_argument("--seed", type=int, default=0)
+    args = argparser.parse_args()
+
+    rng = random.Random(args.seed)
+    network = make_network(args.nodes, args.degree, rng)
+    origins = [rng.choice(list(network.keys())) for _ in range(args.seeks)]
+
+    chains = [
+        ("list", ListCustodyChain),
+        ("bloom, default", CustodyChain),
+        ("bloom, seek_user", lambda: CustodyChain.for_capacity(SEEK_HOPS + 1, 0.001)),
+        ("bloom for 4 at 10%", lambda: CustodyChain.for_capacity(4, 0.1)),
+    ]
+
+    print("nodes: {} degree: {} hops: {} seeks: {}".format(args.nodes, args.degree, args.hops, args.seeks))
+    print("{:<24}{:>12}{:>12}{:>14}".format("", "reached", "frames", "chain bytes"))
+    for name, make_chain in chains:
+        results = [simulate_seek(network, origin, make_chain, args.hops) for origin in origins]
+        print("{:<24}{:>12.1f}{:>12.1f}{:>14}".format(
+            name,
+            sum(r['reached'] for r in results) / float(len(results)),
+            sum(r['frames'] for r in results) / float(len(results)),
+            max(r['largest'] for r in results)
+        ))
+
+
+if __name__ == '__main__':
+    main()
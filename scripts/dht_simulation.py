@@ -0,0 +1,119 @@
+"""
+
+simulate finding users through the dht, against the seek_user flood.
+
+every node starts with a routing table of its contacts, like a user's is seeded from their
+ipcache, and then joins the dht by looking itself up, which is how the users closest to
+it hear about it. every lookup is answered exactly like the surface answers dht_find_node,
+including the asker being added to the routing table of everyone they ask. a lookup
+counts as a success if it hears where the user it is looking for is, and costs a frame
+for every user it asks plus the one seek_user frame sent straight to them. --offline
+nodes never answer dht lookups, as if they'd gone away since their contacts last heard
+from them (the flood doesn't model them).
+
+usage: python scripts/dht_simulation.py --nodes 1000 --degree 8 --seeks 100
+
+"""
+
+from argparse import ArgumentParser
+import random
+
+from pckr.user import RoutingTable
+from pckr.utilities import str2hashed_hexstr
+from gossip_simulation import make_latencies, simulate_seek
+from utils import make_network
+
+
+def make_tables(network: dict, hashed: dict) -> dict:
+    """ return every node's hashed username mapped to a routing table of their contacts. """
+
+    tables = dict()
+    for u, contacts in network.items():
+        table = RoutingTable(hashed[u])
+        for c in contacts:
+            table.add(hashed[c], u, 0)
+        tables[hashed[u]] = table
+
+    return tables
+
+
+def make_query(tables: dict, asker: str, target: str, offline: set):
+    """ return the query asker's lookup for target sends, which is answered the way the surface does. """
+
+    def query(nodes):
+        answers = []
+        for node in nodes:
+            if node['id'] in offline:
+                answers.append(None)
+                continue
+
+            table = tables[node['id']]
+            table.add(asker, asker, 0)
+            answers.append(table.closest(target))
+
+        return answers
+
+    return query
+
+
+def dht_seek(tables: dict, origin: str, target: str, offline: set) -> dict:
+    """ look target up from origin, both hashed usernames. """
+
+    result = tables[origin].lookup(target, make_query(tables, origin, target, offline))
+
+    return dict(
+        found=result['found'] is not None and target not in offline,
+        frames=result['frames'] + (1 if result['found'] is not None else 0),
+        rounds=result['rounds']
+    )
+
+
+def main():
+    """ the main handler function for this script. """
+
+    argparser = ArgumentParser()
+    argparser.add_argument("--nodes", type=int, default=1000)
+    argparser.add_argument("--degree", type=int, default=8)
+    argparser.add_argument("--seeks", type=int, default=100)
+    argparser.add_argument("--offline", type=float, default=0.0)
+    argparser.add_argument("--seed", type=int, default=0)
+    args = argparser.parse_args()
+
+    rng = random.Random(args.seed)
+    network = make_network(args.nodes, args.degree, rng)
+    latencies = make_latencies(network, rng)
+    hashed = {u: str2hashed_hexstr(u) for u in network.keys()}
+
+    usernames = sorted(network.keys())
+    offline = set(hashed[u] for u in rng.sample(usernames, int(args.offline * len(usernames))))
+    online = [u for u in usernames if hashed[u] not in offline]
+    seeks = [tuple(rng.sample(online, 2)) for _ in range(args.seeks)]
+
+    tables = make_tables(network, hashed)
+    join_frames = 0
+    for u in rng.sample(online, len(online)):
+        join_frames = join_frames + dht_seek(tables, hashed[u], hashed[u], set())['frames']
+
+    print("nodes: {} degree: {} seeks: {} offline: {:.0f}%".format(
+        args.nodes, args.degree, args.seeks, 100 * args.offline
+    ))
+    print("joining took {:.1f} frames per node, routing tables hold {:.1f} users on average".format(
+        float(join_frames) / len(online),
+        sum(len(table) for table in tables.values()) / float(len(tables))
+    ))
+    print("{:<24}{:>10}{:>12}{:>10}".format("", "found", "frames", "rounds"))
+
+    flood = [simulate_seek(network, latencies, hashed, o, t, None, random.Random(n)) for n, (o, t) in enumerate(seeks)]
+    dht = [dht_seek(tables, hashed[o], hashed[t], offline) for o, t in seeks]
+
+    for name, results in [("flood", flood), ("dht", dht)]:
+        print("{:<24}{:>9.0f}%{:>12.1f}{:>10}".format(
+            name,
+            100.0 * sum(1 for r in results if r['found']) / len(results),
+            sum(r['frames'] for r in results) / float(len(results)),
+            "{:.1f}".format(sum(r['rounds'] for r in results) / float(len(results))) if name == "dht" else "-"
+        ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,208 @@
+"""
+
+simulate seek_user frames looking for someone, flooded versus gossiped.
+
+every link gets a latency, and every user knows how quickly each of their contacts
+answers a ping, so the 'rtt' selection has something to go on. frames are passed on
+exactly like the surface does it, with the same custody chains and gossip policies, and
+each seek counts as a success if the frame reaches the user it is looking for. this shows
+how often each policy finds them, how long it takes, how many frames it costs and how many
+users it reaches. then it floods them depth first, the way the surface really passes them
+on, with and without the duplicate filter, to show how far they get with each.
+
+usage: python scripts/gossip_simulation.py --nodes 1000 --degree 8 --seeks 50
+
+"""
+
+from argparse import ArgumentParser
+import heapq
+import random
+
+from pckr.frame import CustodyChain, GossipPolicy
+from pckr.user import SEEK_HOPS
+from pckr.utilities import str2hashed_hexstr
+from utils import make_network
+
+
+def make_latencies(network: dict, rng: random.Random) -> dict:
+    """ return every link mapped to its one way latency, in seconds, the same both ways. """
+
+    latencies = dict()
+    for u, contacts in network.items():
+        for v in contacts:
+            if (v, u) not in latencies:
+                latencies[(u, v)] = latencies[(v, u)] = rng.uniform(0.005, 0.05)
+
+    return latencies
+
+
+def simulate_seek(
+    network: dict,
+    latencies: dict,
+    hashed: dict,
+    origin: str,
+    target: str,
+    gossip: GossipPolicy,
+    rng: random.Random,
+    dedupe: str = None,
+    depth_first: bool = False
+) -> dict:
+    """
+    send one seek_user frame out from origin, looking for target.
+
+    Parameters
+    ----------
+    dedupe: str
+        None to handle every copy of the frame, 'first' to drop every copy after the first one
+        a user gets, or 'shorter' to drop copies that haven't come fewer hops than the last
+        one they handled, which is what the surface does (see DuplicateFilter.check)
+
+    depth_first: bool
+        pass the frame on like the surface does, one contact at a time, each after the one
+        before has passed it on as far as it goes. otherwise all of the copies go out at once,
+        and arrive in order of latency
+
+    Returns
+    -------
+    dict
+        whether it reached target, when it first did (in seconds), how many frames were
+        sent in all, and how many users it reached
+    """
+
+    def rtts(node):
+        return {c: 2 * latencies[(node, c)] for c in network[node]}
+
+    ttl = gossip.ttl if gossip is not None else SEEK_HOPS
+
+    # the user who starts it remembers its origin_id, so copies that come back are dropped
+    fewest = {origin: 0}
+    found_at = None
+
+    def handle(node, chain, at) -> list:
+        """ handle a copy that got to node at at, and return the contacts it is passed on to. """
+
+        nonlocal found_at
+
+        if node in fewest:
+            if dedupe == 'first' or (dedupe == 'shorter' and chain.hops >= fewest[node]):
+                return []
+        fewest[node] = min(chain.hops, fewest.get(node, chain.hops))
+
+        if node == target:
+            if found_at is None:
+                found_at = at
+            return []
+
+        if chain.hops >= ttl:
+            return []
+        if gossip is not None and gossip.passes_on(rng) is False:
+            return []
+
+        chain = chain.copy()
+        chain.add(node)
+
+        contacts = [c for c in network[node] if hashed[c] not in chain]
+        if gossip is not None:
+            contacts = gossip.choose(contacts, rtts(node), rng)
+
+        return [(c, chain) for c in contacts]
+
+    chain = CustodyChain.for_capacity(ttl + 1, 0.001)
+    chain.add(origin)
+
+    contacts = network[origin]
+    if gossip is not None:
+        contacts = gossip.choose(contacts, rtts(origin), rng)
+    sent = len(contacts)
+
+    if depth_first:
+        # every send waits for everything it sets off, so the clock runs across all of it
+        clock = [0.0]
+
+        def send(node, chain, sender):
+            nonlocal sent
+            clock[0] = clock[0] + latencies[(sender, node)]
+            for c, next_chain in handle(node, chain, clock[0]):
+                sent = sent + 1
+                send(c, next_chain, node)
+
+        for c in contacts:
+            send(c, chain, origin)
+
+    else:
+        queue = [(latencies[(origin, c)], n, c, chain) for n, c in enumerate(contacts)]
+        heapq.heapify(queue)
+
+        while len(queue) > 0:
+            at, _, node, chain = heapq.heappop(queue)
+            for c, next_chain in handle(node, chain, at):
+                sent = sent + 1
+                heapq.heappush(queue, (at + latencies[(node, c)], sent, c, next_chain))
+
+    return dict(found=found_at is not None, found_at=found_at, frames=sent, reached=len(fewest) - 1)
+
+
+def main():
+    """ the main handler function for this script. """
+
+    argparser = ArgumentParser()
+    argparser.add_argument("--nodes", type=int, default=1000)
+    argparser.add_argument("--degree", type=int, default=8)
+    argparser.add_argument("--seeks", type=int, default=50)
+    argparser.add_argument("--seed", type=int, default=0)
+    args = argparser.parse_args()
+
+    rng = random.Random(args.seed)
+    network = make_network(args.nodes, args.degree, rng)
+    latencies = make_latencies(network, rng)
+    hashed = {u: str2hashed_hexstr(u) for u in network.keys()}
+
+    usernames = sorted(network.keys())
+    seeks = [tuple(rng.sample(usernames, 2)) for _ in range(args.seeks)]
+
+    policies = [
+        ("flood", None),
+        ("fanout 2, ttl 10", GossipPolicy(fanout=2, ttl=10)),
+        ("fanout 3, ttl 6", GossipPolicy(fanout=3, ttl=6)),
+        ("fanout 3, ttl 7", GossipPolicy(fanout=3, ttl=7)),
+        ("fanout 3, ttl 7, rtt", GossipPolicy(fanout=3, ttl=7, select='rtt')),
+        ("fanout 4, ttl 7, p=0.7", GossipPolicy(fanout=4, ttl=7, probability=0.7)),
+    ]
+
+    print("nodes: {} degree: {} seeks: {}".format(args.nodes, args.degree, args.seeks))
+    print("{:<24}{:>10}{:>14}{:>12}{:>10}".format("", "found", "latency ms", "frames", "reached"))
+    for name, gossip in policies:
+        print_results(name, [
+            simulate_seek(network, latencies, hashed, origin, target, gossip, random.Random(n))
+            for n, (origin, target) in enumerate(seeks)
+        ])
+
+    # the surface passes a frame on one contact at a time, so a user usually gets it along a
+    # long path first. dropping every copy after that one stops it short of SEEK_HOPS
+    print("")
+    print("flooded depth first, like the surface does it, by what the duplicate filter drops:")
+    print("{:<24}{:>10}{:>14}{:>12}{:>10}".format("", "found", "latency ms", "frames", "reached"))
+    for name, dedupe in [("nothing", None), ("every copy", 'first'), ("unless fewer hops", 'shorter')]:
+        print_results(name, [
+            simulate_seek(
+                network, latencies, hashed, origin, target, None, random.Random(n), dedupe=dedupe, depth_first=True
+            )
+            for n, (origin, target) in enumerate(seeks)
+        ])
+
+
+def print_results(name: str, results: list) -> None:
+    """ print how often the seeks found who they were looking for, how fast, and what it cost. """
+
+    found = [r for r in results if r['found']]
+    print("{:<24}{:>9.0f}%{:>14.1f}{:>12.1f}{:>10.1f}".format(
+        name,
+        100.0 * len(found) / len(results),
+        1000 * sum(r['found_at'] for r in found) / max(len(found), 1),
+        sum(r['frames'] for r in results) / float(len(results)),
+        sum(r['reached'] for r in results) / float(len(results))
+    ))
+
+
+if __name__ == '__main__':
+    main()
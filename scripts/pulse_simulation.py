@@ -0,0 +1,132 @@
+"""
+
+simulate measuring pulse_network frames going through networks of growing size, and
+compare what they find with the real network.
+
+every node has an rtt for each of its contacts, twice the one way latency of the link. a
+pulse starts at a random node and goes through the network like the surface passes it on:
+every node handles it unless it has already handled it after as many hops or fewer (see
+DuplicateFilter.check), adds itself and its rtts to a PulseSummary, passes it on to every
+contact that isn't in the custody chain, one after the other, unless it is max_hops away,
+and adds in every answer. this shows the estimated size, eccentricity and hops next to the
+real ones from a breadth first search, and how many frames it cost against the number of
+links, for each network size and max_hops.
+
+usage: python scripts/pulse_simulation.py --sizes 100 300 1000 3000 --degree 8 --max_hops 4 6 8
+
+"""
+
+from argparse import ArgumentParser
+from collections import deque
+import random
+import sys
+
+from pckr.frame import CustodyChain, PulseSummary
+from pckr.utilities import str2hashed_hexstr
+from gossip_simulation import make_latencies
+from utils import make_network
+
+
+def distances(network: dict, origin: str) -> dict:
+    """ return how many hops every node really is from origin. """
+
+    found = {origin: 0}
+    queue = deque([origin])
+    while len(queue) > 0:
+        node = queue.popleft()
+        for contact in network[node]:
+            if contact not in found:
+                found[contact] = found[node] + 1
+                queue.append(contact)
+
+    return found
+
+
+def simulate_pulse(network: dict, latencies: dict, origin: str, max_hops: int) -> PulseSummary:
+    """ send one measuring pulse_network frame out from origin, and return what comes back to it. """
+
+    hashed = {u: str2hashed_hexstr(u) for u in network.keys()}
+    fewest = dict()
+
+    # the surface passes the frame on before it answers, so the frame goes depth first
+    def handle(node, chain):
+        hops = len(chain)
+        if node in fewest and hops >= fewest[node]:
+            return None
+        fewest[node] = hops
+
+        chain = chain.copy()
+        chain.add(node)
+
+        summary = PulseSummary(max_hops=max_hops)
+        summary.add_user(hashed[node], hops)
+        for contact in network[node]:
+            summary.add_rtt(hashed[node], hashed[contact], 2 * latencies[(node, contact)])
+
+        if hops >= max_hops:
+            return summary
+
+        for contact in network[node]:
+            if hashed[contact] not in chain:
+                summary.frames = summary.frames + 1
+                returned = handle(contact, chain)
+                if returned is not None:
+                    summary.union(PulseSummary.from_payload(returned.to_payload()))
+
+        return summary
+
+    return handle(origin, CustodyChain())
+
+
+def main():
+    """ the main handler function for this script. """
+
+    argparser = ArgumentParser()
+    argparser.add_argument("--sizes", type=int, nargs='+', default=[100, 300, 1000, 3000])
+    argparser.add_argument("--degree", type=int, default=8)
+    argparser.add_argument("--max_hops", type=int, nargs='+', default=[4, PulseSummary.max_hops, 8])
+    argparser.add_argument("--seed", type=int, default=0)
+    args = argparser.parse_args()
+
+    # every hop is a call inside the one before it, like the frames are
+    sys.setrecursionlimit(10 * max(args.sizes) + 1000)
+
+    print("degree: {}".format(args.degree))
+    print("{:<8}{:<10}{:>10}{:>14}{:>8}{:>8}{:>10}{:>10}   {}".format(
+        "nodes", "max hops", "users", "eccentricity", "90%", "links", "frames", "per link", "within each hop"
+    ))
+
+    for size in args.sizes:
+        rng = random.Random(args.seed)
+        network = make_network(size, args.degree, rng)
+        latencies = make_latencies(network, rng)
+        origin = rng.choice(sorted(network.keys()))
+
+        real = distances(network, origin)
+        eccentricity = max(real.values())
+        within = [len([d for d in real.values() if d <= h]) for h in range(eccentricity + 1)]
+        links = sum(len(contacts) for contacts in network.values()) // 2
+
+        print("{:<8}{:<10}{:>10}{:>14}{:>8}{:>8}{:>10}{:>10}   {}".format(
+            size, "real", len(real), eccentricity,
+            next(h for h, n in enumerate(within) if n >= 0.9 * len(real)),
+            links, "-", "-", " ".join(str(n) for n in within)
+        ))
+
+        for max_hops in args.max_hops:
+            estimate = simulate_pulse(network, latencies, origin, max_hops).estimate()
+            print("{:<8}{:<10}{:>10}{:>14}{:>8}{:>8}{:>10}{:>10.1f}   {}".format(
+                size,
+                "{}{}".format(max_hops, " (cut)" if estimate['truncated'] else ""),
+                estimate['users'],
+                estimate['eccentricity'],
+                estimate['effective_hops'],
+                estimate['links'],
+                estimate['frames'],
+                float(estimate['frames']) / links,
+                " ".join(str(n) for n in estimate['within'])
+            ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+"""
+
+compare the directory layout and sqlite as the storage behind User.
+
+both backends get the same contacts (an ipcache entry and a public key each), and then
+the same lookups, listings and fingerprint searches, timed. everything happens in a
+temporary directory that is removed afterwards.
+
+usage: python scripts/storage_benchmark.py --contacts 100000
+
+"""
+
+from argparse import ArgumentParser
+import base64
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from pckr.user import DirectoryStorage, SQLiteStorage
+from pckr.user.storage import public_key_fingerprint
+
+
+def fake_public_key(n: int) -> str:
+    """ something the size and shape of a PEM public key, much quicker than making real ones. """
+
+    body = base64.b64encode(random.Random(n).getrandbits(294 * 8).to_bytes(294, 'big')).decode()
+    lines = [body[i:i + 64] for i in range(0, len(body), 64)]
+    return "\n".join(["-----BEGIN PUBLIC KEY-----"] + lines + ["-----END PUBLIC KEY-----"])
+
+
+def timed(results: dict, name: str, f) -> None:
+    st = time.time()
+    f()
+    results[name] = time.time() - st
+
+
+def benchmark(storage, contacts: int, lookups: int, searches: int) -> dict:
+    """
+    run every operation against storage.
+
+    Returns
+    -------
+    dict
+        the name of each operation mapped to how long it took, in seconds
+    """
+
+    usernames = ["user{}".format(n) for n in range(contacts)]
+    rng = random.Random(0)
+    sample = [rng.choice(usernames) for _ in range(lookups)]
+    fingerprints = [public_key_fingerprint(fake_public_key(rng.randrange(contacts))) for _ in range(searches)]
+
+    results = dict()
+
+    def store():
+        for n, username in enumerate(usernames):
+            storage.store_public_key(username, fake_public_key(n))
+            storage.ipcache.set(username, "127.0.0.1", 8000 + n % 1000)
+
+        # the directory ipcache writes in the background, make sure it is on disk
+        if hasattr(storage.ipcache, 'flush'):
+            storage.ipcache.flush()
+
+    def get_public_keys():
+        for username in sample:
+            assert storage.get_public_key(username) is not None
+
+    def get_ipcache():
+        for username in sample:
+            assert storage.ipcache.get(username) is not None
+
+    def list_public_keys():
+        assert len(storage.public_keys()) == contacts
+
+    def snapshot_ipcache():
+        assert len(storage.ipcache.snapshot()) == contacts
+
+    def find_public_keys():
+        for fingerprint in fingerprints:
+            assert storage.find_public_key(fingerprint) is not None
+
+    timed(results, "store {} contacts".format(contacts), store)
+    timed(results, "get {} public keys".format(lookups), get_public_keys)
+    timed(results, "get {} ipcache entries".format(lookups), get_ipcache)
+    timed(results, "list public keys", list_public_keys)
+    timed(results, "read whole ipcache", snapshot_ipcache)
+    timed(results, "find {} public keys by fingerprint".format(searches), find_public_keys)
+
+    return results
+
+
+def main():
+    argparser = ArgumentParser()
+    argparser.add_argument("--contacts", type=int, required=False, default=100000)
+    argparser.add_argument("--lookups", type=int, required=False, default=10000)
+    argparser.add_argument("--searches", type=int, required=False, default=3)
+    args = argparser.parse_args()
+
+    root = tempfile.mkdtemp(prefix="pckr_storage_benchmark_")
+    try:
+        results = dict()
+        for name, kind in [("directory", DirectoryStorage), ("sqlite", SQLiteStorage)]:
+            path = os.path.join(root, name)
+            for sd in ["ipcache", "public_keys"]:
+                os.makedirs(os.path.join(path, sd))
+
+            print("running {}...".format(name))
+            results[name] = benchmark(kind(path), args.contacts, args.lookups, args.searches)
+
+        print("")
+        print("{:<45}{:>12}{:>12}{:>10}".format("", "directory", "sqlite", ""))
+        for operation in results['directory'].keys():
+            d = results['directory'][operation]
+            s = results['sqlite'][operation]
+            print("{:<45}{:>11.3f}s{:>11.3f}s{:>9.1f}x".format(operation, d, s, d / s if s > 0 else 0))
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    main()
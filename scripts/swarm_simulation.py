@@ -0,0 +1,97 @@
+"""
+
+simulate sending one message to many recipients, sequentially versus as a swarm.
+
+every node gets the same uplink (one chunk per tick) and the swarm is scheduled with
+the same functions the client uses, so the numbers show how much the origin's uplink
+stops mattering. over loopback every node would have all the bandwidth in the world,
+which is why the uplinks are modelled here instead.
+
+usage: python scripts/swarm_simulation.py --nodes 20 --chunks 200
+
+"""
+
+from argparse import ArgumentParser
+
+from pckr.message import assign_seed_chunks, plan_swarm_fetch
+
+
+ORIGIN = 'origin'
+
+
+def simulate_unicast(nodes: list, chunks: int) -> int:
+    """
+    send every chunk to every recipient, one recipient after the other.
+
+    Returns
+    -------
+    int
+        the number of ticks until everybody has everything
+    """
+
+    return len(nodes) * chunks
+
+
+def simulate_swarm(nodes: list, chunks: int, max_rounds: int = 100) -> int:
+    """
+    seed every chunk to one recipient, then let the recipients fetch from each other.
+
+    in each round every recipient asks the others what they hold and plans its fetches.
+    a round lasts as long as the busiest uploader takes to send everything asked of it.
+
+    Returns
+    -------
+    int
+        the number of ticks until everybody has everything
+    """
+
+    missing = {node: list(range(chunks)) for node in nodes}
+    seeds = assign_seed_chunks(missing)
+
+    # the origin sends everything once, one chunk per tick
+    ticks = sum(len(indexes) for indexes in seeds.values())
+    haves = {node: set(seeds[node]) for node in nodes}
+    haves[ORIGIN] = set(range(chunks))
+
+    for _ in range(max_rounds):
+        missing = {node: [i for i in range(chunks) if i not in haves[node]] for node in nodes}
+        if all(len(indexes) == 0 for indexes in missing.values()):
+            return ticks
+
+        uploads = dict()
+        arrivals = dict()
+        for node in nodes:
+            others = {peer: sorted(haves[peer]) for peer in haves.keys() if peer != node}
+            plan = plan_swarm_fetch(missing[node], others, fallback=ORIGIN)
+            for peer, indexes in plan.items():
+                uploads[peer] = uploads.get(peer, 0) + len(indexes)
+                arrivals.setdefault(node, set()).update(indexes)
+
+        ticks = ticks + max(uploads.values())
+        for node, indexes in arrivals.items():
+            haves[node].update(indexes)
+
+    return ticks
+
+
+def main():
+    """ the main handler function for this script. """
+
+    argparser = ArgumentParser()
+    argparser.add_argument("--nodes", type=int, default=20)
+    argparser.add_argument("--chunks", type=int, default=200)
+    args = argparser.parse_args()
+
+    nodes = ["user{}".format(i) for i in range(args.nodes)]
+
+    unicast = simulate_unicast(nodes, args.chunks)
+    swarm = simulate_swarm(nodes, args.chunks)
+
+    print("nodes: {} chunks: {}".format(args.nodes, args.chunks))
+    print("sequential unicast: {} ticks".format(unicast))
+    print("swarm: {} ticks".format(swarm))
+    print("speedup: {:.1f}x".format(unicast / swarm))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,157 @@
+"""
+
+simulate check_net_topo frames going through networks of growing size, with
+hashed_ipcaches and with topology digests.
+
+every node has an ipcache of its contacts, and --stale of them have the wrong ip:port for
+one of their contacts. a check starts at a random node and goes through the network like
+the surface passes it on: every node handles the first copy it gets (the duplicate filter
+drops the rest), checks its hashed ipcache against what the frame carries, adds it, and
+passes the frame on to every contact it hasn't been through, one after the other. with
+digests every contact answers with the digest as they left it, which is checked against
+and added in. this shows how big the payload is on every hop, how big the answers are,
+how many nodes the frame reached, and whether the stale entries are found, for each
+network size. on big networks the custody chain fills up along the long depth first path
+and the frame misses some nodes either way, and with them the stale entries they hold.
+
+usage: python scripts/topology_simulation.py --sizes 100 300 1000 3000 --degree 8
+
+"""
+
+from argparse import ArgumentParser
+import json
+import random
+import sys
+
+from pckr.frame import CustodyChain, TopologyDigest
+from pckr.utilities import str2hashed_hexstr
+from utils import make_network
+
+
+def make_hashed_ipcaches(network: dict, stale: int, rng: random.Random) -> tuple:
+    """
+    return every node's hashed ipcache, and the hashed usernames that someone has a stale ip:port for.
+    """
+
+    addresses = {u: dict(ip="10.0.{}.{}".format(n // 250, n % 250), port=8000) for n, u in enumerate(network)}
+    hashed_ipcaches = dict()
+    for u, contacts in network.items():
+        hashed_ipcaches[u] = {
+            str2hashed_hexstr(c): str2hashed_hexstr(json.dumps(addresses[c])) for c in contacts
+        }
+
+    damaged = set()
+    for u in rng.sample(sorted(network.keys()), stale):
+        c = rng.choice(network[u])
+        hashed_ipcaches[u][str2hashed_hexstr(c)] = str2hashed_hexstr(json.dumps(dict(ip="10.9.9.9", port=9000)))
+        damaged.add(str2hashed_hexstr(c))
+
+    return hashed_ipcaches, damaged
+
+
+def simulate_check(network: dict, hashed_ipcaches: dict, origin: str, use_digest: bool, capacity: int) -> dict:
+    """
+    send one check_net_topo frame out from origin.
+
+    Returns
+    -------
+    dict
+        the payload bytes on every hop, the bytes sent back, and the hashed usernames
+        reported as damaged
+    """
+
+    hashed = {u: str2hashed_hexstr(u) for u in network.keys()}
+    handled = set()
+    payloads = []
+    responses = []
+    reported = set()
+
+    def size(chain, carried):
+        if use_digest:
+            return len(json.dumps(dict(custody_chain=chain.to_payload(), digest=carried.to_payload(), origin_id="0" * 32)))
+        return len(json.dumps(dict(custody_chain=chain.to_payload(), hashed_ipcaches=carried, origin_id="0" * 32)))
+
+    # the surface passes the frame on before it answers, so the frame goes depth first
+    def handle(node, chain, carried):
+        if node in handled:
+            return None
+        handled.add(node)
+
+        chain = chain.copy()
+        chain.add(node)
+
+        if use_digest:
+            carried = TopologyDigest.from_payload(carried.to_payload())
+            for k, v in hashed_ipcaches[node].items():
+                if carried.conflicts(k, v):
+                    reported.add(k)
+                else:
+                    carried.add(k, v)
+        else:
+            carried = dict(carried)
+            for k, v in hashed_ipcaches[node].items():
+                if k in carried and carried[k] != v:
+                    reported.add(k)
+                else:
+                    carried[k] = v
+
+        for contact in network[node]:
+            if hashed[contact] not in chain:
+                payloads.append(size(chain, carried))
+                returned = handle(contact, chain, carried)
+
+                if use_digest and returned is not None:
+                    responses.append(len(json.dumps(dict(success=True, digest=returned.to_payload()))))
+                    for k, v in hashed_ipcaches[node].items():
+                        if returned.conflicts(k, v):
+                            reported.add(k)
+                    carried.union(returned)
+
+        return carried
+
+    handle(origin, CustodyChain(), TopologyDigest.for_capacity(capacity) if use_digest else dict())
+
+    return dict(payloads=payloads, responses=responses, reported=reported, reached=len(handled))
+
+
+def main():
+    """ the main handler function for this script. """
+
+    argparser = ArgumentParser()
+    argparser.add_argument("--sizes", type=int, nargs='+', default=[100, 300, 1000, 3000])
+    argparser.add_argument("--degree", type=int, default=8)
+    argparser.add_argument("--stale", type=int, default=10)
+    argparser.add_argument("--capacity", type=int, default=TopologyDigest.capacity)
+    argparser.add_argument("--seed", type=int, default=0)
+    args = argparser.parse_args()
+
+    # every hop is a call inside the one before it, like the frames are
+    sys.setrecursionlimit(10 * max(args.sizes) + 1000)
+
+    print("degree: {} stale entries: {} digest first layer capacity: {}".format(args.degree, args.stale, args.capacity))
+    print("{:<8}{:<18}{:>12}{:>12}{:>14}{:>10}{:>10}{:>10}".format(
+        "nodes", "", "avg bytes", "max bytes", "bytes back", "reached", "found", "wrong"
+    ))
+
+    for size in args.sizes:
+        rng = random.Random(args.seed)
+        network = make_network(size, args.degree, rng)
+        hashed_ipcaches, damaged = make_hashed_ipcaches(network, args.stale, rng)
+        origin = rng.choice(sorted(network.keys()))
+
+        for name, use_digest in [("hashed_ipcaches", False), ("digest", True)]:
+            result = simulate_check(network, hashed_ipcaches, origin, use_digest, args.capacity)
+            print("{:<8}{:<18}{:>12.0f}{:>12}{:>14.0f}{:>10}{:>10}{:>10}".format(
+                size,
+                name,
+                sum(result['payloads']) / float(len(result['payloads'])),
+                max(result['payloads']),
+                sum(result['responses']) / float(max(len(result['responses']), 1)),
+                result['reached'],
+                "{}/{}".format(len(result['reported'] & damaged), len(damaged)),
+                len(result['reported'] - damaged)
+            ))
+
+
+if __name__ == '__main__':
+    main()
@@ -98,3 +98,36 @@ def aip(users, user1, user2, robustness=5):
         ])
 
     return True
+
+
+def make_network(nodes: int, degree: int, rng: random.Random) -> dict:
+    """
+    make a random network for the simulations, where everyone knows at least degree others.
+
+    Parameters
+    ----------
+    nodes: int
+        how many users there are
+
+    degree: int
+        how many contacts each of them picks, everyone they pick knows them back
+
+    rng: random.Random
+        where the random picks come from
+
+    Returns
+    -------
+    dict
+        every username mapped to a sorted list of their contacts
+    """
+
+    usernames = ["user{}".format(i) for i in range(nodes)]
+    contacts = {u: set() for u in usernames}
+    for u in usernames:
+        while len(contacts[u]) < degree:
+            v = rng.choice(usernames)
+            if v != u:
+                contacts[u].add(v)
+                contacts[v].add(u)
+
+    return {u: sorted(c) for u, c in contacts.items()}
@@ -0,0 +1,69 @@
+""" tests for the bloom filters and custody chains that frames carry. """
+
+import unittest
+
+from pckr.frame import BloomFilter, CustodyChain
+from pckr.utilities import str2hashed_hexstr
+
+
+class BloomFilterTest(unittest.TestCase):
+
+    def test_payload_round_trip(self):
+        bloom = BloomFilter.for_capacity(100, 0.01)
+        hashed = [str2hashed_hexstr("user {}".format(i)) for i in range(100)]
+        for h in hashed:
+            bloom.add_hashed(h)
+
+        returned = BloomFilter.from_payload(bloom.to_payload())
+
+        self.assertEqual((returned.bits, returned.hashes, returned.filter), (bloom.bits, bloom.hashes, bloom.filter))
+        self.assertTrue(all(h in returned for h in hashed))
+
+    def test_bad_payloads_are_refused(self):
+        good = BloomFilter().to_payload()
+        for changes in [
+            dict(m=0),
+            dict(m=-1024),
+            dict(m=BloomFilter.max_bits * 2),
+            dict(m="1024"),
+            dict(m=1022),
+            dict(k=0),
+            dict(k=BloomFilter.max_hashes + 1),
+            dict(k=7.0),
+            dict(filter=good['filter'][:-2]),
+            dict(filter=good['filter'] + "00"),
+            dict(filter="z" * len(good['filter'])),
+            dict(filter=None),
+            dict(v=2)
+        ]:
+            with self.assertRaises(AssertionError):
+                BloomFilter.from_payload(dict(good, **changes))
+
+
+class CustodyChainTest(unittest.TestCase):
+
+    def test_payload_round_trip(self):
+        chain = CustodyChain.for_capacity(8, 0.001)
+        for username in ["a", "b", "c"]:
+            chain.add(username)
+
+        returned = CustodyChain.from_payload(chain.to_payload())
+
+        self.assertEqual(returned.to_payload(), chain.to_payload())
+        self.assertEqual(len(returned), 3)
+        self.assertIn(str2hashed_hexstr("b"), returned)
+
+    def test_legacy_lists(self):
+        returned = CustodyChain.from_payload([str2hashed_hexstr("a"), str2hashed_hexstr("b")])
+
+        self.assertEqual(returned.hops, 2)
+        self.assertIn(str2hashed_hexstr("a"), returned)
+
+    def test_bad_hops_are_refused(self):
+        for hops in [-1, "2", None]:
+            with self.assertRaises(AssertionError):
+                CustodyChain.from_payload(dict(CustodyChain().to_payload(), hops=hops))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+""" tests for cutting contents into content-defined chunks. """
+
+import random
+import unittest
+
+from pckr.utilities import chunk_contents
+
+
+class ChunkContentsTest(unittest.TestCase):
+
+    def assert_covers(self, contents, chunks):
+        self.assertEqual(chunks[0][0], 0)
+        for (offset, length), (next_offset, _) in zip(chunks, chunks[1:]):
+            self.assertEqual(offset + length, next_offset)
+        self.assertEqual(sum(length for _, length in chunks), len(contents))
+
+    def resent(self, contents, edited, **kwargs):
+        had = set(contents[o:o + n] for o, n in chunk_contents(contents, **kwargs))
+        return sum(n for o, n in chunk_contents(edited, **kwargs) if edited[o:o + n] not in had)
+
+    def test_chunks_cover_the_contents(self):
+        contents = random.Random(0).randbytes(200000)
+        chunks = chunk_contents(contents)
+
+        self.assert_covers(contents, chunks)
+        self.assertEqual(chunk_contents(contents), chunks)
+        self.assertEqual(chunk_contents(b""), [])
+
+    def test_edits_only_change_the_chunks_around_them(self):
+        rng = random.Random(1)
+        contents = rng.randbytes(200000)
+        edited = contents[:1000] + b"inserted" + contents[1000:]
+
+        self.assertLess(self.resent(contents, edited), 70000)
+
+    def test_big_contents_are_still_content_defined(self):
+        rng = random.Random(2)
+        contents = rng.randbytes(250000)
+        edited = contents[:1000] + rng.randbytes(20000) + contents[1000:]
+        limit = 150000
+
+        # both are past limit, so they get chunks twice as long
+        chunks = chunk_contents(contents, limit=limit)
+        self.assert_covers(contents, chunks)
+        self.assertLess(len(chunks), len(chunk_contents(contents, limit=None)))
+        self.assertLess(self.resent(contents, edited, limit=limit), 100000)
+
+
+if __name__ == '__main__':
+    unittest.main()
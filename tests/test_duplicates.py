@@ -0,0 +1,49 @@
+""" tests for the filter that drops gossip frames a user has already seen. """
+
+import time
+import unittest
+
+from pckr.frame import DuplicateFilter
+
+
+class DuplicateFilterTest(unittest.TestCase):
+
+    def test_copies_are_dropped(self):
+        duplicates = DuplicateFilter()
+
+        self.assertFalse(duplicates.check("a"))
+        self.assertTrue(duplicates.check("a"))
+        self.assertFalse(duplicates.check("b"))
+        self.assertIn("a", duplicates)
+        self.assertNotIn("c", duplicates)
+        self.assertEqual(duplicates.stats['dropped'], 1)
+
+    def test_copies_that_came_fewer_hops_are_not(self):
+        duplicates = DuplicateFilter()
+
+        self.assertFalse(duplicates.check("a", hops=4))
+        self.assertTrue(duplicates.check("a", hops=4))
+        self.assertFalse(duplicates.check("a", hops=2))
+        self.assertTrue(duplicates.check("a", hops=3))
+        self.assertTrue(duplicates.check("a"))
+        self.assertEqual(duplicates.stats['shorter'], 1)
+
+    def test_origin_ids_are_forgotten(self):
+        duplicates = DuplicateFilter(ttl=0.05, max_entries=2)
+
+        for origin_id in ["a", "b", "c"]:
+            duplicates.check(origin_id)
+        self.assertNotIn("a", duplicates)
+        self.assertEqual(duplicates.stats['evicted'], 1)
+
+        time.sleep(0.1)
+        self.assertFalse(duplicates.check("b"))
+        self.assertEqual(duplicates.stats['expired'], 2)
+
+    def test_one_filter_per_user(self):
+        self.assertIs(DuplicateFilter.for_user("alice"), DuplicateFilter.for_user("alice"))
+        self.assertIsNot(DuplicateFilter.for_user("alice"), DuplicateFilter.for_user("bob"))
+
+
+if __name__ == '__main__':
+    unittest.main()
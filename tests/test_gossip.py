@@ -0,0 +1,36 @@
+""" tests for the gossip policies that seek_user frames carry. """
+
+import random
+import unittest
+
+from pckr.frame import GossipPolicy
+
+
+class GossipPolicyTest(unittest.TestCase):
+
+    def test_payload_round_trip(self):
+        policy = GossipPolicy(fanout=2, ttl=5, probability=0.5, select='rtt')
+        returned = GossipPolicy.from_payload(policy.to_payload())
+
+        self.assertEqual(returned.to_payload(), policy.to_payload())
+        self.assertIsNone(GossipPolicy.from_payload(None))
+
+    def test_received_policies_are_clamped(self):
+        policy = GossipPolicy.from_payload(dict(fanout=1000, ttl=1000, probability=1.0, select='random'))
+
+        self.assertEqual(policy.fanout, GossipPolicy.max_fanout)
+        self.assertEqual(policy.ttl, GossipPolicy.max_ttl)
+        self.assertEqual(len(policy.choose(range(100), rng=random.Random(0))), GossipPolicy.max_fanout)
+
+    def test_bad_policies_are_refused(self):
+        for payload in [
+            dict(fanout=0, ttl=5, probability=1.0, select='random'),
+            dict(fanout=3, ttl=5, probability=2.0, select='random'),
+            dict(fanout=3, ttl=5, probability=1.0, select='everyone')
+        ]:
+            with self.assertRaises(AssertionError):
+                GossipPolicy.from_payload(payload)
+
+
+if __name__ == '__main__':
+    unittest.main()
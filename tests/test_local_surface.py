@@ -0,0 +1,43 @@
+""" tests for handing frames to surfaces in the same process. """
+
+import threading
+import unittest
+
+from pckr.utilities import LocalSurface
+
+
+class LocalSurfaceTest(unittest.TestCase):
+
+    def test_frames_are_handled_on_the_surfaces_threads(self):
+        local = LocalSurface(lambda request: dict(success=True, thread=threading.current_thread().name))
+
+        responses = [local.send(dict(action='ping')) for _ in range(3)]
+
+        self.assertTrue(all(r['success'] for r in responses))
+        self.assertNotIn(threading.current_thread().name, [r['thread'] for r in responses])
+        self.assertEqual(len(set(r['thread'] for r in responses)), 1)
+
+    def test_handlers_can_wait_on_each_other(self):
+        surfaces = dict()
+
+        # every frame is passed back and forth between two surfaces until depth runs out
+        def dispatch(name):
+            def handle(request):
+                if request['depth'] == 0:
+                    return dict(success=True, depth=0)
+                response = surfaces['b' if name == 'a' else 'a'].send(dict(depth=request['depth'] - 1))
+                return dict(success=True, depth=response['depth'] + 1)
+            return handle
+
+        surfaces.update(a=LocalSurface(dispatch('a')), b=LocalSurface(dispatch('b')))
+
+        self.assertEqual(surfaces['a'].send(dict(depth=50))['depth'], 50)
+
+    def test_errors_come_back_as_responses(self):
+        local = LocalSurface(lambda request: 1 / 0)
+
+        self.assertFalse(local.send(dict(action='ping'))['success'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+""" tests for where the files of messages end up on disk. """
+
+import os
+import shutil
+import tempfile
+import unittest
+import uuid
+
+from pckr.user import User
+from pckr.utilities import str2hashed_hexstr
+
+
+class MessageFilesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.user = User("alice")
+        self.user._path = os.path.join(self.directory, "alice")
+        self.user.init_directory_structure()
+
+        self.outside = os.path.join(self.directory, "outside")
+        os.makedirs(self.outside)
+        with open(os.path.join(self.outside, "victim.txt"), "wb") as f:
+            f.write(b"not yours")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def key(self, **kwargs):
+        content = b"hello"
+        key = dict(
+            message_id=str(uuid.uuid4()),
+            filename="hello.txt",
+            length=len(content),
+            chunks=[dict(offset=0, length=len(content), hash=str2hashed_hexstr(content))]
+        )
+        key.update(kwargs)
+        return key
+
+    def assert_inside_messages(self, files):
+        for path, _, _ in files:
+            self.assertTrue(os.path.abspath(path).startswith(self.user.messages_path + os.sep))
+
+    def test_received_root_is_ignored(self):
+        key = self.key(
+            root=self.outside,
+            packed=True,
+            files=[dict(filename="victim.txt", offset=0, length=5)]
+        )
+
+        self.assert_inside_messages(self.user.message_files(key))
+
+        self.user.prepare_message(key)
+        self.assertNotIn('root', self.user.get_message_key(key['message_id']))
+        self.assertEqual(open(os.path.join(self.outside, "victim.txt"), "rb").read(), b"not yours")
+
+    def test_filenames_stay_in_the_message(self):
+        key = self.key(
+            packed=True,
+            files=[
+                dict(filename="../../outside/victim.txt", offset=0, length=2),
+                dict(filename="/etc/passwd", offset=2, length=3)
+            ]
+        )
+
+        files = self.user.message_files(key)
+        self.assert_inside_messages(files)
+        for path, _, _ in files:
+            self.assertTrue(path.startswith(os.path.join(self.user.messages_path, key['message_id'])))
+
+        unpacked = self.key(filename="../../outside/victim.txt")
+        self.assertEqual(
+            self.user.message_files(unpacked)[0][0],
+            os.path.join(self.user.messages_path, unpacked['message_id'], "victim.txt")
+        )
+
+    def test_bad_message_ids_are_refused(self):
+        for message_id in ["../../outside", "..", "", "a/b", None, 5]:
+            with self.assertRaises(AssertionError):
+                self.user.message_file_path(message_id, "hello.txt")
+            with self.assertRaises(AssertionError):
+                self.user.prepare_message(self.key(message_id=message_id))
+            self.assertIsNone(self.user.get_message_key(message_id))
+            self.assertIsNone(self.user.get_message_seed(message_id))
+
+        self.assertIsNotNone(self.user.message_file_path(uuid.uuid4().hex, "hello.txt"))
+
+    def test_seeds_are_read_from_their_root(self):
+        content = open(os.path.join(self.outside, "victim.txt"), "rb").read()
+        seed = dict(
+            message_id=str(uuid.uuid4()),
+            password="password",
+            root=self.outside,
+            files=[dict(filename="victim.txt", offset=0, length=len(content))],
+            chunks=[dict(offset=0, length=len(content), hash=str2hashed_hexstr(content))]
+        )
+        self.user.store_message_seed(seed)
+
+        self.assertEqual(self.user.read_message_chunk(seed['message_id'], 0), content)
+        self.assertEqual(self.user.held_message_chunks(seed['message_id']), [0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+""" tests for the sketches and summaries that measuring pulse_network answers carry. """
+
+import unittest
+
+from pckr.frame import DistinctCounter, PulseSummary
+from pckr.utilities import str2hashed_hexstr
+
+
+class DistinctCounterTest(unittest.TestCase):
+
+    def test_payload_round_trip(self):
+        counter = DistinctCounter()
+        for i in range(1000):
+            counter.add_hashed(str2hashed_hexstr("user{}".format(i)))
+
+        returned = DistinctCounter.from_payload(counter.to_payload())
+
+        self.assertEqual(returned.registers, counter.registers)
+        self.assertLess(abs(len(returned) - 1000), 200)
+
+    def test_union_counts_everyone_once(self):
+        a = DistinctCounter()
+        b = DistinctCounter()
+        for i in range(300):
+            a.add_hashed(str2hashed_hexstr("user{}".format(i)))
+            b.add_hashed(str2hashed_hexstr("user{}".format(i + 100)))
+
+        a.union(b)
+        self.assertLess(abs(len(a) - 400), 80)
+
+    def test_bad_payloads_are_refused(self):
+        good = DistinctCounter().to_payload()
+        for changes in [
+            dict(p=0),
+            dict(p=DistinctCounter.max_precision + 1),
+            dict(p="8"),
+            dict(registers=good['registers'][:-2]),
+            dict(registers="zz" * 256),
+            dict(v=2)
+        ]:
+            with self.assertRaises(AssertionError):
+                DistinctCounter.from_payload(dict(good, **changes))
+
+
+class PulseSummaryTest(unittest.TestCase):
+
+    def summary(self):
+        summary = PulseSummary(max_hops=3)
+        for i in range(20):
+            summary.add_user(str2hashed_hexstr("user{}".format(i)), i % 4)
+            summary.add_rtt(str2hashed_hexstr("user{}".format(i)), str2hashed_hexstr("user{}".format(i + 1)), 0.001 * i)
+        summary.frames = 40
+        return summary
+
+    def test_payload_round_trip(self):
+        summary = self.summary()
+        returned = PulseSummary.from_payload(summary.to_payload())
+
+        self.assertEqual(returned.to_payload(), summary.to_payload())
+        self.assertEqual(returned.estimate(), summary.estimate())
+        self.assertLess(abs(returned.estimate()['users'] - 20), 3)
+        self.assertEqual(returned.estimate()['eccentricity'], 3)
+
+    def test_bad_payloads_are_refused(self):
+        good = self.summary().to_payload()
+        for changes in [
+            dict(max_hops=-1),
+            dict(max_hops=PulseSummary.longest_max_hops + 1),
+            dict(frames=-1),
+            dict(rings=dict(good['rings'], **{"4": good['rings']["0"]})),
+            dict(rtts={"x": good['rings']["0"]}),
+            dict(rings=[])
+        ]:
+            with self.assertRaises(AssertionError):
+                PulseSummary.from_payload(dict(good, **changes))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,34 @@
+""" tests for the tags that let relays skip seek_user frames that aren't for them. """
+
+import unittest
+import uuid
+
+from pckr.utilities import recipient_tag, str2hashed_hexstr, RECIPIENT_TAG_BYTES
+
+
+class RecipientTagTest(unittest.TestCase):
+
+    def test_tags_are_ambiguous(self):
+        fingerprint = str2hashed_hexstr("recipient")
+        others = [str2hashed_hexstr("other {}".format(i)) for i in range(4096)]
+
+        nonce = uuid.uuid4().hex
+        tag = recipient_tag(fingerprint, nonce)
+        self.assertEqual(len(tag), RECIPIENT_TAG_BYTES * 2)
+
+        # about one key in 256 matches, so the recipient is one of many
+        matches = len([o for o in others if recipient_tag(o, nonce) == tag])
+        self.assertGreater(matches, 4)
+        self.assertLess(matches, 48)
+
+    def test_longer_tags_still_match(self):
+        fingerprint = str2hashed_hexstr("recipient")
+        nonce = uuid.uuid4().hex
+
+        tag = recipient_tag(fingerprint, nonce, length=4)
+        self.assertEqual(recipient_tag(fingerprint, nonce, length=len(tag) // 2), tag)
+        self.assertTrue(tag.startswith(recipient_tag(fingerprint, nonce)))
+
+
+if __name__ == '__main__':
+    unittest.main()
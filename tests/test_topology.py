@@ -0,0 +1,88 @@
+""" tests for the topology digests that check_net_topo frames carry. """
+
+import unittest
+
+from pckr.frame import TopologyDigest
+from pckr.utilities import str2hashed_hexstr
+
+
+def entry(i, port=8000):
+    return str2hashed_hexstr("user{}".format(i)), str2hashed_hexstr("10.0.0.{}:{}".format(i, port))
+
+
+class TopologyDigestTest(unittest.TestCase):
+
+    def test_payload_round_trip(self):
+        digest = TopologyDigest.for_capacity(64)
+        for i in range(50):
+            digest.add(*entry(i))
+
+        returned = TopologyDigest.from_payload(digest.to_payload())
+
+        self.assertEqual(returned.to_payload(), digest.to_payload())
+        self.assertEqual(type(digest.to_payload()['keys']), dict)
+
+    def test_conflicts(self):
+        digest = TopologyDigest.for_capacity(64)
+        for i in range(50):
+            digest.add(*entry(i))
+
+        self.assertFalse(digest.conflicts(*entry(3)))
+        self.assertTrue(digest.conflicts(*entry(3, port=9000)))
+        self.assertFalse(digest.conflicts(*entry(1000)))
+
+    def test_full_digests_grow(self):
+        digest = TopologyDigest.for_capacity(64)
+        for i in range(1000):
+            digest.add(*entry(i))
+
+        self.assertGreater(len(digest.keys), 1)
+        self.assertFalse(digest.overfull)
+        self.assertTrue(all(digest.conflicts(*entry(i, port=9000)) for i in range(0, 1000, 50)))
+
+        returned = TopologyDigest.from_payload(digest.to_payload())
+        self.assertEqual(returned.to_payload(), digest.to_payload())
+
+        # repeats don't fill it up any further
+        layers = len(digest.keys)
+        for i in range(1000):
+            digest.add(*entry(i))
+        self.assertEqual(len(digest.keys), layers)
+
+    def test_union_takes_the_layers_the_other_started(self):
+        digest = TopologyDigest.for_capacity(64)
+        other = TopologyDigest.from_payload(digest.to_payload())
+        for i in range(500):
+            other.add(*entry(i))
+
+        digest.union(other)
+
+        self.assertEqual(digest.to_payload(), other.to_payload())
+
+    def test_bad_payloads_are_refused(self):
+        digest = TopologyDigest.for_capacity(64)
+        for i in range(500):
+            digest.add(*entry(i))
+        payload = digest.to_payload()
+
+        for changes in [
+            dict(capacity=0),
+            dict(capacity=None),
+            dict(keys=payload['keys'] * TopologyDigest.max_layers),
+            dict(keys=[])
+        ]:
+            with self.assertRaises(AssertionError):
+                TopologyDigest.from_payload(dict(payload, **changes))
+
+    def test_older_digests(self):
+        digest = TopologyDigest.for_capacity(64)
+        digest.add(*entry(1))
+        payload = digest.to_payload()
+        del payload['capacity']
+
+        returned = TopologyDigest.from_payload(payload)
+        self.assertTrue(returned.conflicts(*entry(1, port=9000)))
+
+
+if __name__ == '__main__':
+    unittest.main()